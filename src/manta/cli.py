@@ -1,7 +1,10 @@
 from importlib.metadata import distribution
 from sys import argv
 
+import yaml
+
 from manta.manta import Manta
+from manta.uart import UARTInterface
 from manta.utils import *
 
 logo = f"""
@@ -45,6 +48,10 @@ Usage:
             Start a capture on the specified core, and save the results to a .vcd,
             .csv, or .v file at the provided path(s).
 
+    calibrate [config_file]
+            Find the largest chunk_size and stall_interval that work reliably
+            with the UART interface, and save them to the configuration file.
+
     ports
             List all available serial ports.
 
@@ -103,6 +110,38 @@ def capture(config_path, logic_analyzer_name, export_paths):
             warn(f"Unrecognized file type, skipping {path}.")
 
 
+def calibrate(config_path):
+    manta = Manta.from_config(config_path)
+
+    if not isinstance(manta.interface, UARTInterface):
+        raise ValueError("Only UART interfaces can be calibrated.")
+
+    chunk_size, stall_interval = manta.interface.calibrate()
+    print(f"chunk_size: {chunk_size}")
+
+    # The stall interval isn't used with flow control, so it isn't calibrated
+    if stall_interval is not None:
+        print(f"stall_interval: {stall_interval}")
+
+    # Update the existing configuration, rather than exporting Manta's, so
+    # that only the calibrated options are changed. Manta.from_config() only
+    # builds a UARTInterface from the "uart" section, so that's the section
+    # that's updated here. Keys are kept in the order they were written in,
+    # but PyYAML doesn't preserve comments, so those are lost.
+    with open(config_path, "r") as f:
+        config = yaml.safe_load(f)
+
+    uart_config = config.get("uart") or {}
+    uart_config["chunk_size"] = chunk_size
+    if stall_interval is not None:
+        uart_config["stall_interval"] = stall_interval
+
+    config["uart"] = uart_config
+
+    with open(config_path, "w") as f:
+        yaml.dump(config, f, default_flow_style=False, sort_keys=False)
+
+
 def ports():
     import serial.tools.list_ports
 
@@ -146,6 +185,11 @@ def main():
             wrong_args()
         capture(argv[2], argv[3], argv[4:])
 
+    elif argv[1] == "calibrate":
+        if len(argv) != 3:
+            wrong_args()
+        calibrate(argv[2])
+
     elif argv[1] == "ports":
         ports()
 
@@ -1,13 +1,154 @@
+import asyncio
+import hashlib
+import json
+import os
 import socket
+import struct
+import time
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
 from random import getrandbits
 
 from amaranth import *
 from amaranth.hdl import IOPort
+from amaranth.lib.fifo import SyncFIFOBuffered
 
+from manta.ethernet.raw_port import UDPRawPort
 from manta.ethernet.sink_bridge import UDPSinkBridge
-from manta.ethernet.source_bridge import UDPSourceBridge
+from manta.ethernet.source_bridge import Opcodes, UDPSourceBridge
+from manta.io_core import IOCore
 from manta.utils import *
 
+# The opcodes of requests that the FPGA responds to with data
+_READ_OPCODES = (Opcodes.READ, Opcodes.BURST_READ)
+
+# Every word sent to and from the FPGA is 32 bits, sent least significant byte
+# first
+_WORD = struct.Struct("<I")
+
+# The struct format of a single piece of data on the bus, for each bus width
+_DATA_FORMATS = {16: "H", 32: "I", 64: "Q"}
+
+
+class _RequestWindow:
+    """
+    Tracks the packets of requests sent to the FPGA that haven't been answered
+    yet, keeping up to `chunks_in_flight` packets of reads outstanding, or a
+    single packet of writes. Each packet is identified by its sequence number,
+    which the FPGA echoes back in its response, so responses may be matched to
+    requests in any order. Packets of writes are answered by just their
+    sequence number, which acknowledges that the writes were made.
+    """
+
+    def __init__(self, interface, chunks, kind):
+        self._interface = interface
+        self._chunks = chunks
+        self._kind = kind
+        self._responses = [None] * len(self._chunks)
+        self._next_chunk = 0
+
+        # Packets of writes are sent one at a time, so that a resent packet
+        # can never overwrite the data of a later one
+        if kind == "write":
+            self._max_in_flight = 1
+
+        else:
+            self._max_in_flight = interface._chunks_in_flight
+
+        # Maps the sequence number of each outstanding packet to the index of
+        # its chunk, the packet itself, and the number of times it's been resent
+        self._pending = {}
+
+        # The sequence numbers of outstanding packets whose last response was
+        # missing some of its data
+        self._short = set()
+
+    @property
+    def done(self):
+        return self._next_chunk == len(self._chunks) and not self._pending
+
+    @property
+    def datas(self):
+        return [d for response in self._responses for d in response]
+
+    def get_new_packets(self):
+        """
+        Return the packets of requests that can be sent without exceeding the
+        number of packets allowed in flight.
+        """
+        packets = []
+        while (
+            self._next_chunk < len(self._chunks)
+            and len(self._pending) < self._max_in_flight
+        ):
+            seq = self._interface._get_sequence_number()
+            chunk = self._chunks[self._next_chunk]
+            packet = self._interface._encode_requests(chunk, seq)
+
+            self._pending[seq] = (self._next_chunk, packet, 0)
+            self._next_chunk += 1
+            packets.append(packet)
+
+        return packets
+
+    def receive(self, packet):
+        """
+        Record the data in a response packet. Responses to packets that aren't
+        outstanding are ignored, as they're either duplicates of responses to
+        resent packets, or the acknowledgements of writes that weren't waited
+        on. Packets that the FPGA pushed to the host are set aside for
+        read_stream().
+
+        Responses that are missing some of their data are treated as lost, as
+        the FPGA drops words of its responses if it can't send them quickly
+        enough. Their packets stay outstanding, and are resent once the
+        timeout expires.
+        """
+        seq, datas = self._interface._decode_read_responses(packet)
+        if self._interface._stash_stream_packet(seq, datas):
+            return
+
+        if seq not in self._pending:
+            return
+
+        index, _, _ = self._pending[seq]
+        reads = [r for r in self._chunks[index] if r[0] in _READ_OPCODES]
+        if len(datas) != sum(len(addrs) for _, addrs, _ in reads):
+            self._short.add(seq)
+            return
+
+        del self._pending[seq]
+        self._short.discard(seq)
+        self._responses[index] = datas
+
+    def get_timed_out_packets(self):
+        """
+        Return the outstanding packets, which are resent after no complete
+        response arrives within the timeout. Reads have no side effects, and
+        since packets of writes are sent one at a time, a resent write never
+        lands after a later one. However, if only the acknowledgement of a
+        packet of writes was lost, the writes are made twice. Writing the same
+        data again is harmless for most registers, but it pulses registers
+        that act on each write a second time, such as the `strobe` register of
+        an IO Core or the `request_start` and `request_stop` registers of a
+        Logic Analyzer.
+        """
+        packets = []
+        for seq, (index, packet, retries) in self._pending.items():
+            if retries == self._interface._retries:
+                if seq in self._short:
+                    raise ValueError("Got less data than expected from FPGA.")
+
+                raise ValueError(
+                    f"Timed out waiting for {self._kind} responses from FPGA."
+                )
+
+            self._pending[seq] = (index, packet, retries + 1)
+            packets.append(packet)
+
+        self._interface._retransmit_counts[self._kind] += len(packets)
+        return packets
+
 
 class EthernetInterface(Elaboratable):
     """
@@ -15,8 +156,47 @@ class EthernetInterface(Elaboratable):
     machine and the FPGA.
     """
 
+    # Set in the trailer of packets that the FPGA pushes to the host without a
+    # request, in place of the sequence number. The rest of the trailer
+    # contains the first address of the data in the packet.
+    _STREAM_FLAG = 2**31
+
+    # The time to wait between checks of whether a core has finished pushing
+    # data to the host, when its packets can't be waited on directly, in
+    # seconds. This leaves the link free for other coroutines.
+    _POLL_INTERVAL = 0.01
+
+    # Options that only affect the host's side of the link, and so aren't
+    # passed to LiteEth
+    _HOST_OPTIONS = [
+        "host_ip_addr",
+        "recv_buffer_size",
+        "chunks_in_flight",
+        "mtu",
+        "compact_requests",
+        "timeout",
+        "retries",
+        "ack_writes",
+    ]
+
     def __init__(
-        self, phy, clk_freq, fpga_ip_addr, host_ip_addr, udp_port=2001, **kwargs
+        self,
+        phy,
+        clk_freq,
+        fpga_ip_addr,
+        host_ip_addr=None,
+        udp_port=2001,
+        recv_buffer_size=None,
+        chunks_in_flight=1,
+        response_buffer_packets=1,
+        mtu=1500,
+        compact_requests=False,
+        timeout=0.1,
+        retries=3,
+        ack_writes=True,
+        dhcp=True,
+        dhcp_status=False,
+        **kwargs,
     ):
         """
         This function is the main mechanism for configuring an Ethernet
@@ -36,11 +216,76 @@ class EthernetInterface(Elaboratable):
                 request was successful, or check your router for a list of
                 connected devices.
 
-            host_ip_addr (str): The IP address of the host machine, which the
-                FPGA will send packets back to.
+            host_ip_addr (Optional[str]): The IP address of the host machine
+                to send and receive packets from. The FPGA answers each packet
+                at whichever address and UDP port it came from, so this only
+                selects which of the host's network interfaces is used. If not
+                provided, the operating system chooses one.
 
             udp_port (Optional[int]): The UDP port to communicate over.
 
+            recv_buffer_size (Optional[int]): The size of the receive buffer
+                of the host's UDP socket, in bytes. If not provided, the
+                operating system's default is used. Increase this if responses
+                are being dropped by the host during large reads.
+
+            chunks_in_flight (Optional[int]): The number of packets of read
+                requests that may be sent to the FPGA before their responses
+                have been received. Defaults to 1, which waits for the
+                response to each packet before sending the next. Packets of
+                write requests are always sent one at a time, so that they're
+                applied in order even when some of them must be resent.
+                Must not exceed `response_buffer_packets`.
+
+            response_buffer_packets (Optional[int]): The number of packets of
+                responses that the FPGA can buffer while they wait to be sent.
+                Unlike `chunks_in_flight`, this sets the size of a FIFO on the
+                FPGA, so the FPGA must be rebuilt for a change to take effect.
+                It must be at least `chunks_in_flight`, as responses to burst
+                reads can be produced faster than they're sent. Defaults to 1.
+
+            mtu (Optional[int]): The largest IP packet that can be sent
+                between the host and the FPGA without being fragmented, in
+                bytes. Requests are packed into as few packets as possible
+                without exceeding this size. Values above 1500 require jumbo
+                frames to be enabled on the host's network interface and any
+                switches in between. Defaults to 1500.
+
+            compact_requests (Optional[bool]): Whether to send each request
+                to the FPGA as a single 32-bit word, instead of two. When
+                enabled, every request in a packet shares the opcode stored in
+                the packet's header, which nearly doubles the number of
+                requests that fit in each packet. Defaults to False.
+
+            timeout (Optional[float]): The time to wait for the response to a
+                packet of requests before it's resent, in seconds. Defaults to
+                0.1.
+
+            retries (Optional[int]): The number of times a packet of requests
+                is resent before giving up and raising an error. Defaults to 3.
+
+            ack_writes (Optional[bool]): Whether to wait for the FPGA to
+                acknowledge each packet of write requests, and resend any that
+                aren't acknowledged within the timeout. If disabled, all the
+                packets of writes are sent at once without waiting, which is
+                faster but won't notice if a packet of writes is lost. The
+                FPGA only buffers a single packet of requests, so packets can
+                be dropped under load when writing more than one packet's
+                worth of data. Defaults to True.
+
+            dhcp (Optional[bool]): Whether to include a DHCP engine in the
+                LiteEth core, which requests `fpga_ip_addr` from the network's
+                DHCP server shortly after power-on. The FPGA answers at
+                `fpga_ip_addr` either way, so this can be disabled on networks
+                without a DHCP server, which also makes the core smaller.
+                Defaults to True.
+
+            dhcp_status (Optional[bool]): Whether the status of the DHCP
+                engine can be read with `get_dhcp_status()`. The status is
+                kept in registers at the top of the address space, so
+                enabling this leaves slightly less address space for the
+                cores. Requires `dhcp`. Defaults to False.
+
             **kwargs: Any additional keyword arguments to this function will
                 be passed to the LiteEth RTL generator. Some examples are
                 provided below:
@@ -48,7 +293,8 @@ class EthernetInterface(Elaboratable):
                 - mac_address (int): A 48-bit integer representing the MAC
                     address the FPGA will assume. If not provided, an address
                     within the [Locally Administered, Administratively Assigned group](https://en.wikipedia.org/wiki/MAC_address#Ranges_of_group_and_locally_administered_addresses)
-                    will be randomly generated.
+                    will be derived from the rest of the configuration, so
+                    that it stays the same each time the FPGA is rebuilt.
 
                 - vendor (str): The vendor of your FPGA. Currently only values
                     of `xilinx` and `lattice` are supported. This is used to
@@ -68,11 +314,42 @@ class EthernetInterface(Elaboratable):
         self._fpga_ip_addr = fpga_ip_addr
         self._host_ip_addr = host_ip_addr
         self._udp_port = udp_port
+        self._recv_buffer_size = recv_buffer_size
+        self._chunks_in_flight = chunks_in_flight
+        self._response_buffer_packets = response_buffer_packets
+        self._mtu = mtu
+        self._compact_requests = compact_requests
+        self._timeout = timeout
+        self._retries = retries
+        self._ack_writes = ack_writes
+        self._dhcp = dhcp
+        self._dhcp_status = dhcp_status
         self._phy = phy
         self._clk_freq = float(clk_freq)
         self._additional_config = kwargs
         self._check_config()
 
+        # The UDP socket used to communicate with the FPGA, which is opened on
+        # the first read or write and reused until close() is called
+        self._socket = None
+
+        # Responses are received into this buffer, and decoded in place
+        self._recv_buffer = bytearray(self._get_max_response_size())
+
+        # Packets pushed to the host by the FPGA that were received while
+        # waiting for something else, which are kept for read_stream()
+        self._stream_packets = []
+
+        # The sequence number of the next packet sent to the FPGA. This starts
+        # at a random value so that responses to packets sent by a previous
+        # process aren't mistaken for responses to this one's.
+        self._sequence_number = getrandbits(16)
+
+        # The number of packets of reads and writes that have been resent
+        self._retransmit_counts = {"read": 0, "write": 0}
+
+        self._bus_width = 16
+        self._bus_addr_width = 16
         self.bus_i = Signal(InternalBus())
         self.bus_o = Signal(InternalBus())
 
@@ -83,15 +360,80 @@ class EthernetInterface(Elaboratable):
         self._dhcp_start = Signal()
         self._dhcp_timer = Signal(range(clk_freq_rounded + 1), init=clk_freq_rounded)
 
-        self._source_data = Signal(32)
-        self._source_last = Signal()
-        self._source_ready = Signal()
-        self._source_valid = Signal()
+        # The status of the DHCP engine can be made readable from the host,
+        # through registers at the top of the address space
+        self._dhcp_done = Signal(name="dhcp_done")
+        self._dhcp_ip_address = Signal(32, name="dhcp_ip_address")
+        self._registers = None
+
+        if self._dhcp_status:
+            self._define_registers()
+
+        # The data that cores push to the host without being asked, which is
+        # set by Manta before elaboration
+        self._stream_sources = []
+
+    def _define_registers(self):
+        """
+        Define the registers used by the interface itself, which contain the
+        status of the DHCP engine. These are read through an IOCore placed at
+        the top of the address space.
+        """
+        self._registers = IOCore(inputs=[self._dhcp_done, self._dhcp_ip_address])
+        self._registers.bus_width = self._bus_width
+        self._registers.bus_addr_width = self._bus_addr_width
+        self._registers.interface = self
+
+        # Accessing max_addr builds the memory map at the current base_addr
+        self._registers.base_addr = 0
+        self._base_addr = (2**self._bus_addr_width) - (self._registers.max_addr + 1)
+        self._registers.base_addr = self._base_addr
+        _ = self._registers.max_addr
+
+    @property
+    def base_addr(self):
+        """
+        Return the lowest address used by the interface's own registers. Cores
+        must be placed below this address.
+        """
+        if self._registers is None:
+            return 2**self._bus_addr_width
+
+        return self._base_addr
+
+    @property
+    def bus_width(self):
+        """
+        Return the number of bits of data carried by each bus transaction.
+        """
+        return self._bus_width
+
+    @bus_width.setter
+    def bus_width(self, value):
+        self._bus_width = value
+        self._define_bus()
 
-        self._sink_data = Signal(32)
-        self._sink_last = Signal()
-        self._sink_ready = Signal()
-        self._sink_valid = Signal()
+    @property
+    def bus_addr_width(self):
+        """
+        Return the number of bits in each bus address.
+        """
+        return self._bus_addr_width
+
+    @bus_addr_width.setter
+    def bus_addr_width(self, value):
+        self._bus_addr_width = value
+        self._define_bus()
+
+    def _define_bus(self):
+        # The bus connections and the interface's registers are remade whenever
+        # the bus changes shape
+        layout = InternalBus(self._bus_width, self._bus_addr_width)
+        self.bus_i = Signal(layout)
+        self.bus_o = Signal(layout)
+
+        if self._registers is not None:
+            self._define_registers()
 
     def _check_config(self):
         # Make sure UDP port is an integer in the range 0-65535
@@ -103,18 +445,84 @@ class EthernetInterface(Elaboratable):
         if not 0 <= self._udp_port <= 65535:
             raise ValueError("UDP Port must be between 0 and 65535.")
 
-        # Make sure Host IP address is four bytes separated by a period
-        if not isinstance(self._host_ip_addr, str):
-            raise TypeError(
-                "Host IP must be specified as a string in the form 'xxx.xxx.xxx.xxx'."
+        # Make sure the receive buffer size is a positive integer, if provided
+        if self._recv_buffer_size is not None:
+            if not isinstance(self._recv_buffer_size, int):
+                raise TypeError("Receive buffer size must be an integer.")
+
+            if self._recv_buffer_size <= 0:
+                raise ValueError("Receive buffer size must be positive.")
+
+        # Make sure chunks_in_flight is a positive integer
+        if not isinstance(self._chunks_in_flight, int):
+            raise TypeError("Number of chunks in flight must be an integer.")
+
+        if self._chunks_in_flight < 1:
+            raise ValueError("Number of chunks in flight must be at least 1.")
+
+        # Make sure the FPGA can buffer the responses to every chunk in flight
+        if not isinstance(self._response_buffer_packets, int):
+            raise TypeError("Number of response buffer packets must be an integer.")
+
+        if self._response_buffer_packets < 1:
+            raise ValueError("Number of response buffer packets must be at least 1.")
+
+        if self._chunks_in_flight > self._response_buffer_packets:
+            raise ValueError(
+                "Number of chunks in flight must not exceed response_buffer_packets, "
+                "the number of packets of responses the FPGA is built to buffer."
             )
 
-        if len(self._host_ip_addr.split(".")) != 4:
-            raise ValueError("Host IP must be specified in the form 'xxx.xxx.xxx.xxx'.")
+        # Make sure the MTU is within the range supported by IPv4 and jumbo frames
+        if not isinstance(self._mtu, int):
+            raise TypeError("MTU must be an integer.")
 
-        for byte in self._host_ip_addr.split("."):
-            if not 0 <= int(byte) <= 255:
-                raise ValueError(f"Invalid byte in Host IP: {byte}")
+        if not 576 <= self._mtu <= 9000:
+            raise ValueError("MTU must be between 576 and 9000 bytes.")
+
+        if not isinstance(self._compact_requests, bool):
+            raise TypeError("compact_requests must be a boolean.")
+
+        # Make sure the timeout is positive, and the number of retries isn't
+        if not isinstance(self._timeout, (int, float)):
+            raise TypeError("Timeout must be a number of seconds.")
+
+        if self._timeout <= 0:
+            raise ValueError("Timeout must be positive.")
+
+        if not isinstance(self._retries, int):
+            raise TypeError("Number of retries must be an integer.")
+
+        if self._retries < 0:
+            raise ValueError("Number of retries must not be negative.")
+
+        if not isinstance(self._ack_writes, bool):
+            raise TypeError("ack_writes must be a boolean.")
+
+        if not isinstance(self._dhcp, bool):
+            raise TypeError("dhcp must be a boolean.")
+
+        if not isinstance(self._dhcp_status, bool):
+            raise TypeError("dhcp_status must be a boolean.")
+
+        if self._dhcp_status and not self._dhcp:
+            raise ValueError("dhcp_status requires dhcp to be enabled.")
+
+        # Make sure Host IP address is four bytes separated by a period
+        if self._host_ip_addr is not None:
+            if not isinstance(self._host_ip_addr, str):
+                raise TypeError(
+                    "Host IP must be specified as a string in the form 'xxx.xxx.xxx.xxx'."
+                )
+
+            if len(self._host_ip_addr.split(".")) != 4:
+                raise ValueError(
+                    "Host IP must be specified in the form 'xxx.xxx.xxx.xxx'."
+                )
+
+            for byte in self._host_ip_addr.split("."):
+                if not 0 <= int(byte) <= 255:
+                    raise ValueError(f"Invalid byte in Host IP: {byte}")
 
         # Make sure FPGA IP is four bytes separated by a period
         if not isinstance(self._fpga_ip_addr, str):
@@ -136,12 +544,44 @@ class EthernetInterface(Elaboratable):
     def to_config(self):
         config = {
             "fpga_ip_addr": self._fpga_ip_addr,
-            "host_ip_addr": self._host_ip_addr,
             "udp_port": self._udp_port,
             "phy": self._phy,
             "clk_freq": self._clk_freq,
         }
 
+        if self._host_ip_addr is not None:
+            config["host_ip_addr"] = self._host_ip_addr
+
+        if self._recv_buffer_size is not None:
+            config["recv_buffer_size"] = self._recv_buffer_size
+
+        if self._chunks_in_flight != 1:
+            config["chunks_in_flight"] = self._chunks_in_flight
+
+        if self._response_buffer_packets != 1:
+            config["response_buffer_packets"] = self._response_buffer_packets
+
+        if self._mtu != 1500:
+            config["mtu"] = self._mtu
+
+        if self._compact_requests:
+            config["compact_requests"] = True
+
+        if self._timeout != 0.1:
+            config["timeout"] = self._timeout
+
+        if self._retries != 3:
+            config["retries"] = self._retries
+
+        if not self._ack_writes:
+            config["ack_writes"] = False
+
+        if not self._dhcp:
+            config["dhcp"] = False
+
+        if self._dhcp_status:
+            config["dhcp_status"] = True
+
         return {**config, **self._additional_config}
 
     def get_top_level_ports(self):
@@ -155,6 +595,14 @@ class EthernetInterface(Elaboratable):
     def clock_freq(self):
         return self._clk_freq
 
+    def set_stream_sources(self, sources):
+        """
+        Set the data that cores may push to the host without a request. Each
+        source is a tuple of a signal that's pulsed when the data is ready, the
+        first bus address containing the data, and the number of addresses.
+        """
+        self._stream_sources = sources
+
     def _binarize_ip_addr(self, ip_addr):
         octets = [bin(int(o))[2:].zfill(8) for o in ip_addr.split(".")]
         return int("".join(octets), 2)
@@ -477,10 +925,27 @@ class EthernetInterface(Elaboratable):
 
         # In my limited testing this seems to be enough time.
 
-        with m.If(self._dhcp_timer < 0):
-            m.d.sync += self._dhcp_timer.eq(self._dhcp_timer - 1)
-
-        m.d.sync += self._dhcp_start.eq(self._dhcp_timer == 1)
+        dhcp_ports = []
+        if self._dhcp:
+            with m.If(self._dhcp_timer > 0):
+                m.d.sync += self._dhcp_timer.eq(self._dhcp_timer - 1)
+
+            m.d.sync += self._dhcp_start.eq(self._dhcp_timer == 1)
+
+            dhcp_ports = [
+                ("o", "dhcp_done", self._dhcp_done),
+                ("o", "dhcp_ip_address", self._dhcp_ip_address),
+                ("i", "dhcp_start", self._dhcp_start),
+                # ("o", "dhcp_timeout", 1),
+            ]
+
+        # Requests are received and answered through a raw UDP port, which
+        # provides the IP address and UDP port of the host that sent each one
+        m.submodules.raw_port = raw_port = UDPRawPort(
+            udp_port=self._udp_port,
+            rx_depth=self._get_fifo_depth(),
+            tx_depth=self._get_fifo_depth() * self._response_buffer_packets,
+        )
 
         # Add the LiteEth core as a submodule
         m.submodules.liteeth = Instance(
@@ -490,25 +955,26 @@ class EthernetInterface(Elaboratable):
             # PHY connection
             *self._phy_io,
             # DHCP
-            # ("o", "dhcp_done", 1),
-            # ("o", "dhcp_ip_address", 1),
-            ("i", "dhcp_start", self._dhcp_start),
-            # ("o", "dhcp_timeout", 1),
+            *dhcp_ports,
             ("i", "ip_address", self._binarize_ip_addr(self._fpga_ip_addr)),
-            # UDP Port
-            ("i", "udp0_udp_port", self._udp_port),
             # UDP from host
-            ("o", "udp0_source_data", self._source_data),
+            ("o", "udp0_source_ip_address", raw_port.source_ip_address_i),
+            ("o", "udp0_source_src_port", raw_port.source_src_port_i),
+            ("o", "udp0_source_data", raw_port.source_data_i),
             # ("o", "udp0_source_error", 1),
-            ("o", "udp0_source_last", self._source_last),
-            ("i", "udp0_source_ready", self._source_ready),
-            ("o", "udp0_source_valid", self._source_valid),
+            ("o", "udp0_source_last", raw_port.source_last_i),
+            ("i", "udp0_source_ready", raw_port.source_ready_o),
+            ("o", "udp0_source_valid", raw_port.source_valid_i),
             # UDP back to host
-            ("i", "udp0_ip_address", self._binarize_ip_addr(self._host_ip_addr)),
-            ("i", "udp0_sink_data", self._sink_data),
-            ("i", "udp0_sink_last", self._sink_last),
-            ("o", "udp0_sink_ready", self._sink_ready),
-            ("i", "udp0_sink_valid", self._sink_valid),
+            ("i", "udp0_sink_ip_address", raw_port.sink_ip_address_o),
+            ("i", "udp0_sink_src_port", raw_port.sink_src_port_o),
+            ("i", "udp0_sink_dst_port", raw_port.sink_dst_port_o),
+            ("i", "udp0_sink_length", raw_port.sink_length_o),
+            ("i", "udp0_sink_last_be", raw_port.sink_last_be_o),
+            ("i", "udp0_sink_data", raw_port.sink_data_o),
+            ("i", "udp0_sink_last", raw_port.sink_last_o),
+            ("o", "udp0_sink_ready", raw_port.sink_ready_i),
+            ("i", "udp0_sink_valid", raw_port.sink_valid_o),
         )
 
         # Add LiteEth module definition if we're in an Amaranth-native workflow
@@ -517,22 +983,80 @@ class EthernetInterface(Elaboratable):
         if platform:
             platform.add_file("liteeth.v", self.generate_liteeth_core())
 
-        m.submodules.source_bridge = source_bridge = UDPSourceBridge()
-        m.submodules.sink_bridge = sink_bridge = UDPSinkBridge()
+        m.submodules.source_bridge = source_bridge = UDPSourceBridge(
+            compact=self._compact_requests,
+            stream_packet_size=self._get_max_responses(),
+            data_width=self._bus_width,
+            addr_width=self._bus_addr_width,
+        )
+        m.submodules.sink_bridge = sink_bridge = UDPSinkBridge(
+            self._bus_width, self._bus_addr_width
+        )
+
+        m.d.comb += source_bridge.data_i.eq(raw_port.data_o)
+        m.d.comb += source_bridge.last_i.eq(raw_port.last_o)
+        m.d.comb += raw_port.ready_i.eq(source_bridge.ready_o)
+        m.d.comb += source_bridge.valid_i.eq(raw_port.valid_o)
+
+        m.d.comb += raw_port.data_i.eq(sink_bridge.data_o)
+        m.d.comb += raw_port.last_i.eq(sink_bridge.last_o)
+        m.d.comb += sink_bridge.ready_i.eq(raw_port.ready_o)
+        m.d.comb += raw_port.valid_i.eq(sink_bridge.valid_o)
 
-        m.d.comb += source_bridge.data_i.eq(self._source_data)
-        m.d.comb += source_bridge.last_i.eq(self._source_last)
-        m.d.comb += self._source_ready.eq(source_bridge.ready_o)
-        m.d.comb += source_bridge.valid_i.eq(self._source_valid)
+        # Internal Bus -> UDP, through the interface's registers if any
+        if self._registers is not None:
+            m.submodules.registers = self._registers
+            m.d.comb += self._registers.bus_i.eq(self.bus_i)
+            m.d.comb += sink_bridge.bus_i.eq(self._registers.bus_o)
 
-        m.d.comb += self._sink_data.eq(sink_bridge.data_o)
-        m.d.comb += self._sink_last.eq(sink_bridge.last_o)
-        m.d.comb += sink_bridge.ready_i.eq(self._sink_ready)
-        m.d.comb += self._sink_valid.eq(sink_bridge.valid_o)
+        else:
+            m.d.comb += sink_bridge.bus_i.eq(self.bus_i)
 
-        m.d.comb += sink_bridge.bus_i.eq(self.bus_i)
         m.d.comb += self.bus_o.eq(source_bridge.bus_o)
 
+        # The sequence number of each packet is echoed back once its requests
+        # have made it through the cores. The next packets may arrive in the
+        # meantime, so the sequence numbers are queued up until they're sent,
+        # along with the address and port of the host that sent each packet.
+        # Data pushed to the host goes to whichever host sent the last packet.
+        m.submodules.seq_fifo = seq_fifo = SyncFIFOBuffered(
+            width=32 + 32 + 16, depth=32
+        )
+        m.d.comb += seq_fifo.w_data.eq(
+            Cat(source_bridge.seq_o, raw_port.reply_ip_o, raw_port.reply_port_o)
+        )
+        m.d.comb += seq_fifo.w_en.eq(source_bridge.seq_valid_o)
+        m.d.comb += sink_bridge.seq_i.eq(seq_fifo.r_data[:32])
+        m.d.comb += sink_bridge.seq_valid_i.eq(seq_fifo.r_rdy)
+        m.d.comb += seq_fifo.r_en.eq(sink_bridge.seq_ready_o)
+
+        # The trailer is sent the cycle after it's taken from the queue, which
+        # is when the finished packet is handed to the raw port
+        with m.If(sink_bridge.seq_ready_o):
+            m.d.sync += raw_port.reply_ip_i.eq(seq_fifo.r_data[32:64])
+            m.d.sync += raw_port.reply_port_i.eq(seq_fifo.r_data[64:])
+
+        m.d.comb += source_bridge.trailer_sent_i.eq(sink_bridge.seq_ready_o)
+        m.d.comb += source_bridge.tx_idle_i.eq(raw_port.idle_o)
+
+        # Data pushed to the host by the cores is read out one source at a
+        # time, with the first source taking priority
+        sources = self._stream_sources
+        pending = [Signal(name=f"stream_pending_{i}") for i in range(len(sources))]
+
+        for i, (_, addr, n_addrs) in enumerate(sources):
+            with (m.If if i == 0 else m.Elif)(pending[i]):
+                m.d.comb += source_bridge.stream_addr_i.eq(addr)
+                m.d.comb += source_bridge.stream_count_i.eq(n_addrs)
+                m.d.comb += source_bridge.stream_valid_i.eq(1)
+
+                with m.If(source_bridge.stream_ready_o):
+                    m.d.sync += pending[i].eq(0)
+
+        for i, (request, _, _) in enumerate(sources):
+            with m.If(request):
+                m.d.sync += pending[i].eq(1)
+
         return m
 
     def read(self, addrs):
@@ -549,41 +1073,506 @@ class EthernetInterface(Elaboratable):
         if not all(isinstance(a, int) for a in addrs):
             raise TypeError("Read address must be an integer or list of integers.")
 
-        # Send read requests, and get responses
+        window = _RequestWindow(self, self._plan_read_packets(addrs), "read")
+        self._run_window(window)
+        return window.datas
+
+    def write(self, addrs, datas):
+        """
+        Write the provided data into the provided addresses in Manta's internal
+        memory. Addresses and data must be specified as either integers or a
+        list of integers.
+        """
+
+        # Handle a single integer address and data
+        if isinstance(addrs, int) and isinstance(datas, int):
+            return self.write([addrs], [datas])
+
+        if self._ack_writes:
+            chunks = self._plan_write_packets(addrs, datas)
+            self._run_window(_RequestWindow(self, chunks, "write"))
+            return
+
+        sock = self._get_socket()
+        for packet in self._get_write_packets(addrs, datas):
+            sock.sendto(packet, (self._fpga_ip_addr, self._udp_port))
+
+    def _run_window(self, window):
+        """
+        Send the packets of requests in a window while there's room for them,
+        and resend any that aren't answered before the timeout.
+        """
+        sock = self._get_socket()
+
+        while not window.done:
+            for packet in window.get_new_packets():
+                sock.sendto(packet, (self._fpga_ip_addr, self._udp_port))
+
+            try:
+                window.receive(self._receive(sock))
+
+            except socket.timeout:
+                for packet in window.get_timed_out_packets():
+                    sock.sendto(packet, (self._fpga_ip_addr, self._udp_port))
+
+    def get_dhcp_status(self):
+        """
+        Return the status of the FPGA's DHCP engine, as a tuple of whether
+        it's idle and the IP address it was last offered, as a string. The
+        engine is idle both before it starts and after it finishes, and the
+        address is 0.0.0.0 until an offer has been received.
+
+        Raises:
+            ValueError: The interface wasn't built with `dhcp_status` enabled.
+
+        """
+        if self._registers is None:
+            raise ValueError(
+                "Ethernet interface only has a DHCP status with dhcp_status enabled."
+            )
+
+        done = self._registers.get_probe(self._dhcp_done)
+        ip_address = self._registers.get_probe(self._dhcp_ip_address)
+        octets = [(ip_address >> (8 * i)) & 0xFF for i in reversed(range(4))]
+        return bool(done), ".".join(str(o) for o in octets)
+
+    def wait_for_link(self, timeout=10):
+        """
+        Wait until the FPGA responds to requests, which it does as soon as the
+        Ethernet link is up. This is much quicker than waiting for a fixed
+        amount of time after the FPGA is programmed.
+
+        Args:
+            timeout (Optional[float]): The time to wait before giving up, in
+                seconds. Defaults to 10.
+
+        Raises:
+            ValueError: The FPGA didn't respond within the timeout.
+
+        """
+        deadline = time.monotonic() + timeout
+
+        # Errors opening the socket come from the host's configuration, and
+        # won't go away by waiting
+        self._get_socket()
+
+        # Each request is only sent once, so that waiting for the response to
+        # it can't overrun the timeout by much
+        retries = self._retries
+        self._retries = 0
+
+        try:
+            while True:
+                try:
+                    self.read(0)
+                    return
+
+                # The host may not be able to reach the FPGA at all until the
+                # link is up, in which case sending fails straight away
+                except OSError:
+                    time.sleep(self._timeout)
+
+                except ValueError:
+                    pass
+
+                if time.monotonic() >= deadline:
+                    raise ValueError("Timed out waiting for FPGA to respond.")
+
+        finally:
+            self._retries = retries
+
+    def get_retransmit_counts(self):
+        """
+        Return the number of packets that were resent because no response
+        arrived within the timeout, as a tuple of the packets of reads and the
+        packets of writes resent since the interface was created. A steadily
+        rising count usually means `recv_buffer_size` should be increased, or
+        `chunks_in_flight` reduced.
+        """
+        return self._retransmit_counts["read"], self._retransmit_counts["write"]
+
+    def _get_socket(self):
+        """
+        Return the UDP socket used to communicate with the FPGA, opening and
+        binding one if it isn't already open. The FPGA sends its responses to
+        the address and port that each request came from, so the socket is
+        bound to a port chosen by the operating system, which lets any number
+        of interfaces share the FPGA at once.
+        """
+        if self._socket is not None:
+            return self._socket
+
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.bind((self._host_ip_addr, self._udp_port))
-        chunk_size = 64  # 128
-        addr_chunks = split_into_chunks(addrs, chunk_size)
-        datas = []
 
-        for addr_chunk in addr_chunks:
-            bytes_out = b""
-            for addr in addr_chunk:
-                bytes_out += int(0).to_bytes(4, byteorder="little")
-                bytes_out += int(addr).to_bytes(2, byteorder="little")
-                bytes_out += int(0).to_bytes(2, byteorder="little")
+        try:
+            if self._recv_buffer_size is not None:
+                sock.setsockopt(
+                    socket.SOL_SOCKET, socket.SO_RCVBUF, self._recv_buffer_size
+                )
 
-            sock.sendto(bytes_out, (self._fpga_ip_addr, self._udp_port))
-            data, addr = sock.recvfrom(4 * chunk_size)
+            sock.bind((self._host_ip_addr or "", 0))
+            sock.settimeout(self._timeout)
 
-            # Split into groups of four bytes
-            datas += [int.from_bytes(d, "little") for d in split_into_chunks(data, 4)]
+        except OSError:
+            sock.close()
+            raise
 
-        if len(datas) != len(addrs):
-            raise ValueError("Got less data than expected from FPGA.")
+        self._socket = sock
+        return self._socket
 
-        return datas
+    def _receive(self, sock):
+        """
+        Receive a packet from the FPGA into the interface's receive buffer,
+        and return a view of it. The view is only valid until the next packet
+        is received, so it must be decoded before then.
+        """
+        n_bytes = sock.recv_into(self._recv_buffer)
+        return memoryview(self._recv_buffer)[:n_bytes]
 
-    def write(self, addrs, datas):
+    def close(self):
+        """
+        Close the UDP socket used to communicate with the FPGA, releasing the
+        UDP port on the host. The socket is opened again by the next read or
+        write, so this only needs to be called when the interface is no
+        longer in use. The interface may also be used as a context manager,
+        which calls this method on exit.
+
+        Returns:
+            None
+        """
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get_async_lock(self):
+        """
+        Return the lock that keeps coroutines running on the current event
+        loop from using the UDP port at the same time.
+        """
+        loop = asyncio.get_running_loop()
+        if getattr(self, "_async_loop", None) is not loop:
+            self._async_loop = loop
+            self._async_lock = asyncio.Lock()
+
+        return self._async_lock
+
+    async def aread(self, addrs):
+        """
+        Read the data stored in a set of address on Manta's internal memory,
+        without blocking the event loop. This is the asynchronous counterpart
+        to read(), and takes the same arguments.
+
+        Responses are received by watching the interface's socket from the
+        running event loop, so any number of interfaces can be read from
+        concurrently on a single thread. On event loops that can't watch a
+        socket (such as the default event loop on Windows), the requests are
+        sent from the event loop's default executor instead.
+        """
+
+        # Handle a single integer address
+        if isinstance(addrs, int):
+            return (await self.aread([addrs]))[0]
+
+        # Make sure all list elements are integers
+        if not all(isinstance(a, int) for a in addrs):
+            raise TypeError("Read address must be an integer or list of integers.")
+
+        window = _RequestWindow(self, self._plan_read_packets(addrs), "read")
+        await self._arun_window(window)
+        return window.datas
+
+    async def _arun_window(self, window):
+        """
+        Send the packets of requests in a window without blocking the event
+        loop. This is the asynchronous counterpart to _run_window().
+        """
+        loop = asyncio.get_running_loop()
+        sock = self._get_socket()
+        responses = asyncio.Queue()
+
+        def on_readable():
+            responses.put_nowait(sock.recv(self._get_max_response_size()))
+
+        async with self._get_async_lock():
+            try:
+                loop.add_reader(sock.fileno(), on_readable)
+
+            except NotImplementedError:
+                return await loop.run_in_executor(None, self._run_window, window)
+
+            try:
+                while not window.done:
+                    for packet in window.get_new_packets():
+                        sock.sendto(packet, (self._fpga_ip_addr, self._udp_port))
+
+                    try:
+                        response = await asyncio.wait_for(
+                            responses.get(), self._timeout
+                        )
+                        window.receive(response)
+
+                    except asyncio.TimeoutError:
+                        for packet in window.get_timed_out_packets():
+                            sock.sendto(packet, (self._fpga_ip_addr, self._udp_port))
+
+            finally:
+                loop.remove_reader(sock.fileno())
+
+    async def awrite(self, addrs, datas):
         """
         Write the provided data into the provided addresses in Manta's internal
-        memory. Addresses and data must be specified as either integers or a
-        list of integers.
+        memory, without blocking the event loop. This is the asynchronous
+        counterpart to write(), and takes the same arguments.
         """
 
         # Handle a single integer address and data
         if isinstance(addrs, int) and isinstance(datas, int):
-            return self.write([addrs], [datas])
+            return await self.awrite([addrs], [datas])
+
+        if self._ack_writes:
+            chunks = self._plan_write_packets(addrs, datas)
+            await self._arun_window(_RequestWindow(self, chunks, "write"))
+            return
+
+        packets = self._get_write_packets(addrs, datas)
+
+        async with self._get_async_lock():
+            sock = self._get_socket()
+            for packet in packets:
+                sock.sendto(packet, (self._fpga_ip_addr, self._udp_port))
+
+    def read_stream(self, addr, n_addrs, is_complete):
+        """
+        Receive the data that the FPGA pushes to the host once a core has it
+        ready, such as the samples of a completed Logic Analyzer capture. Any
+        data that doesn't arrive is read from the FPGA instead.
+
+        Args:
+            addr (int): The first bus address of the data.
+
+            n_addrs (int): The number of consecutive addresses to receive.
+
+            is_complete (Callable[[], bool]): Returns whether the core has
+                pushed its data. This is polled whenever nothing arrives
+                within the timeout, so that data which was lost entirely is
+                still read.
+
+        Returns:
+            datas (List[int]): The data at each address.
+        """
+        datas = [None] * n_addrs
+        remaining = n_addrs
+        received = complete = False
+
+        sock = self._get_socket()
+
+        while True:
+            # Packets may also have been set aside while polling the core
+            filled = self._take_stream_packets(addr, datas)
+            received |= filled > 0
+            remaining -= filled
+            if not remaining:
+                break
+
+            try:
+                response = self._receive(sock)
+                self._stash_stream_packet(*self._decode_read_responses(response))
+
+            except socket.timeout:
+                # Stop waiting once the pushed data stops arriving, or once
+                # the core has pushed data that never arrived
+                if received or complete:
+                    break
+
+                complete = is_complete()
+
+        missing = [addr + i for i, d in enumerate(datas) if d is None]
+        if missing:
+            for a, d in zip(missing, self.read(missing)):
+                datas[a - addr] = d
+
+        return datas
+
+    async def aread_stream(self, addr, n_addrs, is_complete):
+        """
+        Receive the data that the FPGA pushes to the host once a core has it
+        ready, without blocking the event loop. This is the asynchronous
+        counterpart to read_stream(), and takes the same arguments, except
+        that `is_complete` is a coroutine function.
+
+        On event loops that can't watch a socket, `is_complete` is polled
+        until it returns True, and the data is then read from the FPGA.
+        """
+        loop = asyncio.get_running_loop()
+        datas = [None] * n_addrs
+        remaining = n_addrs
+        received = complete = False
+        watchable = True
+
+        sock = self._get_socket()
+        responses = asyncio.Queue()
+
+        def on_readable():
+            responses.put_nowait(sock.recv(self._get_max_response_size()))
+
+        while True:
+            # Packets may also have been set aside by other reads
+            filled = self._take_stream_packets(addr, datas)
+            received |= filled > 0
+            remaining -= filled
+            if not remaining:
+                break
+
+            # Only hold the lock while waiting, as is_complete() reads from
+            # the FPGA too
+            async with self._get_async_lock():
+                try:
+                    loop.add_reader(sock.fileno(), on_readable)
+
+                except NotImplementedError:
+                    watchable = False
+                    break
+
+                try:
+                    response = await asyncio.wait_for(responses.get(), self._timeout)
+                    self._stash_stream_packet(*self._decode_read_responses(response))
+
+                except asyncio.TimeoutError:
+                    response = None
+
+                finally:
+                    loop.remove_reader(sock.fileno())
+
+            if response is None:
+                if received or complete:
+                    break
+
+                complete = await is_complete()
+
+        if not watchable:
+            while not await is_complete():
+                await asyncio.sleep(self._POLL_INTERVAL)
+
+        missing = [addr + i for i, d in enumerate(datas) if d is None]
+        if missing:
+            for a, d in zip(missing, await self.aread(missing)):
+                datas[a - addr] = d
+
+        return datas
+
+    def _stash_stream_packet(self, seq, datas):
+        """
+        Set aside a packet that the FPGA pushed to the host, so that it can be
+        picked up by read_stream(). Returns whether the packet was one.
+        """
+        if seq is None or not seq & self._STREAM_FLAG:
+            return False
+
+        self._stream_packets.append((seq & (self._STREAM_FLAG - 1), datas))
+        return True
+
+    def _take_stream_packets(self, addr, datas):
+        """
+        Copy the data from the packets set aside by _stash_stream_packet() that
+        start within the `len(datas)` addresses from `addr` into `datas`, and
+        return the number of addresses that were filled in.
+        """
+        filled = 0
+        kept = []
+        for start, packet_datas in self._stream_packets:
+            if not addr <= start < addr + len(datas):
+                kept.append((start, packet_datas))
+                continue
+
+            for i, d in enumerate(packet_datas[: addr + len(datas) - start]):
+                filled += datas[start - addr + i] is None
+                datas[start - addr + i] = d
+
+        self._stream_packets = kept
+        return filled
+
+    def _get_sequence_number(self):
+        """
+        Return the sequence number to use for the next packet sent to the FPGA.
+        """
+        seq = self._sequence_number
+        self._sequence_number = (seq + 1) % 2**16
+        return seq
+
+    def _get_max_payload_size(self):
+        """
+        Return the size of the largest UDP payload that fits in a single IP
+        packet, in bytes. This leaves room for the 20-byte IPv4 header and the
+        8-byte UDP header.
+        """
+        return self._mtu - 28
+
+    def _get_fifo_depth(self):
+        """
+        Return the depth of the FIFOs in the UDPRawPort, in 32-bit words.
+        These are made deep enough to hold the largest packet that may be sent
+        in either direction.
+        """
+        return -(-self._get_max_payload_size() // 4)
+
+    def _get_max_response_size(self):
+        """
+        Return the size of the largest packet the FPGA may respond with, in
+        bytes. Packets of requests are planned so that their responses fit
+        within the MTU.
+        """
+        return self._get_max_payload_size()
+
+    def _get_max_responses(self):
+        """
+        Return the number of read responses that fit in a single packet, which
+        also contains a trailer word. Each response takes a 32-bit word, or two
+        if the bus is 64 bits wide.
+        """
+        words_per_response = 2 if self._bus_width == 64 else 1
+        return (self._get_max_payload_size() // 4 - 1) // words_per_response
+
+    def _plan_read_packets(self, addrs):
+        """
+        Return the requests in each packet sent to read a list of addresses.
+        Every run of consecutive addresses is read with a burst read, which
+        takes the same space in a packet as a single read.
+        """
+        # The count of a burst is sent in 16 bits
+        runs = split_into_runs(addrs, 2**16 - 1)
+        return self._plan_packets([(Opcodes.BURST_READ, run, []) for run in runs])
+
+    def _decode_read_responses(self, data):
+        """
+        Return the sequence number and data contained in a packet of read
+        responses. The sequence number is sent in the last word of the packet,
+        which has _STREAM_FLAG set if the FPGA pushed the packet to the host.
+        """
+        n_words = len(data) // 4
+        if n_words == 0:
+            return None, []
+
+        # Unpack every word at once, straight out of the received data. Each
+        # piece of data on a 64-bit bus is sent as two words, lower one first.
+        if self._bus_width == 64:
+            (seq,) = _WORD.unpack_from(data, 4 * (n_words - 1))
+            return seq, list(struct.unpack_from(f"<{(n_words - 1) // 2}Q", data))
+
+        words = struct.unpack_from(f"<{n_words}I", data)
+        return words[-1], list(words[:-1])
+
+    def _plan_write_packets(self, addrs, datas):
+        """
+        Check that a list of addresses and data are all integers, and return
+        the requests in each packet sent to write them. Each packet contains
+        as many requests as fit without exceeding the MTU.
+        """
 
         # Make sure address and datas are all integers
         if not isinstance(addrs, list) or not isinstance(datas, list):
@@ -597,19 +1586,183 @@ class EthernetInterface(Elaboratable):
         if not all(isinstance(d, int) for d in datas):
             raise TypeError("Write data must all be integers.")
 
-        # Since the FPGA doesn't issue any responses to write requests, we
-        # the host's input buffer isn't written to, and we don't need to
-        # send the data as chunks as the to avoid overflowing the input buffer.
+        # Runs of consecutive addresses are written with burst writes, which
+        # only take as many bytes per address as the data on the bus. Single
+        # writes only have room for 16 bits of data, so wider data is always
+        # written with burst writes.
+        requests = []
+        start = 0
+        for run in split_into_runs(addrs, 2**16 - 1):
+            burst = len(run) > 1 or self._bus_width > 16
+            opcode = Opcodes.BURST_WRITE if burst else Opcodes.WRITE
+            requests.append((opcode, run, datas[start : start + len(run)]))
+            start += len(run)
+
+        return self._plan_packets(requests)
+
+    def _get_write_packets(self, addrs, datas):
+        """
+        Return the packets of write requests that write a list of data to a
+        list of addresses, for sending without waiting for acknowledgements.
+        """
 
-        # Encode addrs and datas into write requests
-        bytes_out = b""
-        for addr, data in zip(addrs, datas):
-            bytes_out += int(1).to_bytes(4, byteorder="little")
-            bytes_out += int(addr).to_bytes(2, byteorder="little")
-            bytes_out += int(data).to_bytes(2, byteorder="little")
+        # Since the FPGA only responds to a packet of write requests with its
+        # sequence number, the host's input buffer won't overflow, and all the
+        # packets are sent at once. These responses are ignored by any later
+        # reads. Nothing paces the packets to the single packet of requests
+        # the FPGA can buffer though, so any it drops are lost without notice.
+        return [
+            self._encode_requests(packet, self._get_sequence_number())
+            for packet in self._plan_write_packets(addrs, datas)
+        ]
 
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.sendto(bytes_out, (self._fpga_ip_addr, self._udp_port))
+    def _plan_packets(self, requests):
+        """
+        Group a list of requests into packets, each of which fits within the
+        MTU, and is answered by a response that does too. Each request is a
+        tuple of an opcode, the addresses it accesses, and the data it writes.
+        Burst requests are split between packets where needed, so that every
+        packet but the last is full. In the compact format, the requests in a
+        packet must also share an opcode. If the bus has addresses wider than
+        16 bits, the requests in a packet must also share a page.
+        """
+        max_size = self._get_max_payload_size()
+        max_responses = self._get_max_responses()
+        opcode_size = 0 if self._compact_requests else 4
+        header_size = self._get_header_size()
+
+        packets = []
+        packet, size, n_responses = [], header_size, 0
+        for opcode, addrs, datas in requests:
+            while addrs:
+                # Find how many of the request's addresses fit in this packet
+                room = max_size - size - opcode_size - 4
+                if room < 0:
+                    count = 0
+
+                elif opcode == Opcodes.BURST_WRITE:
+                    count = min(len(addrs), (room // 4) * 32 // self._bus_width)
+
+                elif opcode == Opcodes.WRITE:
+                    count = 1
+
+                else:
+                    count = min(len(addrs), max_responses - n_responses)
+
+                if self._compact_requests and packet and packet[0][0] != opcode:
+                    count = 0
+
+                if packet and packet[0][1][0] >> 16 != addrs[0] >> 16:
+                    count = 0
+
+                if count == 0:
+                    packets.append(packet)
+                    packet, size, n_responses = [], header_size, 0
+                    continue
+
+                packet.append((opcode, addrs[:count], datas[:count]))
+                size += opcode_size + 4
+
+                if opcode == Opcodes.BURST_WRITE:
+                    size += self._get_burst_data_size(count)
+
+                if opcode in (Opcodes.READ, Opcodes.BURST_READ):
+                    n_responses += count
+
+                addrs, datas = addrs[count:], datas[count:]
+
+        if packet:
+            packets.append(packet)
+
+        return packets
+
+    def _encode_requests(self, requests, seq):
+        """
+        Return a packet containing a list of requests, beginning with a header
+        containing the packet's sequence number. In the compact format, the
+        requests share the opcode placed in the upper half of the header, and
+        otherwise each request's opcode is sent in its own word before it. If
+        the bus has addresses wider than 16 bits, the header is followed by a
+        word containing the page of every address in the packet, and each
+        request carries only the lower 16 bits of its address.
+
+        Burst requests carry their start address and count in place of an
+        address and data, and the data of a burst write follows in as many
+        words as it takes to hold it. Data is packed two to a word on a 16-bit
+        bus, one to a word on a 32-bit bus, and across two words on a 64-bit
+        bus.
+        """
+        opcode_size = 0 if self._compact_requests else 4
+
+        # Find the size of the packet, so that it can be packed in place
+        size = self._get_header_size()
+        for opcode, addrs, _ in requests:
+            size += opcode_size + 4
+
+            if opcode == Opcodes.BURST_WRITE:
+                size += self._get_burst_data_size(len(addrs))
+
+        packet = bytearray(size)
+
+        if self._compact_requests:
+            _WORD.pack_into(packet, 0, seq | (requests[0][0] << 16))
+
+        else:
+            _WORD.pack_into(packet, 0, seq)
+
+        if self._bus_addr_width > 16:
+            _WORD.pack_into(packet, 4, requests[0][1][0] >> 16)
+
+        offset = self._get_header_size()
+        for opcode, addrs, datas in requests:
+            # Addresses are consecutive, so only the ends need to be checked
+            addr_limit = 2**self._bus_addr_width
+            if not all(0 <= a < addr_limit for a in (addrs[0], addrs[-1])):
+                raise ValueError(f"Addresses must fit in {self._bus_addr_width} bits.")
+
+            if not all(0 <= d < 2**self._bus_width for d in datas):
+                raise ValueError(f"Data must fit in {self._bus_width} bits.")
+
+            if not self._compact_requests:
+                _WORD.pack_into(packet, offset, opcode)
+                offset += 4
+
+            addr = addrs[0] & 0xFFFF
+            if opcode == Opcodes.READ:
+                _WORD.pack_into(packet, offset, addr)
+
+            elif opcode == Opcodes.WRITE:
+                _WORD.pack_into(packet, offset, addr | (datas[0] << 16))
+
+            else:
+                _WORD.pack_into(packet, offset, addr | (len(addrs) << 16))
+
+            offset += 4
+
+            # Packing data into little-endian words is the same as packing each
+            # piece of data little-endian, padded out to a whole word
+            if opcode == Opcodes.BURST_WRITE:
+                fmt = f"<{len(datas)}{_DATA_FORMATS[self._bus_width]}"
+                struct.pack_into(fmt, packet, offset, *datas)
+                offset += self._get_burst_data_size(len(datas))
+
+        return packet
+
+    def _get_header_size(self):
+        """
+        Return the number of bytes at the start of each packet of requests,
+        before the first request. This holds the sequence number, followed by
+        the page of the packet's addresses if the bus has addresses wider than
+        16 bits.
+        """
+        return 8 if self._bus_addr_width > 16 else 4
+
+    def _get_burst_data_size(self, count):
+        """
+        Return the number of bytes taken by the data of a burst write of
+        `count` addresses, which is padded out to a whole number of words.
+        """
+        return 4 * -(-count * self._bus_width // 32)
 
     def generate_liteeth_core(self):
         """
@@ -617,22 +1770,60 @@ class EthernetInterface(Elaboratable):
         LiteEth standalone core generator. This passes the contents of the
         'ethernet' section of the Manta configuration file to LiteEth, after
         modifying it slightly.
+
+        Generating the core takes a while, so the generated Verilog is cached
+        on disk, and reused whenever a core with the same configuration is
+        generated by the same versions of LiteEth and LiteX. The cache is kept
+        in the directory given by the MANTA_CACHE_DIR environment variable, or
+        in `manta` inside the user's cache directory otherwise.
+        """
+        liteeth_config = self._get_liteeth_config()
+        path = self._get_liteeth_cache_dir() / f"{self._get_liteeth_cache_key()}.v"
+
+        try:
+            return path.read_text()
+
+        except OSError:
+            pass
+
+        # Generate the core
+        from manta.ethernet.liteeth_gen import main
+
+        verilog = main(liteeth_config)
+
+        # Write the core to a temporary file first, so that another process
+        # never reads a partially written core. The cache is only an
+        # optimization, so failing to write to it isn't an error.
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            temp_path.write_text(verilog)
+            os.replace(temp_path, path)
+
+        except OSError:
+            pass
+
+        return verilog
+
+    def _get_liteeth_config(self):
+        """
+        Return the configuration passed to the LiteEth standalone core
+        generator, which is the interface's configuration with a few
+        LiteEth-specific options added.
         """
         liteeth_config = self.to_config()
 
-        # Randomly assign a MAC address if one is not specified in the
-        # configuration. This will choose a MAC address in the Locally
-        # Administered, Administratively Assigned group. Please reference:
-        # https://en.wikipedia.org/wiki/MAC_address#Ranges_of_group_and_locally_administered_addresses
+        # Options for the host's side of the link aren't meaningful to LiteEth
+        for option in self._HOST_OPTIONS:
+            liteeth_config.pop(option, None)
 
-        if "mac_address" not in liteeth_config:
-            addr = list(f"{getrandbits(48):012x}")
-            addr[1] = "2"
-            liteeth_config["mac_address"] = int("".join(addr), 16)
-            print(liteeth_config["mac_address"])
+        # Responses are buffered by the UDPRawPort, and the DHCP status is read
+        # through the interface's own registers, instead of by LiteEth
+        liteeth_config.pop("response_buffer_packets", None)
+        liteeth_config.pop("dhcp_status", None)
 
-        # Force use of DHCP
-        liteeth_config["dhcp"] = True
+        # Only include a DHCP engine if one is wanted
+        liteeth_config["dhcp"] = self._dhcp
 
         # Use UDP
         liteeth_config["core"] = "udp"
@@ -641,17 +1832,66 @@ class EthernetInterface(Elaboratable):
         # LiteEth to use 32-bit words
         liteeth_config["data_width"] = 32
 
-        # Add UDP port
+        # Add UDP port. This is a raw port, which provides the address and
+        # port of the host that sent each packet so that it can be answered.
+        # Packets are buffered by the UDPRawPort instead of by LiteEth.
         liteeth_config["udp_ports"] = {
             "udp0": {
+                "mode": "raw",
                 "udp_port": self._udp_port,
                 "data_width": 32,
-                "tx_fifo_depth": 64,
-                "rx_fifo_depth": 64,
             }
         }
 
-        # Generate the core
-        from manta.ethernet.liteeth_gen import main
+        # Assign a MAC address if one is not specified in the configuration.
+        # This is derived from the rest of the configuration, so the FPGA
+        # keeps the same MAC address every time it's rebuilt, and is chosen
+        # from the Locally Administered, Administratively Assigned group.
+        # Please reference:
+        # https://en.wikipedia.org/wiki/MAC_address#Ranges_of_group_and_locally_administered_addresses
 
-        return main(liteeth_config)
+        if "mac_address" not in liteeth_config:
+            digest = self._hash_config(liteeth_config)
+            addr = list(digest[:12])
+            addr[1] = "2"
+            liteeth_config["mac_address"] = int("".join(addr), 16)
+
+        return liteeth_config
+
+    def _get_liteeth_cache_key(self):
+        """
+        Return the name the generated LiteEth core is cached under, which is a
+        hash of everything that goes into generating it.
+        """
+        versions = {}
+        for package in ["liteeth", "litex", "migen"]:
+            try:
+                versions[package] = version(package)
+
+            except PackageNotFoundError:
+                versions[package] = None
+
+        # The generator itself is part of Manta, and may change between
+        # releases, or while Manta is being developed
+        generator = (Path(__file__).parent / "liteeth_gen.py").read_bytes()
+        versions["generator"] = hashlib.sha256(generator).hexdigest()
+
+        return self._hash_config([self._get_liteeth_config(), versions])
+
+    def _get_liteeth_cache_dir(self):
+        """
+        Return the directory that generated LiteEth cores are cached in.
+        """
+        if "MANTA_CACHE_DIR" in os.environ:
+            return Path(os.environ["MANTA_CACHE_DIR"]) / "liteeth"
+
+        cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+        return Path(cache_home) / "manta" / "liteeth"
+
+    def _hash_config(self, config):
+        """
+        Return a hash of a configuration, which doesn't depend on the order
+        its keys are in.
+        """
+        serialized = json.dumps(config, sort_keys=True, default=str)
+        return hashlib.sha256(serialized.encode()).hexdigest()
@@ -512,9 +512,10 @@ class UDPCore(PHYCore):
 
         port_ios = platform.request(name)
 
-        raw_port = self.core.udp.crossbar.get_port(
-            port_ios.sink_dst_port, dw=data_width
-        )
+        # Listen on the given UDP port if there is one, as replies are sent to
+        # whichever port the request came from.
+        udp_port = port_cfg.get("udp_port", port_ios.sink_dst_port)
+        raw_port = self.core.udp.crossbar.get_port(udp_port, dw=data_width)
 
         # Connect IOs.
         # ------------
@@ -0,0 +1,157 @@
+from amaranth import *
+from amaranth.lib.fifo import SyncFIFOBuffered
+
+
+class UDPRawPort(Elaboratable):
+    """
+    A module for connecting the UDP bridges to a LiteEth raw UDP port, which
+    provides the IP address and UDP port that each packet came from.
+
+    Received packets are buffered, and the address and port of the packet
+    currently being read out are held on reply_ip_o and reply_port_o. Packets
+    to send are buffered until they're complete, and then sent to the address
+    and port given on reply_ip_i and reply_port_i when their last word was
+    written. This lets the FPGA answer any number of hosts, each on whichever
+    UDP port it happens to be using.
+    """
+
+    def __init__(self, udp_port, rx_depth, tx_depth):
+        self._udp_port = udp_port
+        self._rx_depth = rx_depth
+        self._tx_depth = tx_depth
+
+        # LiteEth raw port, source (packets received from the network)
+        self.source_ip_address_i = Signal(32)
+        self.source_src_port_i = Signal(16)
+        self.source_data_i = Signal(32)
+        self.source_last_i = Signal()
+        self.source_ready_o = Signal()
+        self.source_valid_i = Signal()
+
+        # LiteEth raw port, sink (packets sent to the network)
+        self.sink_ip_address_o = Signal(32)
+        self.sink_src_port_o = Signal(16)
+        self.sink_dst_port_o = Signal(16)
+        self.sink_length_o = Signal(16)
+        self.sink_last_be_o = Signal(4)
+        self.sink_data_o = Signal(32)
+        self.sink_last_o = Signal()
+        self.sink_ready_i = Signal()
+        self.sink_valid_o = Signal()
+
+        # Received packets, to the UDPSourceBridge
+        self.data_o = Signal(32)
+        self.last_o = Signal()
+        self.ready_i = Signal()
+        self.valid_o = Signal()
+        self.reply_ip_o = Signal(32)
+        self.reply_port_o = Signal(16)
+
+        # Packets to send, from the UDPSinkBridge
+        self.data_i = Signal(32)
+        self.last_i = Signal()
+        self.ready_o = Signal()
+        self.valid_i = Signal()
+        self.reply_ip_i = Signal(32)
+        self.reply_port_i = Signal(16)
+
+        # Whether every packet written has been sent
+        self.idle_o = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        self._elaborate_rx(m)
+        self._elaborate_tx(m)
+
+        return m
+
+    def _elaborate_rx(self, m):
+        m.submodules.rx_fifo = rx_fifo = SyncFIFOBuffered(
+            width=32 + 1 + 32 + 16, depth=self._rx_depth
+        )
+
+        m.d.comb += rx_fifo.w_data.eq(
+            Cat(
+                self.source_data_i,
+                self.source_last_i,
+                self.source_ip_address_i,
+                self.source_src_port_i,
+            )
+        )
+        m.d.comb += rx_fifo.w_en.eq(self.source_valid_i)
+        m.d.comb += self.source_ready_o.eq(rx_fifo.w_rdy)
+
+        m.d.comb += self.data_o.eq(rx_fifo.r_data[:32])
+        m.d.comb += self.last_o.eq(rx_fifo.r_data[32])
+        m.d.comb += self.valid_o.eq(rx_fifo.r_rdy)
+        m.d.comb += rx_fifo.r_en.eq(self.ready_i)
+
+        # Hold the sender of a packet from its first word until the first word
+        # of the next packet
+        first = Signal(init=1)
+        with m.If(rx_fifo.r_en & rx_fifo.r_rdy):
+            m.d.sync += first.eq(self.last_o)
+
+            with m.If(first):
+                m.d.sync += self.reply_ip_o.eq(rx_fifo.r_data[33:65])
+                m.d.sync += self.reply_port_o.eq(rx_fifo.r_data[65:])
+
+    def _elaborate_tx(self, m):
+        m.submodules.tx_fifo = tx_fifo = SyncFIFOBuffered(
+            width=32, depth=self._tx_depth
+        )
+
+        # Every packet is at least one word long, so there's never more
+        # packets waiting to be sent than there are words
+        m.submodules.header_fifo = header_fifo = SyncFIFOBuffered(
+            width=32 + 16 + 16, depth=self._tx_depth
+        )
+
+        # Count the words of the packet being written, leaving out any that
+        # were dropped so that the length sent matches the data
+        n_words = Signal(16)
+
+        m.d.comb += tx_fifo.w_data.eq(self.data_i)
+        m.d.comb += tx_fifo.w_en.eq(self.valid_i)
+        m.d.comb += self.ready_o.eq(tx_fifo.w_rdy)
+
+        with m.If(self.valid_i & tx_fifo.w_rdy):
+            m.d.sync += n_words.eq(n_words + 1)
+
+            with m.If(self.last_i):
+                m.d.sync += n_words.eq(0)
+                m.d.comb += header_fifo.w_en.eq(1)
+                m.d.comb += header_fifo.w_data.eq(
+                    Cat(self.reply_ip_i, self.reply_port_i, n_words + 1)
+                )
+
+        # Send each packet once all of it has been written
+        sending = Signal()
+        remaining = Signal(16)
+
+        m.d.comb += self.sink_src_port_o.eq(self._udp_port)
+        m.d.comb += self.sink_last_be_o.eq(0b1000)
+        m.d.comb += self.sink_data_o.eq(tx_fifo.r_data)
+        m.d.comb += self.sink_last_o.eq(remaining == 1)
+
+        with m.If(~sending):
+            with m.If(header_fifo.r_rdy):
+                m.d.comb += header_fifo.r_en.eq(1)
+                m.d.sync += sending.eq(1)
+                m.d.sync += self.sink_ip_address_o.eq(header_fifo.r_data[:32])
+                m.d.sync += self.sink_dst_port_o.eq(header_fifo.r_data[32:48])
+                m.d.sync += self.sink_length_o.eq(header_fifo.r_data[48:] * 4)
+                m.d.sync += remaining.eq(header_fifo.r_data[48:])
+
+        with m.Else():
+            m.d.comb += self.sink_valid_o.eq(tx_fifo.r_rdy)
+
+            with m.If(self.sink_valid_o & self.sink_ready_i):
+                m.d.comb += tx_fifo.r_en.eq(1)
+                m.d.sync += remaining.eq(remaining - 1)
+
+                with m.If(self.sink_last_o):
+                    m.d.sync += sending.eq(0)
+
+        m.d.comb += self.idle_o.eq(~sending & ~header_fifo.r_rdy & ~tx_fifo.r_rdy)
@@ -7,26 +7,67 @@ class UDPSinkBridge(Elaboratable):
     """
     A module for bridging Manta's internal bus to an AXI stream of UDP packet
     data. Connects to the LiteEth core's "sink" port.
+
+    Read responses are sent back to the host as they come off the bus. Once
+    the last request of a packet has come off the bus, the packet's sequence
+    number is sent as a trailer word, which ends the response packet. Packets
+    of data pushed to the host without a request end with the trailer word
+    provided by the UDPSourceBridge in place of a sequence number.
+
+    On a 64-bit bus, each read response is sent as two words, with the lower
+    one first. The UDPSourceBridge leaves a cycle after every read, so the
+    upper word is sent before the next read response arrives.
     """
 
-    def __init__(self):
-        self.bus_i = Signal(InternalBus())
+    def __init__(self, data_width=16, addr_width=16):
+        self._data_width = data_width
+
+        self.bus_i = Signal(InternalBus(data_width, addr_width))
 
         self.data_o = Signal(32)
         self.last_o = Signal()
         self.ready_i = Signal()
         self.valid_o = Signal()
 
+        self.seq_i = Signal(32)
+        self.seq_valid_i = Signal()
+        self.seq_ready_o = Signal()
+
     def elaborate(self, platform):
         m = Module()
 
+        trailer_pending = Signal()
+        upper_pending = Signal()
+        upper_data = Signal(32)
+
         m.d.sync += self.data_o.eq(0)
         m.d.sync += self.last_o.eq(0)
         m.d.sync += self.valid_o.eq(0)
 
         with m.If((self.bus_i.valid) & (~self.bus_i.rw)):
-            m.d.sync += self.data_o.eq(self.bus_i.data)
-            m.d.sync += self.last_o.eq(self.bus_i.last)
+            m.d.sync += self.data_o.eq(self.bus_i.data[:32])
+            m.d.sync += self.valid_o.eq(1)
+
+            if self._data_width == 64:
+                m.d.sync += upper_pending.eq(1)
+                m.d.sync += upper_data.eq(self.bus_i.data[32:])
+
+        with m.If(upper_pending):
+            m.d.sync += upper_pending.eq(0)
+            m.d.sync += self.data_o.eq(upper_data)
+            m.d.sync += self.valid_o.eq(1)
+
+        with m.If((self.bus_i.valid) & (self.bus_i.last)):
+            m.d.sync += trailer_pending.eq(1)
+
+        # Send the trailer once the packet's sequence number is available. The
+        # host's next packet starts with a header, so the first read response
+        # of the next packet can't arrive until after the trailer is sent.
+        with m.Elif(trailer_pending & self.seq_valid_i & ~upper_pending):
+            m.d.comb += self.seq_ready_o.eq(1)
+            m.d.sync += trailer_pending.eq(0)
+            m.d.sync += self.data_o.eq(self.seq_i)
+            m.d.sync += self.last_o.eq(1)
             m.d.sync += self.valid_o.eq(1)
 
         return m
@@ -1,43 +1,325 @@
 from amaranth import *
+from amaranth.lib.enum import IntEnum
 
 from manta.utils import *
 
 
+class Opcodes(IntEnum):
+    READ = 0
+    WRITE = 1
+    BURST_READ = 2
+    BURST_WRITE = 3
+
+
+class States(IntEnum):
+    HEADER = 0
+    OPCODE = 1
+    REQUEST = 2
+    BURST_READ = 3
+    BURST_WRITE = 4
+    STREAM_WAIT = 5
+    STREAM = 6
+    PAGE = 7
+
+
 class UDPSourceBridge(Elaboratable):
     """
     A module for bridging the AXI-stream of incoming UDP packet data to Manta's
     internal bus. Connects to the LiteEth core's "source" port.
+
+    Each packet begins with a header word containing a sequence number, which
+    is followed by any number of requests. Once the last request of a packet
+    has been placed on the bus, the packet's sequence number is output so that
+    it can be echoed back to the host.
+
+    By default, each request is sent as two words: an opcode, followed by the
+    address and data. If `compact` is set, the opcode is instead sent once in
+    the upper half of the header, and applies to every request in the packet,
+    so that each request takes a single word.
+
+    Burst requests carry a start address and a count in place of the address
+    and data. A burst read places `count` reads of consecutive addresses on the
+    bus, and a burst write is followed by the data to write. On a 16-bit bus
+    this is packed two to a word with the first in the lower half, on a 32-bit
+    bus it's sent one to a word, and on a 64-bit bus each piece of data is
+    sent as two words with the lower one first. No more data is taken from the
+    stream while the bus transactions for a burst are being generated.
+
+    If the bus has addresses wider than `16` bits, the header is followed by a
+    word containing the page of the packet, which is placed above the 16-bit
+    address of every request in it. Every packet sets its own page, so that a
+    packet resent by the host is always placed at the same addresses.
+
+    Single writes only carry 16 bits of data, and so wider data is written
+    with burst writes. On a 64-bit bus each read response is sent back as two
+    words, and so reads are placed on the bus no more than every other cycle.
+
+    Between packets, the bridge may also be asked to push data to the host
+    without a request. The requested addresses are read in packets of up to
+    `stream_packet_size` reads, and each packet's sequence number is replaced
+    by its first address with the top bit set. The LiteEth core merges packets
+    that end while it's still sending the previous one, so each of these
+    packets is only started once the previous response has been sent.
     """
 
-    def __init__(self):
-        self.bus_o = Signal(InternalBus())
+    def __init__(
+        self, compact=False, stream_packet_size=367, data_width=16, addr_width=16
+    ):
+        self._compact = compact
+        self._stream_packet_size = stream_packet_size
+        self._data_width = data_width
+        self._addr_width = addr_width
+
+        self.bus_o = Signal(InternalBus(data_width, addr_width))
 
         self.data_i = Signal(32)
         self.last_i = Signal()
         self.ready_o = Signal()
         self.valid_i = Signal()
 
+        self.seq_o = Signal(32)
+        self.seq_valid_o = Signal()
+        self.trailer_sent_i = Signal()
+        self.tx_idle_i = Signal()
+
+        self.stream_addr_i = Signal(addr_width)
+        self.stream_count_i = Signal(addr_width + 1)
+        self.stream_valid_i = Signal()
+        self.stream_ready_o = Signal()
+
     def elaborate(self, platform):
         m = Module()
 
-        state = Signal()  # Can either be 0, for read/write, or 1, for data
-        rw_buf = Signal().like(self.bus_o.rw)
+        state = Signal(States)
+        seq = Signal(16)
+        opcode = Signal(Opcodes)
+
+        # The upper bits of every address in the current packet
+        page = Signal(self._addr_width - 16)
+
+        # The address and number of transactions remaining in the current
+        # burst, and whether it's the last request in its packet
+        burst_addr = Signal(self._addr_width)
+        burst_count = Signal(16)
+        burst_last = Signal()
+
+        # The second piece of data in each word of a burst write is placed on
+        # the bus in the cycle after the first
+        upper_pending = Signal()
+        upper_data = Signal(16)
+        upper_last = Signal()
 
-        # Can always take more data
-        m.d.sync += self.ready_o.eq(1)
+        # On a 64-bit bus, the lower word of each piece of data in a burst
+        # write is held until the upper word arrives, and nothing is placed on
+        # the bus in the cycle after a read
+        lower_received = Signal()
+        lower_data = Signal(32)
+        read_gap = Signal()
+
+        # The address and number of reads remaining in the data being pushed
+        # to the host, and in its current packet
+        stream_addr = Signal(self._addr_width)
+        stream_count = Signal(self._addr_width + 1)
+        stream_packet_addr = Signal(self._addr_width)
+        stream_packet_count = Signal(range(self._stream_packet_size + 1))
+
+        # The number of packets whose trailer hasn't been sent yet, and a
+        # few cycles for the LiteEth core to start sending the last of them
+        trailers_pending = Signal(8)
+        holdoff = Signal(range(5))
+
+        with m.If(self.seq_valid_o & ~self.trailer_sent_i):
+            m.d.sync += trailers_pending.eq(trailers_pending + 1)
+
+        with m.Elif(~self.seq_valid_o & self.trailer_sent_i):
+            m.d.sync += trailers_pending.eq(trailers_pending - 1)
+
+        with m.If(self.trailer_sent_i):
+            m.d.sync += holdoff.eq(4)
+
+        with m.Elif(holdoff != 0):
+            m.d.sync += holdoff.eq(holdoff - 1)
+
+        sent = (trailers_pending == 0) & ~self.seq_valid_o & (holdoff == 0)
+
+        # Start pushing data to the host between packets
+        start_stream = (
+            (state == States.HEADER) & self.stream_valid_i & ~upper_pending & ~read_gap
+        )
+        m.d.comb += self.stream_ready_o.eq(start_stream)
+
+        busy = (
+            (state == States.BURST_READ)
+            | (state == States.STREAM_WAIT)
+            | (state == States.STREAM)
+        )
+        m.d.comb += self.ready_o.eq(~busy & ~upper_pending & ~read_gap & ~start_stream)
 
         m.d.sync += self.bus_o.eq(0)
-        with m.If(self.valid_i):
-            m.d.sync += state.eq(~state)
-
-            with m.If(state == 0):
-                m.d.sync += rw_buf.eq(self.data_i)
-
-            with m.Else():
-                m.d.sync += self.bus_o.addr.eq(self.data_i[:16])
-                m.d.sync += self.bus_o.data.eq(self.data_i[16:])
-                m.d.sync += self.bus_o.rw.eq(rw_buf)
-                m.d.sync += self.bus_o.valid.eq(1)
-                m.d.sync += self.bus_o.last.eq(self.last_i)
+        m.d.sync += self.seq_valid_o.eq(0)
+        m.d.sync += read_gap.eq(0)
+
+        def place_on_bus(addr, data, rw, last, trailer=seq):
+            m.d.sync += self.bus_o.addr.eq(addr)
+            m.d.sync += self.bus_o.data.eq(data)
+            m.d.sync += self.bus_o.rw.eq(rw)
+            m.d.sync += self.bus_o.valid.eq(1)
+            m.d.sync += self.bus_o.last.eq(last)
+
+            if self._data_width == 64:
+                m.d.sync += read_gap.eq(rw == 0)
+
+            with m.If(last):
+                m.d.sync += self.seq_o.eq(trailer)
+                m.d.sync += self.seq_valid_o.eq(1)
+
+        # Requests follow the header directly in the compact format, and are
+        # each preceded by an opcode otherwise
+        next_request_state = States.REQUEST if self._compact else States.OPCODE
+        after_header_state = (
+            States.PAGE if self._addr_width > 16 else next_request_state
+        )
+
+        with m.If(upper_pending):
+            place_on_bus(burst_addr, upper_data, 1, upper_last)
+            m.d.sync += burst_addr.eq(burst_addr + 1)
+            m.d.sync += burst_count.eq(burst_count - 1)
+            m.d.sync += upper_pending.eq(0)
+
+        with m.Elif(read_gap):
+            pass
+
+        with m.Elif(state == States.BURST_READ):
+            last = burst_last & (burst_count == 1)
+            place_on_bus(burst_addr, 0, 0, last)
+            m.d.sync += burst_addr.eq(burst_addr + 1)
+            m.d.sync += burst_count.eq(burst_count - 1)
+
+            with m.If(last):
+                m.d.sync += state.eq(States.HEADER)
+
+            with m.Elif(burst_count <= 1):
+                m.d.sync += state.eq(next_request_state)
+
+        with m.Elif(state == States.STREAM_WAIT):
+            with m.If(stream_count == 0):
+                m.d.sync += state.eq(States.HEADER)
+
+            with m.Elif(sent & self.tx_idle_i):
+                m.d.sync += stream_packet_addr.eq(stream_addr)
+                m.d.sync += state.eq(States.STREAM)
+
+                with m.If(stream_count < self._stream_packet_size):
+                    m.d.sync += stream_packet_count.eq(stream_count)
+
+                with m.Else():
+                    m.d.sync += stream_packet_count.eq(self._stream_packet_size)
+
+        with m.Elif(state == States.STREAM):
+            last = stream_packet_count == 1
+            padding = Const(0, 31 - self._addr_width)
+            trailer = Cat(stream_packet_addr, padding, Const(1, 1))
+            place_on_bus(stream_addr, 0, 0, last, trailer)
+            m.d.sync += stream_addr.eq(stream_addr + 1)
+            m.d.sync += stream_count.eq(stream_count - 1)
+            m.d.sync += stream_packet_count.eq(stream_packet_count - 1)
+
+            with m.If(last):
+                m.d.sync += state.eq(States.STREAM_WAIT)
+
+        with m.Elif(start_stream):
+            m.d.sync += stream_addr.eq(self.stream_addr_i)
+            m.d.sync += stream_count.eq(self.stream_count_i)
+            m.d.sync += state.eq(States.STREAM_WAIT)
+
+        with m.Elif(self.valid_i):
+            with m.If(state == States.HEADER):
+                m.d.sync += seq.eq(self.data_i[:16])
+                m.d.sync += page.eq(0)
+                m.d.sync += state.eq(after_header_state)
+
+                if self._compact:
+                    m.d.sync += opcode.eq(self.data_i[16:])
+
+            with m.Elif(state == States.PAGE):
+                m.d.sync += page.eq(self.data_i)
+                m.d.sync += state.eq(next_request_state)
+
+            with m.Elif(state == States.OPCODE):
+                m.d.sync += opcode.eq(self.data_i)
+                m.d.sync += state.eq(States.REQUEST)
+
+            with m.Elif(state == States.REQUEST):
+                m.d.sync += state.eq(next_request_state)
+
+                with m.Switch(opcode):
+                    with m.Case(Opcodes.READ, Opcodes.WRITE):
+                        rw = opcode == Opcodes.WRITE
+                        addr = Cat(self.data_i[:16], page)
+                        place_on_bus(addr, self.data_i[16:], rw, self.last_i)
+
+                    with m.Case(Opcodes.BURST_READ, Opcodes.BURST_WRITE):
+                        m.d.sync += burst_addr.eq(Cat(self.data_i[:16], page))
+                        m.d.sync += burst_count.eq(self.data_i[16:])
+                        m.d.sync += burst_last.eq(self.last_i)
+
+                        with m.If(self.data_i[16:] != 0):
+                            with m.If(opcode == Opcodes.BURST_READ):
+                                m.d.sync += state.eq(States.BURST_READ)
+
+                            with m.Else():
+                                m.d.sync += state.eq(States.BURST_WRITE)
+
+            with m.Elif(state == States.BURST_WRITE):
+                last = self.last_i & (burst_count == 1)
+
+                if self._data_width == 16:
+                    place_on_bus(burst_addr, self.data_i[:16], 1, last)
+                    m.d.sync += burst_addr.eq(burst_addr + 1)
+                    m.d.sync += burst_count.eq(burst_count - 1)
+
+                    with m.If(burst_count > 1):
+                        m.d.sync += upper_pending.eq(1)
+                        m.d.sync += upper_data.eq(self.data_i[16:])
+                        m.d.sync += upper_last.eq(self.last_i & (burst_count == 2))
+
+                    with m.If(burst_count <= 2):
+                        m.d.sync += state.eq(next_request_state)
+
+                elif self._data_width == 32:
+                    place_on_bus(burst_addr, self.data_i, 1, last)
+                    m.d.sync += burst_addr.eq(burst_addr + 1)
+                    m.d.sync += burst_count.eq(burst_count - 1)
+
+                    with m.If(burst_count <= 1):
+                        m.d.sync += state.eq(next_request_state)
+
+                else:
+                    with m.If(~lower_received):
+                        m.d.sync += lower_received.eq(1)
+                        m.d.sync += lower_data.eq(self.data_i)
+
+                    with m.Else():
+                        data = Cat(lower_data, self.data_i)
+                        place_on_bus(burst_addr, data, 1, last)
+                        m.d.sync += burst_addr.eq(burst_addr + 1)
+                        m.d.sync += burst_count.eq(burst_count - 1)
+                        m.d.sync += lower_received.eq(0)
+
+                        with m.If(burst_count <= 1):
+                            m.d.sync += state.eq(next_request_state)
+
+            # Start looking for a header again at the end of every packet, so
+            # a malformed packet can't misalign the ones after it. The last
+            # request of a packet may be a burst read, which is finished first.
+            starts_burst_read = (
+                (state == States.REQUEST)
+                & (opcode == Opcodes.BURST_READ)
+                & (self.data_i[16:] != 0)
+            )
+
+            with m.If(self.last_i & ~starts_burst_read):
+                m.d.sync += state.eq(States.HEADER)
+                m.d.sync += lower_received.eq(0)
 
         return m
@@ -1,6 +1,7 @@
 from math import ceil
 
 from amaranth import *
+from amaranth.lib.cdc import FFSynchronizer
 
 from manta.utils import *
 
@@ -11,7 +12,7 @@ class IOCore(MantaCore):
     arbitrary size.
     """
 
-    def __init__(self, inputs=[], outputs=[]):
+    def __init__(self, inputs=[], outputs=[], domain="sync"):
         """
         Create an IO Core, with the given input and output probes.
 
@@ -29,13 +30,21 @@ class IOCore(MantaCore):
                 This parameter is somewhat optional as an IO Core must have
                 at least one probe, but it need not be an output.
 
+            domain (Optional[str]): The clock domain that the probes belong
+                to. The probes are sampled and driven in this domain, while
+                the core's registers are read and written from the bus in
+                the `sync` domain. Each strobe of the registers is passed
+                between the two with a handshake. Defaults to `sync`.
+
         """
+        check_clock_domain(domain)
+
         self._inputs = inputs
         self._outputs = outputs
+        self._domain = domain
 
         # Bus Connections
-        self.bus_i = Signal(InternalBus())
-        self.bus_o = Signal(InternalBus())
+        self.bus_width = 16
 
         # Internal Signals
         self._strobe = Signal()
@@ -53,6 +62,10 @@ class IOCore(MantaCore):
         self._make_memory_map()
         return self._max_addr
 
+    @property
+    def bus_latency(self):
+        return 1 + self.bus_pipeline_stages
+
     @classmethod
     def from_config(cls, config):
         inputs = config.get("inputs", {})
@@ -63,7 +76,7 @@ class IOCore(MantaCore):
             raise ValueError("Must specify at least one input or output port.")
 
         # Warn about unrecognized options
-        valid_options = ["type", "inputs", "outputs"]
+        valid_options = ["type", "inputs", "outputs", "domain"]
         for option in config:
             if option not in valid_options:
                 warn(f"Ignoring unrecognized option '{option}' in IO core.'")
@@ -131,12 +144,16 @@ class IOCore(MantaCore):
 
             output_signals += [Signal(width, name=name, init=initial_value)]
 
-        return cls(inputs=input_signals, outputs=output_signals)
+        domain = config.get("domain", "sync")
+        return cls(inputs=input_signals, outputs=output_signals, domain=domain)
 
     def to_config(self):
         config = {}
         config["type"] = "io"
 
+        if self._domain != "sync":
+            config["domain"] = self._domain
+
         if self._inputs:
             config["inputs"] = {s.name: len(s) for s in self._inputs}
 
@@ -161,8 +178,8 @@ class IOCore(MantaCore):
         last_used_addr = self.base_addr
 
         for io, io_buf in zip(ios, io_bufs):
-            n_slices = ceil(len(io) / 16)
-            signals = split_into_chunks(io_buf, 16)
+            n_slices = ceil(len(io) / self.bus_width)
+            signals = split_into_chunks(io_buf, self.bus_width)
             addrs = [i + last_used_addr + 1 for i in range(n_slices)]
 
             self._memory_map[io.name] = dict(signals=signals, addrs=addrs)
@@ -179,57 +196,88 @@ class IOCore(MantaCore):
     def elaborate(self, platform):
         m = Module()
 
+        # Decode the address of each register, pipelining the bus if needed
+        registers = [
+            (addr, signal)
+            for io in self._memory_map.values()
+            for addr, signal in zip(io["addrs"], io["signals"])
+        ]
+        bus, hits = self._pipeline_bus(m, [(addr, addr) for addr, _ in registers])
+
         # Shuffle bus transactions along
-        m.d.sync += self.bus_o.eq(self.bus_i)
+        m.d.sync += self.bus_o.eq(bus)
+
+        if self._domain == "sync":
+            # Update input_buffers from inputs
+            for i, i_buf in zip(self._inputs, self._input_bufs):
+                with m.If(self._strobe):
+                    m.d.sync += i_buf.eq(i)
 
-        # Update input_buffers from inputs
-        for i, i_buf in zip(self._inputs, self._input_bufs):
-            with m.If(self._strobe):
-                m.d.sync += i_buf.eq(i)
+            # Update outputs from output_buffers
+            for o, o_buf in zip(self._outputs, self._output_bufs):
+                with m.If(self._strobe):
+                    m.d.sync += o.eq(o_buf)
 
-        # Update outputs from output_buffers
-        for o, o_buf in zip(self._outputs, self._output_bufs):
-            with m.If(self._strobe):
-                m.d.sync += o.eq(o_buf)
+        else:
+            self._cross_domains(m)
 
         # Handle register reads and writes
-        for io in self._memory_map.values():
-            for addr, signal in zip(io["addrs"], io["signals"]):
-                with m.If(self.bus_i.addr == addr):
-                    # Writes
-                    with m.If(self.bus_i.rw):
-                        m.d.sync += signal.eq(self.bus_i.data)
+        for (_, signal), hit in zip(registers, hits):
+            with m.If(hit):
+                # Writes
+                with m.If(bus.rw):
+                    m.d.sync += signal.eq(bus.data)
 
-                    # Reads
-                    with m.Else():
-                        m.d.sync += self.bus_o.data.eq(signal)
+                # Reads
+                with m.Else():
+                    m.d.sync += self.bus_o.data.eq(signal)
 
         return m
 
-    def set_probe(self, probe, value):
+    def _cross_domains(self, m):
         """
-        Set the value of an output probe on the FPGA.
-
-        This method is blocking.
+        Pass each strobe between the bus and the probes' clock domain with a
+        toggle handshake. When the strobe rises, the probes' domain is sent a
+        request, which it answers by sampling the inputs and driving the
+        outputs once. The buffers of the output probes are written before the
+        strobe rises, and the samples of the input probes are only copied
+        into their buffers once the acknowledgement comes back, so every
+        multi-bit value is held steady while it's taken across.
+        """
+        prev_strobe = Signal()
+        request = Signal()
+        m.d.sync += prev_strobe.eq(self._strobe)
+        with m.If(self._strobe & ~prev_strobe):
+            m.d.sync += request.eq(~request)
+
+        synced_request = Signal()
+        acknowledge = Signal()
+        m.submodules.request_sync = FFSynchronizer(
+            request, synced_request, o_domain=self._domain
+        )
 
-        Args:
-            probe (str | amaranth.Signal): The output probe to set the value
-                of. This may be either a string containing the name of the
-                probe, or the Amaranth Signal representing the probe itself.
-                Strings are typically used in Verilog-based workflows, and
-                Amaranth Signals are typically used in Amaranth-native designs.
+        samples = [Signal(len(i), name=i.name + "_sample") for i in self._inputs]
+        with m.If(synced_request != acknowledge):
+            m.d[self._domain] += acknowledge.eq(synced_request)
 
-            value (int): The value to set the probe to. This may be either
-                positive or negative, but must fit within the width of the
-                probe.
+            for i, sample in zip(self._inputs, samples):
+                m.d[self._domain] += sample.eq(i)
 
-        Returns:
-            None
+            for o, o_buf in zip(self._outputs, self._output_bufs):
+                m.d[self._domain] += o.eq(o_buf)
 
-        Raises:
-            ValueError: The probe was not found to be an output of the IO Core,
-                or many probes were found with the same name.
+        synced_acknowledge = Signal()
+        prev_acknowledge = Signal()
+        m.submodules.acknowledge_sync = FFSynchronizer(acknowledge, synced_acknowledge)
+        m.d.sync += prev_acknowledge.eq(synced_acknowledge)
+        with m.If(synced_acknowledge != prev_acknowledge):
+            for i_buf, sample in zip(self._input_bufs, samples):
+                m.d.sync += i_buf.eq(sample)
 
+    def _find_output_probe(self, probe):
+        """
+        Return the output probe matching a name or Signal, raising an
+        exception if exactly one isn't found.
         """
 
         # This function accepts either the name of an output probe, or a
@@ -244,7 +292,7 @@ class IOCore(MantaCore):
             if len(probes) > 1:
                 raise ValueError(f"Multiple probes found in IO core for name {probe}.")
 
-            return self.set_probe(probes[0], value)
+            return self._find_output_probe(probes[0])
 
         # Check that the probe is an output
         probes = [o for o in self._outputs if probe is o]
@@ -256,12 +304,80 @@ class IOCore(MantaCore):
                 f"Multiple output probes found in IO core for name '{probe.name}'."
             )
 
+        return probes[0]
+
+    def _find_probe(self, probe):
+        """
+        Return the input or output probe matching a name or Signal, raising an
+        exception if exactly one isn't found.
+        """
+
+        # This function accepts either the name of a probe, or a
+        # Signal() object that is the probe itself.
+
+        if isinstance(probe, str):
+            # The name passed should occur exactly once in the probes
+            probes = [o for o in self._outputs if o.name == probe]
+            probes += [i for i in self._inputs if i.name == probe]
+
+            if len(probes) == 0:
+                raise ValueError(f"Probe with name '{probe}' not found in IO core.")
+
+            if len(probes) > 1:
+                raise ValueError(
+                    f"Multiple probes found in IO core for name '{probe}'."
+                )
+
+            return self._find_probe(probes[0])
+
+        # Check that probe exists in core
+        probes = [o for o in self._outputs if probe is o]
+        probes += [i for i in self._inputs if probe is i]
+
+        if len(probes) == 0:
+            raise KeyError(f"Probe with name '{probe.name}' not found in IO core.")
+
+        if len(probes) > 1:
+            raise ValueError(
+                f"Multiple probes found in IO core for name '{probe.name}'."
+            )
+
+        return probes[0]
+
+    def set_probe(self, probe, value):
+        """
+        Set the value of an output probe on the FPGA.
+
+        This method is blocking.
+
+        Args:
+            probe (str | amaranth.Signal): The output probe to set the value
+                of. This may be either a string containing the name of the
+                probe, or the Amaranth Signal representing the probe itself.
+                Strings are typically used in Verilog-based workflows, and
+                Amaranth Signals are typically used in Amaranth-native designs.
+
+            value (int): The value to set the probe to. This may be either
+                positive or negative, but must fit within the width of the
+                probe.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: The probe was not found to be an output of the IO Core,
+                or many probes were found with the same name.
+
+        """
+
+        probe = self._find_output_probe(probe)
+
         # Check that value isn't too big for the register
         check_value_fits_in_bits(value, len(probe))
 
         # Write value to core
         addrs = self._memory_map[probe.name]["addrs"]
-        datas = value_to_words(value, len(addrs))
+        datas = value_to_words(value, len(addrs), self.bus_width)
         self.interface.write(addrs, datas)
 
         # Pulse strobe register
@@ -295,41 +411,51 @@ class IOCore(MantaCore):
 
         """
 
-        # This function accepts either the name of an output probe, or a
-        # Signal() object that is the output probe itself.
+        probe = self._find_probe(probe)
 
-        if isinstance(probe, str):
-            # The name passed should occur exactly once in the probes
-            probes = [o for o in self._outputs if o.name == probe]
-            probes += [i for i in self._inputs if i.name == probe]
+        # Pulse strobe register
+        self.interface.write(self.base_addr, 0)
+        self.interface.write(self.base_addr, 1)
+        self.interface.write(self.base_addr, 0)
 
-            if len(probes) == 0:
-                raise ValueError(f"Probe with name '{probe}' not found in IO core.")
+        # Get value from buffer
+        datas = self.interface.read(self._memory_map[probe.name]["addrs"])
+        return words_to_value(datas, self.bus_width)
 
-            if len(probes) > 1:
-                raise ValueError(
-                    f"Multiple probes found in IO core for name '{probe}'."
-                )
+    async def aset_probe(self, probe, value):
+        """
+        Set the value of an output probe on the FPGA, without blocking the
+        event loop. This is the asynchronous counterpart to set_probe(), and
+        takes the same arguments.
+        """
+        probe = self._find_output_probe(probe)
 
-            return self.get_probe(probes[0])
+        # Check that value isn't too big for the register
+        check_value_fits_in_bits(value, len(probe))
 
-        # Check that probe exists in core
-        probes = [o for o in self._outputs if probe is o]
-        probes += [i for i in self._inputs if probe is i]
+        # Write value to core
+        addrs = self._memory_map[probe.name]["addrs"]
+        datas = value_to_words(value, len(addrs), self.bus_width)
+        await self.interface.awrite(addrs, datas)
 
-        if len(probes) == 0:
-            raise KeyError(f"Probe with name '{probe.name}' not found in IO core.")
+        # Pulse strobe register
+        await self.interface.awrite(self.base_addr, 0)
+        await self.interface.awrite(self.base_addr, 1)
+        await self.interface.awrite(self.base_addr, 0)
 
-        if len(probes) > 1:
-            raise ValueError(
-                f"Multiple probes found in IO core for name '{probe.name}'."
-            )
+    async def aget_probe(self, probe):
+        """
+        Get the value of an input or output probe on the FPGA, without blocking
+        the event loop. This is the asynchronous counterpart to get_probe(),
+        and takes the same arguments.
+        """
+        probe = self._find_probe(probe)
 
         # Pulse strobe register
-        self.interface.write(self.base_addr, 0)
-        self.interface.write(self.base_addr, 1)
-        self.interface.write(self.base_addr, 0)
+        await self.interface.awrite(self.base_addr, 0)
+        await self.interface.awrite(self.base_addr, 1)
+        await self.interface.awrite(self.base_addr, 0)
 
         # Get value from buffer
-        datas = self.interface.read(self._memory_map[probe.name]["addrs"])
-        return words_to_value(datas)
+        datas = await self.interface.aread(self._memory_map[probe.name]["addrs"])
+        return words_to_value(datas, self.bus_width)
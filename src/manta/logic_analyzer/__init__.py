@@ -1,7 +1,8 @@
 from amaranth import *
+from amaranth.lib.cdc import FFSynchronizer
 
 from manta.logic_analyzer.capture import LogicAnalyzerCapture
-from manta.logic_analyzer.fsm import LogicAnalyzerFSM, TriggerModes
+from manta.logic_analyzer.fsm import LogicAnalyzerFSM, States, TriggerModes
 from manta.logic_analyzer.trigger_block import LogicAnalyzerTriggerBlock
 from manta.memory_core import MemoryCore
 from manta.utils import *
@@ -16,7 +17,7 @@ class LogicAnalyzerCore(MantaCore):
     as methods for reading and writing the value of a register.
     """
 
-    def __init__(self, sample_depth, probes):
+    def __init__(self, sample_depth, probes, domain="sync"):
         """
         Create a Logic Analyzer Core with the given probes and sample depth.
 
@@ -31,28 +32,56 @@ class LogicAnalyzerCore(MantaCore):
             probes (List[Signal]): The signals in your logic that the Logic
                 Analyzer connects to. Each probe is specified with a name and
                 a width.
+
+            domain (Optional[str]): The clock domain that the probes belong
+                to. The probes are sampled, triggered on, and written to the
+                sample memory in this domain, while the core is read and
+                written from the bus in the `sync` domain. Defaults to `sync`.
         """
+        check_clock_domain(domain)
 
         self._sample_depth = sample_depth
         self._probes = probes
+        self._domain = domain
 
         self._trigger_location = sample_depth // 2
         self._trigger_mode = TriggerModes.IMMEDIATE
         self._triggers = []
 
+        # Pulsed when a capture completes, if its samples are to be pushed to
+        # the host
+        self._stream_request = Signal()
+
         # Bus Input/Output
-        self.bus_i = Signal(InternalBus())
-        self.bus_o = Signal(InternalBus())
+        self.bus_width = 16
 
     @property
     def max_addr(self):
         self.define_submodules()
         return self._sample_mem.max_addr
 
+    @property
+    def bus_latency(self):
+        self.define_submodules()
+        return (
+            self._fsm.registers.bus_latency
+            + self._trig_blk.registers.bus_latency
+            + self._sample_mem.bus_latency
+        )
+
     @property
     def top_level_ports(self):
         return self._probes
 
+    @property
+    def stream_sources(self):
+        """
+        Return the data that's pushed to the host once a capture completes, on
+        interfaces that support it. This is the entire sample memory.
+        """
+        start = self._sample_mem.base_addr
+        return [(self._stream_request, start, self._sample_mem.max_addr - start)]
+
     def to_config(self):
         config = {
             "type": "logic_analyzer",
@@ -60,6 +89,9 @@ class LogicAnalyzerCore(MantaCore):
             "probes": {p.name: len(p) for p in self._probes},
         }
 
+        if self._domain != "sync":
+            config["domain"] = self._domain
+
         if self._trigger_mode == TriggerModes.INCREMENTAL:
             config["trigger_mode"] = self._trigger_mode.name.lower()
             config["triggers"] = self._triggers
@@ -81,6 +113,7 @@ class LogicAnalyzerCore(MantaCore):
             "triggers",
             "trigger_location",
             "trigger_mode",
+            "domain",
         ]
         for option in config:
             if option not in valid_options:
@@ -113,7 +146,7 @@ class LogicAnalyzerCore(MantaCore):
 
         # Checks and formatting complete, create LogicAnalyzerCore
         probes = [Signal(width, name=name) for name, width in config["probes"].items()]
-        core = cls(sample_depth, probes)
+        core = cls(sample_depth, probes, config.get("domain", "sync"))
 
         # If any trigger-related configuration was provided, set the triggers with it
         keys = ["trigger_mode", "triggers", "trigger_location"]
@@ -131,19 +164,31 @@ class LogicAnalyzerCore(MantaCore):
             sample_depth=self._sample_depth,
             base_addr=self.base_addr,
             interface=self.interface,
+            bus_width=self.bus_width,
+            bus_addr_width=self.bus_addr_width,
+            bus_pipeline_stages=self.bus_pipeline_stages,
+            domain=self._domain,
         )
 
         self._trig_blk = LogicAnalyzerTriggerBlock(
             probes=self._probes,
             base_addr=self._fsm.max_addr + 1,
             interface=self.interface,
+            bus_width=self.bus_width,
+            bus_addr_width=self.bus_addr_width,
+            bus_pipeline_stages=self.bus_pipeline_stages,
+            domain=self._domain,
         )
 
         self._sample_mem = MemoryCore(
             mode="fpga_to_host",
             width=sum([len(p) for p in self._probes]),
             depth=self._sample_depth,
+            domain=self._domain,
         )
+        self._sample_mem.bus_width = self.bus_width
+        self._sample_mem.bus_addr_width = self.bus_addr_width
+        self._sample_mem.bus_pipeline_stages = self.bus_pipeline_stages
         self._sample_mem.base_addr = self._trig_blk.max_addr + 1
         self._sample_mem.interface = self.interface
 
@@ -173,6 +218,25 @@ class LogicAnalyzerCore(MantaCore):
             self._sample_mem.user_write_enable.eq(self._fsm.write_enable),
         ]
 
+        # Request that the sample memory be pushed to the host as soon as the
+        # capture completes, if streaming is enabled. The state machine's
+        # outputs are brought into the bus's clock domain first.
+        captured = Signal()
+        stream_enable = Signal()
+        if self._domain == "sync":
+            m.d.comb += captured.eq(self._fsm.state == States.CAPTURED)
+            m.d.comb += stream_enable.eq(self._fsm.stream_enable)
+
+        else:
+            status = Cat(self._fsm.state == States.CAPTURED, self._fsm.stream_enable)
+            m.submodules.status_sync = FFSynchronizer(
+                status, Cat(captured, stream_enable)
+            )
+
+        prev_captured = Signal()
+        m.d.sync += prev_captured.eq(captured)
+        m.d.comb += self._stream_request.eq(captured & ~prev_captured & stream_enable)
+
         return m
 
     def _validate_triggers(self, triggers):
@@ -305,15 +369,31 @@ class LogicAnalyzerCore(MantaCore):
         print(" -> Setting trigger location...")
         self._fsm.write_register("trigger_location", self._trigger_location)
 
+        # Have the FPGA push the capture to the host when it completes, if the
+        # interface supports it
+        streaming = hasattr(self.interface, "read_stream")
+        self._fsm.write_register("stream_enable", streaming)
+
         print(" -> Starting capture...")
         self._fsm.start_capture()
 
-        print(" -> Waiting for capture to complete...")
-        self._fsm.wait_for_capture()
+        if streaming:
+            print(" -> Receiving sample memory contents...")
+            ((_, start, n_addrs),) = self.stream_sources
 
-        print(" -> Reading sample memory contents...")
-        addrs = list(range(self._sample_depth))
-        raw_capture = self._sample_mem.read(addrs)
+            def is_complete():
+                return self._fsm.read_register("state") == States.CAPTURED
+
+            datas = self.interface.read_stream(start, n_addrs, is_complete)
+            raw_capture = self._sample_mem._convert_bus_to_user_datas(datas)
+
+        else:
+            print(" -> Waiting for capture to complete...")
+            self._fsm.wait_for_capture()
+
+            print(" -> Reading sample memory contents...")
+            addrs = list(range(self._sample_depth))
+            raw_capture = self._sample_mem.read(addrs)
 
         # Revolve the memory around the read_pointer, such that all the beginning
         # of the capture is at the first element
@@ -328,3 +408,67 @@ class LogicAnalyzerCore(MantaCore):
             data,
             self.interface,
         )
+
+    async def acapture(self):
+        """
+        Performs a capture without blocking the event loop. This is the
+        asynchronous counterpart to capture(), so captures can be taken on
+        many Logic Analyzers at once from a single thread.
+
+        Returns:
+            capture (LogicAnalyzerCapture): A LogicAnalyzerCapture object
+                containing the capture and its metadata.
+        """
+
+        print(" -> Resetting core...")
+        await self._fsm.astop_capture()
+
+        print(" -> Setting triggers...")
+        await self._trig_blk.aset_triggers(self._triggers)
+
+        print(" -> Setting trigger mode...")
+        await self._fsm.awrite_register("trigger_mode", self._trigger_mode)
+
+        print(" -> Setting trigger location...")
+        await self._fsm.awrite_register("trigger_location", self._trigger_location)
+
+        # Have the FPGA push the capture to the host when it completes, if the
+        # interface supports it
+        streaming = hasattr(self.interface, "aread_stream")
+        await self._fsm.awrite_register("stream_enable", streaming)
+
+        print(" -> Starting capture...")
+        await self._fsm.astart_capture()
+
+        if streaming:
+            print(" -> Receiving sample memory contents...")
+            ((_, start, n_addrs),) = self.stream_sources
+
+            async def is_complete():
+                state = await self._fsm.aread_register("state")
+                return state == States.CAPTURED
+
+            datas = await self.interface.aread_stream(start, n_addrs, is_complete)
+            raw_capture = self._sample_mem._convert_bus_to_user_datas(datas)
+
+        else:
+            print(" -> Waiting for capture to complete...")
+            await self._fsm.await_for_capture()
+
+            print(" -> Reading sample memory contents...")
+            addrs = list(range(self._sample_depth))
+            raw_capture = await self._sample_mem.aread(addrs)
+
+        # Revolve the memory around the read_pointer, such that all the beginning
+        # of the capture is at the first element
+        print(" -> Checking read pointer and revolving memory...")
+        read_pointer = await self._fsm.aread_register("read_pointer")
+
+        data = raw_capture[read_pointer:] + raw_capture[:read_pointer]
+        return LogicAnalyzerCapture(
+            self._probes,
+            self._trigger_location,
+            self._trigger_mode,
+            data,
+            self.interface,
+        )
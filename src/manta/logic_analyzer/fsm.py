@@ -1,3 +1,5 @@
+import asyncio
+
 from amaranth import *
 from amaranth.lib.enum import IntEnum
 
@@ -25,8 +27,22 @@ class LogicAnalyzerFSM(Elaboratable):
     memory in each trigger mode (immediate, incremental, single-shot).
     """
 
-    def __init__(self, sample_depth, base_addr, interface):
+    # The time to wait between polls of the state machine from an asyncio
+    # event loop, in seconds, which leaves the link free for other coroutines
+    _POLL_INTERVAL = 0.01
+
+    def __init__(
+        self,
+        sample_depth,
+        base_addr,
+        interface,
+        bus_width=16,
+        bus_addr_width=16,
+        bus_pipeline_stages=0,
+        domain="sync",
+    ):
         self._sample_depth = sample_depth
+        self._domain = domain
 
         # Outputs to rest of Logic Analyzer
         self.trigger = Signal(1)
@@ -47,14 +63,19 @@ class LogicAnalyzerFSM(Elaboratable):
         self.trigger_mode = Signal(TriggerModes)
         self.request_start = Signal()
         self.request_stop = Signal()
+        self.stream_enable = Signal()
         outputs = [
             self.trigger_location,
             self.trigger_mode,
             self.request_start,
             self.request_stop,
+            self.stream_enable,
         ]
 
-        self.registers = IOCore(inputs, outputs)
+        self.registers = IOCore(inputs, outputs, domain=domain)
+        self.registers.bus_width = bus_width
+        self.registers.bus_addr_width = bus_addr_width
+        self.registers.bus_pipeline_stages = bus_pipeline_stages
         self.registers.base_addr = base_addr
         self.registers.interface = interface
 
@@ -80,6 +101,7 @@ class LogicAnalyzerFSM(Elaboratable):
         write_enable = self.write_enable
         write_pointer = self.write_pointer
         read_pointer = self.read_pointer
+        domain = self._domain
 
         prev_request_start = Signal().like(request_start)
         prev_request_stop = Signal().like(request_stop)
@@ -93,53 +115,53 @@ class LogicAnalyzerFSM(Elaboratable):
             m.d.comb += next_write_pointer.eq(write_pointer + 1)
 
         # Rising edge detection for start/stop requests
-        m.d.sync += prev_request_start.eq(request_start)
-        m.d.sync += prev_request_stop.eq(request_stop)
+        m.d[domain] += prev_request_start.eq(request_start)
+        m.d[domain] += prev_request_stop.eq(request_stop)
 
         with m.If(state == States.IDLE):
-            m.d.sync += write_pointer.eq(0)
-            m.d.sync += read_pointer.eq(0)
-            m.d.sync += write_enable.eq(0)
+            m.d[domain] += write_pointer.eq(0)
+            m.d[domain] += read_pointer.eq(0)
+            m.d[domain] += write_enable.eq(0)
 
             with m.If((request_start) & (~prev_request_start)):
                 with m.If(trigger_mode == TriggerModes.IMMEDIATE):
-                    m.d.sync += state.eq(States.CAPTURING)
-                    m.d.sync += write_enable.eq(1)
+                    m.d[domain] += state.eq(States.CAPTURING)
+                    m.d[domain] += write_enable.eq(1)
 
                 with m.Elif(trigger_mode == TriggerModes.INCREMENTAL):
-                    m.d.sync += state.eq(States.CAPTURING)
-                    m.d.sync += write_enable.eq(1)
+                    m.d[domain] += state.eq(States.CAPTURING)
+                    m.d[domain] += write_enable.eq(1)
 
                 with m.Elif(trigger_mode == TriggerModes.SINGLE_SHOT):
                     with m.If(trigger_location == 0):
-                        m.d.sync += state.eq(States.IN_POSITION)
+                        m.d[domain] += state.eq(States.IN_POSITION)
 
                     with m.Else():
-                        m.d.sync += state.eq(States.MOVE_TO_POSITION)
+                        m.d[domain] += state.eq(States.MOVE_TO_POSITION)
 
-                    m.d.sync += write_enable.eq(1)
+                    m.d[domain] += write_enable.eq(1)
 
         with m.Elif(state == States.MOVE_TO_POSITION):
-            m.d.sync += write_pointer.eq(next_write_pointer)
+            m.d[domain] += write_pointer.eq(next_write_pointer)
 
             with m.If(write_pointer == trigger_location - 1):
                 with m.If(self.trigger):
-                    m.d.sync += state.eq(States.CAPTURING)
+                    m.d[domain] += state.eq(States.CAPTURING)
 
                 with m.Else():
-                    m.d.sync += state.eq(States.IN_POSITION)
+                    m.d[domain] += state.eq(States.IN_POSITION)
 
         with m.Elif(state == States.IN_POSITION):
-            m.d.sync += write_pointer.eq(next_write_pointer)
+            m.d[domain] += write_pointer.eq(next_write_pointer)
 
             with m.If(self.trigger):
-                m.d.sync += state.eq(States.CAPTURING)
+                m.d[domain] += state.eq(States.CAPTURING)
 
                 # kind of horrible, i'll get rid of this later...
                 with m.If(write_pointer > trigger_location):
-                    m.d.sync += read_pointer.eq(write_pointer - trigger_location)
+                    m.d[domain] += read_pointer.eq(write_pointer - trigger_location)
                 with m.Else():
-                    m.d.sync += read_pointer.eq(
+                    m.d[domain] += read_pointer.eq(
                         write_pointer - trigger_location + sample_depth
                     )
 
@@ -149,25 +171,25 @@ class LogicAnalyzerFSM(Elaboratable):
             # Non- incremental modes
             with m.If(trigger_mode != TriggerModes.INCREMENTAL):
                 with m.If(next_write_pointer == read_pointer):
-                    m.d.sync += write_enable.eq(0)
-                    m.d.sync += state.eq(States.CAPTURED)
+                    m.d[domain] += write_enable.eq(0)
+                    m.d[domain] += state.eq(States.CAPTURED)
 
                 with m.Else():
-                    m.d.sync += write_pointer.eq(next_write_pointer)
+                    m.d[domain] += write_pointer.eq(next_write_pointer)
 
             # Incremental mode
             with m.Else():
                 with m.If(self.trigger):
                     with m.If(next_write_pointer == read_pointer):
-                        m.d.sync += write_enable.eq(0)
-                        m.d.sync += state.eq(States.CAPTURED)
+                        m.d[domain] += write_enable.eq(0)
+                        m.d[domain] += state.eq(States.CAPTURED)
 
                     with m.Else():
-                        m.d.sync += write_pointer.eq(next_write_pointer)
+                        m.d[domain] += write_pointer.eq(next_write_pointer)
 
         # Regardless of trigger mode, go back to IDLE if request_stop is pulsed
         with m.If((request_stop) & (~prev_request_stop)):
-            m.d.sync += state.eq(States.IDLE)
+            m.d[domain] += state.eq(States.IDLE)
 
         return m
 
@@ -199,3 +221,33 @@ class LogicAnalyzerFSM(Elaboratable):
 
     def write_register(self, name, value):
         return self.registers.set_probe(name, value)
+
+    async def astop_capture(self):
+        # If core is not in IDLE state, request that it return to IDLE
+        state = await self.registers.aget_probe("state")
+        if state != States.IDLE:
+            await self.registers.aset_probe("request_start", 0)
+            await self.registers.aset_probe("request_stop", 0)
+            await self.registers.aset_probe("request_stop", 1)
+            await self.registers.aset_probe("request_stop", 0)
+
+            if await self.registers.aget_probe("state") != States.IDLE:
+                raise ValueError("Logic analyzer did not reset to IDLE state.")
+
+    async def astart_capture(self):
+        # Send a start request to the state machine
+        await self.registers.aset_probe("request_start", 0)
+        await self.registers.aset_probe("request_start", 1)
+        await self.registers.aset_probe("request_start", 0)
+
+    async def await_for_capture(self):
+        # Poll the state machine, and wait for the capture to complete. Other
+        # coroutines can use the link between polls
+        while await self.registers.aget_probe("state") != States.CAPTURED:
+            await asyncio.sleep(self._POLL_INTERVAL)
+
+    async def aread_register(self, name):
+        return await self.registers.aget_probe(name)
+
+    async def awrite_register(self, name, value):
+        return await self.registers.aset_probe(name, value)
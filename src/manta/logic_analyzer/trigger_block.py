@@ -12,15 +12,28 @@ class LogicAnalyzerTriggerBlock(Elaboratable):
     the triggers to be reprogrammed without reflashing the FPGA.
     """
 
-    def __init__(self, probes, base_addr, interface):
+    def __init__(
+        self,
+        probes,
+        base_addr,
+        interface,
+        bus_width=16,
+        bus_addr_width=16,
+        bus_pipeline_stages=0,
+        domain="sync",
+    ):
         # Instantiate a bunch of trigger blocks
         self._probes = probes
+        self._domain = domain
         self._triggers = [LogicAnalyzerTrigger(p) for p in self._probes]
 
         # Make IO core for everything
         ops = [t.op for t in self._triggers]
         args = [t.arg for t in self._triggers]
-        self.registers = IOCore(outputs=ops + args)
+        self.registers = IOCore(outputs=ops + args, domain=domain)
+        self.registers.bus_width = bus_width
+        self.registers.bus_addr_width = bus_addr_width
+        self.registers.bus_pipeline_stages = bus_pipeline_stages
         self.registers.base_addr = base_addr
         self.registers.interface = interface
 
@@ -54,15 +67,35 @@ class LogicAnalyzerTriggerBlock(Elaboratable):
                 self.registers.set_probe(name + "_op", Operations[op].value)
                 self.registers.set_probe(name + "_arg", int(arg))
 
+    async def aset_triggers(self, triggers):
+        # Reset all triggers to disabled with no argument
+        for p in self._probes:
+            await self.registers.aset_probe(p.name + "_op", Operations.DISABLE)
+            await self.registers.aset_probe(p.name + "_arg", 0)
+
+        # Set triggers
+        for trigger in triggers:
+            # Handle triggers that don't need an argument
+            if len(trigger) == 2:
+                name, op = trigger
+                await self.registers.aset_probe(name + "_op", Operations[op].value)
+
+            # Handle triggers that do need an argument
+            elif len(trigger) == 3:
+                name, op, arg = trigger
+                await self.registers.aset_probe(name + "_op", Operations[op].value)
+                await self.registers.aset_probe(name + "_arg", int(arg))
+
     def elaborate(self, platform):
         m = Module()
 
         # Add IO Core as submodule
         m.submodules.registers = self.registers
 
-        # Add triggers as submodules
+        # Add triggers as submodules, clocked alongside the probes
         for t in self._triggers:
-            m.submodules[t.signal.name + "_trigger"] = t
+            trigger = DomainRenamer(self._domain)(t)
+            m.submodules[t.signal.name + "_trigger"] = trigger
 
         m.d.comb += self.trig.eq(Cat([t.triggered for t in self._triggers]).any())
 
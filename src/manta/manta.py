@@ -10,7 +10,60 @@ from manta.utils import *
 
 
 class Manta(Elaboratable):
-    def __init__(self):
+    def __init__(
+        self,
+        bus_topology="chain",
+        bus_width=16,
+        bus_addr_width=16,
+        bus_pipeline_stages=0,
+    ):
+        """
+        Args:
+            bus_topology (Optional[str]): How the cores are connected to the
+                interface. With `chain`, every bus transaction passes through
+                each core in turn, so the time taken to respond grows with the
+                number of cores. With `star`, each transaction is sent directly
+                to the core that owns its address, and the responses are
+                gathered back up, so every transaction takes as long as the
+                slowest core regardless of how many cores there are. Defaults
+                to `chain`.
+
+            bus_width (Optional[int]): The number of bits of data carried by
+                each bus transaction, which must be 16, 32, or 64. Each
+                address in the cores holds this many bits, so wider busses
+                need fewer transactions to read or write wide probes and
+                memories. Defaults to 16.
+
+            bus_addr_width (Optional[int]): The number of bits in each bus
+                address, which must be between 16 and 24. Addresses wider
+                than 16 bits are reached by setting a page register in the
+                interface, which the host does automatically when reading
+                and writing. Defaults to 16.
+
+            bus_pipeline_stages (Optional[int]): The number of registers
+                placed on the bus where it enters each core, ahead of the
+                logic that decodes its address. With the star topology, the
+                bus is also registered on its way out to the cores and back.
+                Each stage adds a clock cycle to the time taken to respond,
+                but shortens the paths that limit the maximum clock
+                frequency of large designs. Defaults to 0.
+        """
+        if bus_topology not in ["chain", "star"]:
+            raise ValueError("Bus topology must be either 'chain' or 'star'.")
+
+        if bus_width not in [16, 32, 64]:
+            raise ValueError("Bus width must be 16, 32, or 64 bits.")
+
+        if not 16 <= bus_addr_width <= 24:
+            raise ValueError("Bus address width must be between 16 and 24 bits.")
+
+        if not isinstance(bus_pipeline_stages, int) or bus_pipeline_stages < 0:
+            raise ValueError("Bus pipeline stages must be a non-negative integer.")
+
+        self._bus_topology = bus_topology
+        self._bus_width = bus_width
+        self._bus_addr_width = bus_addr_width
+        self._bus_pipeline_stages = bus_pipeline_stages
         self._interface = None
         self.cores = CoreContainer(self)
 
@@ -23,10 +76,52 @@ class Manta(Elaboratable):
 
     @interface.setter
     def interface(self, value):
+        value.bus_width = self._bus_width
+        value.bus_addr_width = self._bus_addr_width
         self._interface = value
         for core in self.cores._cores.values():
             core.interface = value
 
+        self._check_addr_space(self.cores._last_used_addr, "interface")
+
+    def _check_addr_space(self, end_addr, allocating):
+        """
+        Make sure that the cores, which use the addresses below `end_addr`,
+        don't overlap the registers that the interface keeps at the top of the
+        address space. The error names the registers in the way when they hold
+        the DHCP status of an EthernetInterface.
+        """
+        base_addr = self.cores._end_addr()
+        if end_addr <= base_addr:
+            return
+
+        message = f"Ran out of address space while allocating {allocating}."
+        if base_addr < 2**self._bus_addr_width:
+            message += (
+                f" The cores use addresses up to 0x{end_addr - 1:X}, but the"
+                f" interface keeps its own registers at 0x{base_addr:X} and above."
+            )
+
+            if isinstance(self._interface, EthernetInterface):
+                message += (
+                    " These hold the status of the DHCP engine, and are removed"
+                    " by setting dhcp_status to False."
+                )
+
+        raise ValueError(message)
+
+    @property
+    def bus_width(self):
+        return self._bus_width
+
+    @property
+    def bus_addr_width(self):
+        return self._bus_addr_width
+
+    @property
+    def bus_pipeline_stages(self):
+        return self._bus_pipeline_stages
+
     @classmethod
     def from_config(cls, config_path):
         # Load config from YAML
@@ -54,8 +149,19 @@ class Manta(Elaboratable):
             if attrs["type"] not in ["logic_analyzer", "io", "memory"]:
                 raise ValueError(f"Unrecognized core type specified for {name}.")
 
+        # Check bus options
+        bus = config.get("bus", {})
+        for option in bus:
+            if option not in ["topology", "width", "addr_width", "pipeline_stages"]:
+                warn(f"Ignoring unrecognized option '{option}' in bus.")
+
         # Make Manta object, and configure it
-        manta = Manta()
+        manta = Manta(
+            bus_topology=bus.get("topology", "chain"),
+            bus_width=bus.get("width", 16),
+            bus_addr_width=bus.get("addr_width", 16),
+            bus_pipeline_stages=bus.get("pipeline_stages", 0),
+        )
 
         # Add interface
         if "uart" in config:
@@ -89,8 +195,30 @@ class Manta(Elaboratable):
         for name, instance in self.cores._cores.items():
             m.submodules[name] = instance
 
-        # Connect first/last cores to interface output/input respectively
         core_instances = list(self.cores._cores.values())
+
+        if self._bus_topology == "star":
+            self._connect_star(m, core_instances)
+
+        else:
+            self._connect_chain(m, core_instances)
+
+        # Let cores push data to the host without being asked, if the
+        # interface supports it
+        if isinstance(self.interface, EthernetInterface):
+            sources = [
+                s for c in core_instances for s in getattr(c, "stream_sources", [])
+            ]
+            self.interface.set_stream_sources(sources)
+
+        return m
+
+    def _connect_chain(self, m, core_instances):
+        """
+        Connect the cores one after another, such that every bus transaction
+        passes through each core on its way back to the interface.
+        """
+        # Connect first/last cores to interface output/input respectively
         first_core = core_instances[0]
         last_core = core_instances[-1]
 
@@ -104,7 +232,54 @@ class Manta(Elaboratable):
 
             m.d.comb += i_plus_oneth_core.bus_i.eq(ith_core.bus_o)
 
-        return m
+    def _connect_star(self, m, core_instances):
+        """
+        Connect the cores side by side, such that every bus transaction is
+        only sent to the core that owns its address. Transactions to addresses
+        that no core owns are passed straight through. The responses of the
+        faster cores are delayed to match the slowest one, so that responses
+        come back in the same order the transactions were made, and never more
+        than one at a time. If the bus is pipelined, it's also registered on
+        its way out to the cores and on its way back, since that's where it
+        fans out to and gathers from every core at once.
+        """
+        bus = self.interface.bus_o
+        layout = InternalBus(self._bus_width, self._bus_addr_width)
+        latency = max(core.bus_latency for core in core_instances)
+        n_stages = 1 if self._bus_pipeline_stages > 0 else 0
+
+        def delay(m, value, n_cycles, name):
+            for i in range(n_cycles):
+                stage = Signal(layout, name=f"{name}_delay_{i}")
+                m.d.sync += stage.eq(value)
+                value = stage
+
+            return value
+
+        hits = []
+        responses = []
+        for name, core in self.cores._cores.items():
+            hit = Signal(name=f"{name}_hit")
+            in_range = (bus.addr >= core.base_addr) & (bus.addr <= core.max_addr)
+            m.d.comb += hit.eq(bus.valid & in_range)
+            request = Signal(layout, name=f"{name}_request")
+            m.d.comb += request.eq(Mux(hit, bus, 0))
+            m.d.comb += core.bus_i.eq(delay(m, request, n_stages, f"{name}_request"))
+            hits.append(hit)
+
+            response = delay(m, core.bus_o, latency - core.bus_latency, name)
+            responses.append(Mux(response.valid, response, 0))
+
+        miss = Signal(layout, name="miss")
+        m.d.comb += miss.eq(Mux(Cat(hits).any(), 0, bus))
+        responses.append(delay(m, miss, latency + n_stages, "miss").as_value())
+
+        # At most one of the responses is valid at once, and the rest are zero
+        response = responses[0]
+        for r in responses[1:]:
+            response = response | r
+
+        m.d.comb += self.interface.bus_i.eq(delay(m, response, n_stages, "response"))
 
     def get_top_level_ports(self):
         """
@@ -146,6 +321,18 @@ class Manta(Elaboratable):
 
         config = {}
 
+        if self._bus_topology != "chain":
+            config.setdefault("bus", {})["topology"] = self._bus_topology
+
+        if self._bus_width != 16:
+            config.setdefault("bus", {})["width"] = self._bus_width
+
+        if self._bus_addr_width != 16:
+            config.setdefault("bus", {})["addr_width"] = self._bus_addr_width
+
+        if self._bus_pipeline_stages != 0:
+            config.setdefault("bus", {})["pipeline_stages"] = self._bus_pipeline_stages
+
         if self.cores._cores:
             config["cores"] = {}
             for name, instance in self.cores._cores.items():
@@ -13,7 +13,7 @@ class MemoryCore(MantaCore):
     and the other provided to user logic.
     """
 
-    def __init__(self, mode, width, depth):
+    def __init__(self, mode, width, depth, domain="sync"):
         """
         Create a Memory Core with the given width and depth.
 
@@ -32,16 +32,22 @@ class MemoryCore(MantaCore):
             width (int): The width of the memory, in bits.
 
             depth (int): The depth of the memory, in entries.
+
+            domain (Optional[str]): The clock domain of the user logic that
+                accesses the memory. The memory's ports for the user logic
+                are clocked by this domain, while its ports for the bus stay
+                in the `sync` domain, so the memory can be used to pass data
+                between the two. Defaults to `sync`.
         """
+        check_clock_domain(domain)
+
         self._mode = mode
         self._width = width
         self._depth = depth
-
-        self._n_mems = ceil(self._width / 16)
+        self._domain = domain
 
         # Bus Connections
-        self.bus_i = Signal(InternalBus())
-        self.bus_o = Signal(InternalBus())
+        self.bus_width = 16
 
         # User Ports
         if self._mode == "fpga_to_host":
@@ -74,12 +80,28 @@ class MemoryCore(MantaCore):
                 self.user_write_enable,
             ]
 
-        # Define memories
-        n_full = self._width // 16
-        n_partial = self._width % 16
+    @property
+    def top_level_ports(self):
+        return self._top_level_ports
+
+    @property
+    def _n_mems(self):
+        """
+        Return the number of memories the core is split into, each of which
+        is as wide as the bus, except for the last.
+        """
+        return ceil(self._width / self.bus_width)
+
+    def _define_mems(self):
+        """
+        Define the memories that hold the contents of the core. These are
+        made when the core is elaborated, once the width of the bus is known.
+        """
+        n_full = self._width // self.bus_width
+        n_partial = self._width % self.bus_width
 
         self._mems = [
-            Memory(shape=16, depth=self._depth, init=[0] * self._depth)
+            Memory(shape=self.bus_width, depth=self._depth, init=[0] * self._depth)
             for _ in range(n_full)
         ]
         if n_partial > 0:
@@ -87,26 +109,31 @@ class MemoryCore(MantaCore):
                 Memory(shape=n_partial, depth=self._depth, init=[0] * self._depth)
             ]
 
-    @property
-    def top_level_ports(self):
-        return self._top_level_ports
-
     @property
     def max_addr(self):
         return self.base_addr + (self._depth * self._n_mems)
 
+    @property
+    def bus_latency(self):
+        return 4 + self.bus_pipeline_stages
+
     def to_config(self):
-        return {
+        config = {
             "type": "memory",
             "mode": self._mode,
             "width": self._width,
             "depth": self._depth,
         }
 
+        if self._domain != "sync":
+            config["domain"] = self._domain
+
+        return config
+
     @classmethod
     def from_config(cls, config):
         # Check for unrecognized options
-        valid_options = ["type", "depth", "width", "mode"]
+        valid_options = ["type", "depth", "width", "mode", "domain"]
         for option in config:
             if option not in valid_options:
                 warn(f"Ignoring unrecognized option '{option}' in memory core.")
@@ -141,48 +168,43 @@ class MemoryCore(MantaCore):
         if mode not in ["fpga_to_host", "host_to_fpga", "bidirectional"]:
             raise ValueError("Unrecognized mode provided to memory core.")
 
-        return cls(mode, width, depth)
+        return cls(mode, width, depth, config.get("domain", "sync"))
 
-    def _tie_mems_to_bus(self, m):
-        for i, mem in enumerate(self._mems):
+    def _tie_mems_to_bus(self, m, bus, hits):
+        for i, (mem, hit) in enumerate(zip(self._mems, hits)):
             # Compute address range corresponding to this chunk of memory
             start_addr = self.base_addr + (i * self._depth)
-            stop_addr = start_addr + self._depth - 1
+
+            # Carry whether each transaction is for this chunk of memory down
+            # the pipeline alongside it, rather than comparing addresses again
+            hit_pipe = [Signal(name=f"mem_{i}_hit_{j}") for j in range(2)]
+            m.d.sync += hit_pipe[0].eq(hit)
+            m.d.sync += hit_pipe[1].eq(hit_pipe[0])
 
             if self._mode == "fpga_to_host":
                 read_port = mem.read_port()
                 m.d.comb += read_port.en.eq(1)
 
                 # Throw BRAM operations into the front of the pipeline
-                with m.If(
-                    (self.bus_i.valid)
-                    & (self.bus_i.addr >= start_addr)
-                    & (self.bus_i.addr <= stop_addr)
-                ):
-                    m.d.sync += read_port.addr.eq(self.bus_i.addr - start_addr)
+                with m.If(bus.valid & hit):
+                    m.d.sync += read_port.addr.eq(bus.addr - start_addr)
 
-                # Pull BRAM reads from the back of the pipeline
+                # Pull BRAM reads into the pipeline as soon as they're ready,
+                # before the next read changes the BRAM's address
                 with m.If(
-                    (self._bus_pipe[2].valid)
-                    & (~self._bus_pipe[2].rw)
-                    & (self._bus_pipe[2].addr >= start_addr)
-                    & (self._bus_pipe[2].addr <= stop_addr)
+                    (self._bus_pipe[1].valid) & (~self._bus_pipe[1].rw) & (hit_pipe[1])
                 ):
-                    m.d.sync += self.bus_o.data.eq(read_port.data)
+                    m.d.sync += self._bus_pipe[2].data.eq(read_port.data)
 
             elif self._mode == "host_to_fpga":
                 write_port = mem.write_port()
                 m.d.sync += write_port.en.eq(0)
 
                 # Throw BRAM operations into the front of the pipeline
-                with m.If(
-                    (self.bus_i.valid)
-                    & (self.bus_i.addr >= start_addr)
-                    & (self.bus_i.addr <= stop_addr)
-                ):
-                    m.d.sync += write_port.addr.eq(self.bus_i.addr - start_addr)
-                    m.d.sync += write_port.data.eq(self.bus_i.data)
-                    m.d.sync += write_port.en.eq(self.bus_i.rw)
+                with m.If(bus.valid & hit):
+                    m.d.sync += write_port.addr.eq(bus.addr - start_addr)
+                    m.d.sync += write_port.data.eq(bus.data)
+                    m.d.sync += write_port.en.eq(bus.rw)
 
             elif self._mode == "bidirectional":
                 read_port = mem.read_port()
@@ -192,39 +214,35 @@ class MemoryCore(MantaCore):
                 m.d.sync += write_port.en.eq(0)
 
                 # Throw BRAM operations into the front of the pipeline
+                with m.If(bus.valid & hit):
+                    m.d.sync += read_port.addr.eq(bus.addr - start_addr)
+                    m.d.sync += write_port.addr.eq(bus.addr - start_addr)
+                    m.d.sync += write_port.data.eq(bus.data)
+                    m.d.sync += write_port.en.eq(bus.rw)
+
+                # Pull BRAM reads into the pipeline as soon as they're ready,
+                # before the next read changes the BRAM's address
                 with m.If(
-                    (self.bus_i.valid)
-                    & (self.bus_i.addr >= start_addr)
-                    & (self.bus_i.addr <= stop_addr)
+                    (self._bus_pipe[1].valid) & (~self._bus_pipe[1].rw) & (hit_pipe[1])
                 ):
-                    m.d.sync += read_port.addr.eq(self.bus_i.addr - start_addr)
-                    m.d.sync += write_port.addr.eq(self.bus_i.addr - start_addr)
-                    m.d.sync += write_port.data.eq(self.bus_i.data)
-                    m.d.sync += write_port.en.eq(self.bus_i.rw)
-
-                # Pull BRAM reads from the back of the pipeline
-                with m.If(
-                    (self._bus_pipe[2].valid)
-                    & (~self._bus_pipe[2].rw)
-                    & (self._bus_pipe[2].addr >= start_addr)
-                    & (self._bus_pipe[2].addr <= stop_addr)
-                ):
-                    m.d.sync += self.bus_o.data.eq(read_port.data)
+                    m.d.sync += self._bus_pipe[2].data.eq(read_port.data)
 
     def _tie_mems_to_user_logic(self, m):
         # Handle write ports
         if self._mode in ["fpga_to_host", "bidirectional"]:
             for i, mem in enumerate(self._mems):
-                write_port = mem.write_port()
+                write_port = mem.write_port(domain=self._domain)
                 m.d.comb += write_port.addr.eq(self.user_addr)
-                m.d.comb += write_port.data.eq(self.user_data_in[16 * i : 16 * (i + 1)])
+                m.d.comb += write_port.data.eq(
+                    self.user_data_in[self.bus_width * i : self.bus_width * (i + 1)]
+                )
                 m.d.comb += write_port.en.eq(self.user_write_enable)
 
         # Handle read ports
         if self._mode in ["host_to_fpga", "bidirectional"]:
             read_datas = []
             for i, mem in enumerate(self._mems):
-                read_port = mem.read_port()
+                read_port = mem.read_port(domain=self._domain)
                 m.d.comb += read_port.addr.eq(self.user_addr)
                 m.d.comb += read_port.en.eq(1)
                 read_datas.append(read_port.data)
@@ -235,19 +253,27 @@ class MemoryCore(MantaCore):
         m = Module()
 
         # Add memories as submodules
+        self._define_mems()
         for i, mem in enumerate(self._mems):
             m.submodules[f"mem_{i}"] = mem
 
+        # Decode the address range of each memory, pipelining the bus if needed
+        starts = [self.base_addr + (i * self._depth) for i in range(self._n_mems)]
+        ranges = [(start, start + self._depth - 1) for start in starts]
+        bus, hits = self._pipeline_bus(m, ranges)
+
         # Pipeline the bus to accommodate the two clock-cycle delay in the memories
-        self._bus_pipe = [Signal(InternalBus()) for _ in range(3)]
-        m.d.sync += self._bus_pipe[0].eq(self.bus_i)
+        self._bus_pipe = [
+            Signal(InternalBus(self.bus_width, self.bus_addr_width)) for _ in range(3)
+        ]
+        m.d.sync += self._bus_pipe[0].eq(bus)
 
         for i in range(1, 3):
             m.d.sync += self._bus_pipe[i].eq(self._bus_pipe[i - 1])
 
         m.d.sync += self.bus_o.eq(self._bus_pipe[2])
 
-        self._tie_mems_to_bus(m)
+        self._tie_mems_to_bus(m, bus, hits)
         self._tie_mems_to_user_logic(m)
         return m
 
@@ -257,17 +283,53 @@ class MemoryCore(MantaCore):
         core with base address 10 and width 33, reading from address 4 is
         actually a read from address 14 and address 14 + depth, and address
         14 + (2 * depth).
+
+        The addresses in the first memory are listed first, followed by those
+        in the second, and so on. This keeps consecutive user addresses at
+        consecutive bus addresses, so they can be accessed in bursts.
         """
         if isinstance(addrs, int):
             return self._convert_user_to_bus_addr([addrs])[0]
 
         bus_addrs = []
-        for addr in addrs:
-            for i in range(len(self._mems)):
+        for i in range(self._n_mems):
+            for addr in addrs:
                 bus_addrs.append(self.base_addr + addr + (i * self._depth))
 
         return bus_addrs
 
+    def _convert_bus_to_user_datas(self, datas):
+        """
+        Combine the data read from the bus addresses returned by
+        _convert_user_to_bus_addr() into the data at each user address.
+        """
+        n_addrs = len(datas) // self._n_mems
+        columns = split_into_chunks(datas, n_addrs) if n_addrs else []
+        return [words_to_value(list(words), self.bus_width) for words in zip(*columns)]
+
+    def _convert_user_to_bus_writes(self, addrs, datas):
+        """
+        Check that a list of user addresses and data are all integers, and
+        convert them to the addresses and data written on the bus.
+        """
+
+        # Make sure address and datas are all integers
+        if not isinstance(addrs, list) or not isinstance(datas, list):
+            raise TypeError(
+                "Write addresses and data must be an integer or list of integers."
+            )
+
+        if not all(isinstance(a, int) for a in addrs):
+            raise TypeError("Write addresses must be all be integers.")
+
+        if not all(isinstance(d, int) for d in datas):
+            raise TypeError("Write data must all be integers.")
+
+        bus_addrs = self._convert_user_to_bus_addr(addrs)
+        words = [value_to_words(d, self._n_mems, self.bus_width) for d in datas]
+        bus_datas = [w[i] for i in range(self._n_mems) for w in words]
+        return bus_addrs, bus_datas
+
     def read(self, addrs):
         """
         Read the data stored in the Memory Core at one or many address.
@@ -300,8 +362,7 @@ class MemoryCore(MantaCore):
 
         bus_addrs = self._convert_user_to_bus_addr(addrs)
         datas = self.interface.read(bus_addrs)
-        data_chunks = split_into_chunks(datas, self._n_mems)
-        return [words_to_value(chunk) for chunk in data_chunks]
+        return self._convert_bus_to_user_datas(datas)
 
     def write(self, addrs, datas):
         """
@@ -332,18 +393,38 @@ class MemoryCore(MantaCore):
         if isinstance(addrs, int) and isinstance(datas, int):
             return self.write([addrs], [datas])
 
-        # Make sure address and datas are all integers
-        if not isinstance(addrs, list) or not isinstance(datas, list):
-            raise TypeError(
-                "Write addresses and data must be an integer or list of integers."
-            )
+        bus_addrs, bus_datas = self._convert_user_to_bus_writes(addrs, datas)
+        self.interface.write(bus_addrs, bus_datas)
 
-        if not all(isinstance(a, int) for a in addrs):
-            raise TypeError("Write addresses must be all be integers.")
+    async def aread(self, addrs):
+        """
+        Read the data stored in the Memory Core at one or many address, without
+        blocking the event loop. This is the asynchronous counterpart to
+        read(), and takes the same arguments.
+        """
 
-        if not all(isinstance(d, int) for d in datas):
-            raise TypeError("Write data must all be integers.")
+        # Handle a single integer address
+        if isinstance(addrs, int):
+            return (await self.aread([addrs]))[0]
+
+        # Make sure all list elements are integers
+        if not all(isinstance(a, int) for a in addrs):
+            raise TypeError("Read address must be an integer or list of integers.")
 
         bus_addrs = self._convert_user_to_bus_addr(addrs)
-        bus_datas = [word for d in datas for word in value_to_words(d, self._n_mems)]
-        self.interface.write(bus_addrs, bus_datas)
+        datas = await self.interface.aread(bus_addrs)
+        return self._convert_bus_to_user_datas(datas)
+
+    async def awrite(self, addrs, datas):
+        """
+        Write data to the Memory core at one or many addresses, without
+        blocking the event loop. This is the asynchronous counterpart to
+        write(), and takes the same arguments.
+        """
+
+        # Handle a single integer address and data
+        if isinstance(addrs, int) and isinstance(datas, int):
+            return await self.awrite([addrs], [datas])
+
+        bus_addrs, bus_datas = self._convert_user_to_bus_writes(addrs, datas)
+        await self.interface.awrite(bus_addrs, bus_datas)
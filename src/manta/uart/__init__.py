@@ -1,6 +1,14 @@
+import asyncio
+import threading
+import time
+
 from amaranth import *
-from serial import Serial
+from amaranth.lib.enum import IntEnum
+from amaranth.lib.fifo import SyncFIFOBuffered
+from serial import Serial, SerialException
 
+from manta.io_core import IOCore
+from manta.uart.codec import *
 from manta.uart.receive_bridge import ReceiveBridge
 from manta.uart.receiver import UARTReceiver
 from manta.uart.transmit_bridge import TransmitBridge
@@ -8,13 +16,35 @@ from manta.uart.transmitter import UARTTransmitter
 from manta.utils import *
 
 
+class BaudControl(IntEnum):
+    SWITCH = 1
+    CONFIRM = 2
+
+
 class UARTInterface(Elaboratable):
     """
     A synthesizable module for UART communication between a host machine and
     the FPGA.
     """
 
-    def __init__(self, port, baudrate, clock_freq, stall_interval=16, chunk_size=256):
+    # The time in seconds that the FPGA waits for the host to confirm a change
+    # of baudrate, before reverting to the previous baudrate
+    _BAUD_SWITCH_TIMEOUT = 0.25
+
+    def __init__(
+        self,
+        port,
+        baudrate,
+        clock_freq,
+        stall_interval=16,
+        chunk_size=256,
+        protocol="ascii",
+        chunks_in_flight=1,
+        rtscts=False,
+        rx_fifo_depth=None,
+        tx_fifo_depth=0,
+        programmable_baudrate=False,
+    ):
         """
         This function is the main mechanism for configuring a UART Interface
         in an Amaranth-native design.
@@ -52,6 +82,47 @@ class UARTInterface(Elaboratable):
                 that bytes are being dropped, and decreasing `stall_interval`
                 did not work.
 
+            protocol (Optional[str]): The message format used on the wire.
+                Must be either `ascii` or `binary`. The ASCII protocol encodes
+                each message as human-readable hex characters terminated by
+                an EOL, which is easy to debug with a serial terminal. The
+                binary protocol sends addresses and data as raw bytes, which
+                makes messages less than half as long. Defaults to `ascii`.
+
+            chunks_in_flight (Optional[int]): The number of chunks of read
+                requests that may be sent to the FPGA before their responses
+                have been received. If greater than one, a background thread
+                reads responses from the serial port as they arrive, so that
+                the link isn't left idle while the host waits for each chunk.
+                Defaults to 1, which waits for every chunk's responses before
+                sending the next.
+
+            rtscts (Optional[bool]): Whether to use hardware flow control. If
+                enabled, the interface gains `rts` and `cts` ports, which must
+                be connected to the RTS and CTS pins of the USB-Serial adapter.
+                Both are active-low, as on the wire. The FPGA deasserts `cts`
+                when its receive buffer is nearly full, and stops transmitting
+                while the host deasserts `rts`. Stall bytes are not sent when
+                flow control is enabled, so `stall_interval` is ignored.
+                Defaults to False.
+
+            rx_fifo_depth (Optional[int]): The number of received bytes that
+                can be buffered onboard the FPGA before they're decoded. If
+                set to 0, bytes are decoded as soon as they're received.
+                Defaults to 16 if `rtscts` is enabled, and 0 otherwise.
+
+            tx_fifo_depth (Optional[int]): The number of bytes of read
+                responses that can be buffered onboard the FPGA before they're
+                transmitted. This lets responses be picked up from the bus
+                while the previous ones are still being sent. If set to 0,
+                each response is sent directly from the bus. Defaults to 0.
+
+            programmable_baudrate (Optional[bool]): Whether the baudrate can be
+                changed at runtime. If enabled, the FPGA starts at `baudrate`,
+                and the host can switch to a faster rate with
+                `negotiate_baudrate()`. The baudrate is set with a fractional
+                divider, so it can match any rate closely. Defaults to False.
+
         Raises:
             ValueError: The baudrate is not achievable with the clock frequency
                 provided, or the clock frequency or baudrate is invalid.
@@ -64,15 +135,76 @@ class UARTInterface(Elaboratable):
         self._clocks_per_baud = int(self._clock_freq // self._baudrate)
         self._chunk_size = chunk_size
         self._stall_interval = stall_interval
+        self._protocol = protocol
+        self._chunks_in_flight = chunks_in_flight
+        self._rtscts = rtscts
+        self._rx_fifo_depth = rx_fifo_depth
+        self._tx_fifo_depth = tx_fifo_depth
+        self._programmable_baudrate = programmable_baudrate
         self._check_config()
 
         # Top-Level Ports
         self.rx = Signal()
         self.tx = Signal()
 
+        if self._rtscts:
+            self.rts = Signal()
+            self.cts = Signal()
+
+        self._bus_width = 16
+        self._bus_addr_width = 16
         self.bus_o = Signal(InternalBus())
         self.bus_i = Signal(InternalBus())
 
+        # Registers used by the interface itself, which are placed at the top
+        # of the address space
+        self._rx_overflows = Signal(16, name="rx_overflows")
+        self._tx_overflows = Signal(16, name="tx_overflows")
+        self._registers = None
+
+        if self._programmable_baudrate:
+            init = self._get_divider(self._baudrate)
+            self._divider = Signal(32, name="clocks_per_baud", init=init)
+
+        if self._programmable_baudrate or self._fifo_depths != (0, 0):
+            self._define_registers()
+
+    def _define_registers(self):
+        """
+        Define the registers used by the interface itself. The number of bytes
+        dropped since the FPGA was reset, and the current baud divider are
+        read through an IOCore. If the baudrate is programmable, the IOCore is
+        preceded by three write-only registers that are handled directly by
+        the interface. These contain the lower and upper words of a new baud
+        divider, followed by a register that switches to the new divider or
+        confirms the switch when written to.
+        """
+        inputs = [self._rx_overflows, self._tx_overflows]
+        n_baud_addrs = 0
+
+        if self._programmable_baudrate:
+            inputs.append(self._divider)
+            n_baud_addrs = 3
+
+        self._registers = IOCore(inputs=inputs)
+        self._registers.bus_width = self._bus_width
+        self._registers.bus_addr_width = self._bus_addr_width
+        self._registers.interface = self
+
+        # Accessing max_addr builds the memory map at the current base_addr
+        self._registers.base_addr = 0
+        n_addrs = n_baud_addrs + self._registers.max_addr + 1
+        self._base_addr = (2**self._bus_addr_width) - n_addrs
+        self._registers.base_addr = self._base_addr + n_baud_addrs
+        _ = self._registers.max_addr
+
+    def _get_divider(self, baudrate):
+        """
+        Return the number of clock cycles per baud needed to achieve the given
+        baudrate, as a fixed-point number with 16 fractional bits.
+        """
+        return round(self._clock_freq * 2**16 / baudrate)
+
     @classmethod
     def from_config(cls, config):
         integer_options = [
@@ -80,10 +212,19 @@ class UARTInterface(Elaboratable):
             "baudrate",
             "chunk_size",
             "stall_interval",
+            "chunks_in_flight",
+            "rx_fifo_depth",
+            "tx_fifo_depth",
         ]
 
         string_options = [
             "port",
+            "protocol",
+        ]
+
+        boolean_options = [
+            "rtscts",
+            "programmable_baudrate",
         ]
 
         sanitized_config = {}
@@ -99,6 +240,9 @@ class UARTInterface(Elaboratable):
             elif option in string_options:
                 sanitized_config[option] = config[option]
 
+            elif option in boolean_options:
+                sanitized_config[option] = config[option]
+
             else:
                 warn(
                     f"Ignoring unrecognized option '{option}' in UART interface config."
@@ -107,7 +251,7 @@ class UARTInterface(Elaboratable):
         return cls(**sanitized_config)
 
     def to_config(self):
-        return {
+        config = {
             "port": self._port,
             "baudrate": self._baudrate,
             "clock_freq": self._clock_freq,
@@ -115,6 +259,26 @@ class UARTInterface(Elaboratable):
             "chunk_size": self._chunk_size,
         }
 
+        if self._protocol != "ascii":
+            config["protocol"] = self._protocol
+
+        if self._chunks_in_flight != 1:
+            config["chunks_in_flight"] = self._chunks_in_flight
+
+        if self._rtscts:
+            config["rtscts"] = True
+
+        if self._rx_fifo_depth is not None:
+            config["rx_fifo_depth"] = self._rx_fifo_depth
+
+        if self._tx_fifo_depth != 0:
+            config["tx_fifo_depth"] = self._tx_fifo_depth
+
+        if self._programmable_baudrate:
+            config["programmable_baudrate"] = True
+
+        return config
+
     def _check_config(self):
         # Ensure a serial port has been given
         if self._port is None:
@@ -134,6 +298,49 @@ class UARTInterface(Elaboratable):
         if self._baudrate <= 0:
             raise ValueError("Non-positive baudrate provided to UART interface.")
 
+        # Check that the protocol is recognized
+        if self._protocol not in ["ascii", "binary"]:
+            raise ValueError(
+                f"Unrecognized protocol '{self._protocol}' provided to UART interface."
+            )
+
+        # Check that at least one chunk may be in flight
+        if self._chunks_in_flight < 1:
+            raise ValueError(
+                "Number of chunks in flight in UART interface must be at least 1."
+            )
+
+        # Check that flow control is either enabled or disabled
+        if not isinstance(self._rtscts, bool):
+            raise ValueError("Option rtscts in UART interface must be a boolean.")
+
+        # Check that the FIFOs are deep enough
+        rx_fifo_depth, tx_fifo_depth = self._fifo_depths
+
+        if (rx_fifo_depth < 0) or (tx_fifo_depth < 0):
+            raise ValueError("Negative FIFO depth provided to UART interface.")
+
+        if self._rtscts and (rx_fifo_depth < 8):
+            raise ValueError(
+                "Receive FIFO in UART interface must be at least 8 bytes deep to use flow control."
+            )
+
+        # Check that programmable baudrate is either enabled or disabled
+        if not isinstance(self._programmable_baudrate, bool):
+            raise ValueError(
+                "Option programmable_baudrate in UART interface must be a boolean."
+            )
+
+        # A fractional divider can match the baudrate almost exactly, but the
+        # UART needs a few clock cycles per baud to sample bits properly
+        if self._programmable_baudrate:
+            if not 4 <= self._clock_freq / self._baudrate < 2**16:
+                raise ValueError(
+                    "UART interface is unable to match targeted baudrate with specified clock frequency."
+                )
+
+            return
+
         # Confirm the actual baudrate is within 5% of the target baudrate
         actual_baudrate = self._clock_freq / self._clocks_per_baud
         error = 100 * abs(actual_baudrate - self._baudrate) / self._baudrate
@@ -154,7 +361,9 @@ class UARTInterface(Elaboratable):
             return self._serial_device
 
         if self._port != "auto":
-            self._serial_device = Serial(self._port, self._baudrate, timeout=1)
+            self._serial_device = Serial(
+                self._port, self._baudrate, timeout=1, rtscts=self._rtscts
+            )
             return self._serial_device
 
         # Try to autodetect which port to use based on the PID/VID of the device attached.
@@ -190,14 +399,94 @@ class UARTInterface(Elaboratable):
         else:
             chosen_port = ports[1].device
 
-        self._serial_device = Serial(chosen_port, self._baudrate, timeout=1)
+        self._serial_device = Serial(
+            chosen_port, self._baudrate, timeout=1, rtscts=self._rtscts
+        )
         return self._serial_device
 
+    @property
+    def _fifo_depths(self):
+        """
+        Return the depths of the receive and transmit FIFOs, where a depth of
+        zero indicates that no FIFO is used.
+        """
+        rx_fifo_depth = self._rx_fifo_depth
+        if rx_fifo_depth is None:
+            rx_fifo_depth = 16 if self._rtscts else 0
+
+        return rx_fifo_depth, self._tx_fifo_depth
+
+    @property
+    def base_addr(self):
+        """
+        Return the lowest address used by the interface's own registers. Cores
+        must be placed below this address.
+        """
+        if self._registers is None:
+            return 2**self._bus_addr_width
+
+        return self._base_addr
+
+    @property
+    def bus_width(self):
+        """
+        Return the number of bits of data carried by each bus transaction.
+        """
+        return self._bus_width
+
+    @bus_width.setter
+    def bus_width(self, value):
+        self._bus_width = value
+        self._define_bus()
+
+    @property
+    def bus_addr_width(self):
+        """
+        Return the number of bits in each bus address.
+        """
+        return self._bus_addr_width
+
+    @bus_addr_width.setter
+    def bus_addr_width(self, value):
+        self._bus_addr_width = value
+        self._define_bus()
+
+    def _define_bus(self):
+        # The bus connections and the interface's registers are remade whenever
+        # the bus changes shape
+        layout = InternalBus(self._bus_width, self._bus_addr_width)
+        self.bus_o = Signal(layout)
+        self.bus_i = Signal(layout)
+
+        if self._registers is not None:
+            self._define_registers()
+
+    def get_overflow_counts(self):
+        """
+        Return the number of bytes that were dropped by the FPGA since it was
+        last reset, as a tuple of the bytes dropped while receiving and the
+        bytes dropped while transmitting. Both saturate at 0xFFFF.
+
+        Raises:
+            ValueError: The interface has no FIFOs, and so doesn't count the
+                number of bytes dropped.
+
+        """
+        if self._registers is None:
+            raise ValueError("UART interface only counts overflows if it has FIFOs.")
+
+        rx_overflows = self._registers.get_probe(self._rx_overflows)
+        tx_overflows = self._registers.get_probe(self._tx_overflows)
+        return rx_overflows, tx_overflows
+
     def get_top_level_ports(self):
         """
         Return the Amaranth signals that should be included as ports in the
         top-level Manta module.
         """
+        if self._rtscts:
+            return [self.rx, self.tx, self.rts, self.cts]
+
         return [self.rx, self.tx]
 
     @property
@@ -224,23 +513,23 @@ class UARTInterface(Elaboratable):
         # buffer from overflowing and dropping bytes, as the FPGA will send
         # responses instantly after it's received a request.
 
-        set = self._get_serial_device()
-        addr_chunks = split_into_chunks(addrs, self._chunk_size)
-        data = []
+        # Runs of consecutive addresses are read with burst read requests,
+        # which ask the FPGA to read many addresses with a single request.
 
-        for addr_chunk in addr_chunks:
-            # Encode addrs into read requests
-            bytes_out = "".join([f"R{a:04X}\r\n" for a in addr_chunk])
+        transfers = self._plan_read_transfers(addrs)
 
-            # Add a \n after every N packets, see:
-            # https://github.com/fischermoseley/manta/issues/18
-            bytes_out = split_into_chunks(bytes_out, 7 * self._stall_interval)
-            bytes_out = "\n".join(bytes_out)
+        if self._chunks_in_flight > 1:
+            return self._read_pipelined(transfers)
 
-            set.write(bytes_out.encode("ascii"))
+        set = self._get_serial_device()
+        data = []
+
+        for singles, burst in transfers:
+            set.write(self._encode_read_transfer(singles, burst))
 
-            # Read responses have the same length as read requests
-            bytes_expected = 7 * len(addr_chunk)
+            # Read responses are the same length regardless of address
+            length = response_length(self._protocol, self._bus_width)
+            bytes_expected = length * (len(singles) + len(burst))
             bytes_in = set.read(bytes_expected)
 
             if len(bytes_in) != bytes_expected:
@@ -248,13 +537,178 @@ class UARTInterface(Elaboratable):
                     f"Only got {len(bytes_in)} out of {bytes_expected} bytes."
                 )
 
-            # Split received bytes into individual responses and decode
-            responses = split_into_chunks(bytes_in, 7)
-            data_chunk = [self._decode_read_response(r) for r in responses]
-            data += data_chunk
+            # Decode all the received responses at once
+            data += decode_read_responses(bytes_in, self._protocol, self._bus_width)
 
         return data
 
+    def _read_pipelined(self, transfers):
+        """
+        Perform a set of read transfers while keeping up to `chunks_in_flight`
+        of them outstanding at once. A background thread continuously drains
+        the serial port into a buffer, so the host's input buffer can't
+        overflow while the next transfers are being sent.
+        """
+        set = self._get_serial_device()
+
+        ends = self._get_transfer_ends(transfers)
+        bytes_expected = ends[-1] if ends else 0
+        bytes_in = bytearray()
+        drained = threading.Condition()
+        stopped = False
+
+        def drain():
+            nonlocal stopped
+
+            try:
+                while len(bytes_in) < bytes_expected:
+                    # Wait for at least one byte, then grab everything available
+                    n_bytes = min(
+                        max(set.in_waiting, 1), bytes_expected - len(bytes_in)
+                    )
+                    received = set.read(n_bytes)
+
+                    with drained:
+                        bytes_in.extend(received)
+                        drained.notify_all()
+
+                    # Nothing arrived before the serial port timed out
+                    if not received:
+                        break
+
+            finally:
+                with drained:
+                    stopped = True
+                    drained.notify_all()
+
+        def wait_for(n_bytes):
+            with drained:
+                drained.wait_for(lambda: len(bytes_in) >= n_bytes or stopped)
+
+        thread = threading.Thread(target=drain, daemon=True)
+        thread.start()
+
+        for i, (singles, burst) in enumerate(transfers):
+            # Wait for the oldest transfer to complete if too many are in flight
+            if i >= self._chunks_in_flight:
+                wait_for(ends[i - self._chunks_in_flight])
+
+            # The FPGA ignores any bytes it receives while responding to a burst
+            # read, so the transfer after one can't be sent until it's complete
+            if i > 0 and transfers[i - 1][1]:
+                wait_for(ends[i - 1])
+
+            if stopped:
+                break
+
+            set.write(self._encode_read_transfer(singles, burst))
+
+        thread.join()
+
+        if len(bytes_in) != bytes_expected:
+            raise ValueError(f"Only got {len(bytes_in)} out of {bytes_expected} bytes.")
+
+        # Decode all the received responses at once
+        return decode_read_responses(bytes(bytes_in), self._protocol, self._bus_width)
+
+    def _get_transfer_ends(self, transfers):
+        """
+        Return the number of bytes that will have been received once each of
+        a list of read transfers has completed.
+        """
+        length = response_length(self._protocol, self._bus_width)
+
+        ends = []
+        for singles, burst in transfers:
+            previous = ends[-1] if ends else 0
+            ends.append(previous + length * (len(singles) + len(burst)))
+
+        return ends
+
+    def _encode_read_transfer(self, singles, burst):
+        """
+        Return the bytes sent to the FPGA for a single read transfer, with a
+        stall byte after every `stall_interval` individual read requests. Stall
+        bytes aren't needed if hardware flow control is enabled.
+        """
+        stall_interval = None if self._rtscts else self._stall_interval
+
+        def encode_singles(offsets, _):
+            return encode_read_requests(
+                offsets, self._protocol, stall_interval, self._bus_width
+            )
+
+        def encode_burst(offsets, _):
+            return encode_burst_read_request(offsets[0], len(burst), self._protocol)
+
+        bytes_out = self._encode_paged(singles, encode_singles)
+
+        if burst:
+            bytes_out += self._encode_paged(burst[:1], encode_burst)
+
+        return bytes_out
+
+    def _encode_paged(self, addrs, encode):
+        """
+        Return the bytes of the requests for a list of addresses, which are
+        encoded by calling `encode` with the lower 16 bits of each run of
+        addresses that share a page, and the index of the first address in
+        the run. Each run is preceded by a page request if the bus has
+        addresses wider than 16 bits, so that the FPGA places the requests
+        on the right page.
+        """
+        if self._bus_addr_width == 16:
+            return encode(addrs, 0)
+
+        requests = []
+        start = 0
+        for page, offsets in split_into_pages(addrs):
+            if not 0 <= page < 2 ** (self._bus_addr_width - 16):
+                raise ValueError(f"Addresses must fit in {self._bus_addr_width} bits.")
+
+            requests.append(encode_page_request(page, self._protocol))
+            requests.append(encode(offsets, start))
+            start += len(offsets)
+
+        return b"".join(requests)
+
+    def _plan_read_transfers(self, addrs):
+        """
+        Group a list of addresses into transfers, each of which is sent to the
+        FPGA before its responses are read back. Each transfer is a tuple of
+        addresses to read with individual read requests, and addresses to read
+        with a single burst read request. The FPGA ignores any bytes it
+        receives while it's responding to a burst read, so each transfer can
+        contain at most one burst read, which is sent last. No transfer
+        requests more than `chunk_size` addresses.
+        """
+        transfers = []
+        singles = []
+
+        for run in split_into_runs(addrs, self._chunk_size):
+            # Short runs aren't worth ending the transfer early for
+            if len(run) < 8:
+                for addr in run:
+                    singles.append(addr)
+
+                    if len(singles) == self._chunk_size:
+                        transfers.append((singles, []))
+                        singles = []
+
+                continue
+
+            if len(singles) + len(run) > self._chunk_size:
+                transfers.append((singles, []))
+                singles = []
+
+            transfers.append((singles, run))
+            singles = []
+
+        if singles:
+            transfers.append((singles, []))
+
+        return transfers
+
     def write(self, addrs, data):
         """
         Write the provided data into the provided addresses in Manta's internal
@@ -266,6 +720,15 @@ class UARTInterface(Elaboratable):
         if isinstance(addrs, int) and isinstance(data, int):
             return self.write([addrs], [data])
 
+        set = self._get_serial_device()
+        set.write(self._encode_writes(addrs, data))
+
+    def _encode_writes(self, addrs, data):
+        """
+        Check that a list of addresses and data are all integers, and return
+        the bytes sent to the FPGA to write them.
+        """
+
         # Make sure address and data are all integers
         if not isinstance(addrs, list) or not isinstance(data, list):
             raise TypeError(
@@ -282,68 +745,554 @@ class UARTInterface(Elaboratable):
         # the host's input buffer isn't written to, and we don't need to
         # send the data as chunks as the to avoid overflowing the input buffer.
 
-        # Encode addrs and data into write requests
-        bytes_out = "".join([f"W{a:04X}{d:04X}\r\n" for a, d in zip(addrs, data)])
+        # Encode addrs and data into write requests, using burst write
+        # requests for runs of consecutive addresses. The individual write
+        # requests between each burst are encoded all at once.
+        def encode(addrs, offset):
+            data_in_page = data[offset : offset + len(addrs)]
+            requests = []
+            start = 0
+            singles_start = 0
+            for run in split_into_runs(addrs, 0xFFFF):
+                if len(run) > 1:
+                    requests.append(
+                        encode_write_requests(
+                            addrs[singles_start:start],
+                            data_in_page[singles_start:start],
+                            self._protocol,
+                            self._bus_width,
+                        )
+                    )
+                    requests.append(
+                        encode_burst_write_request(
+                            run[0],
+                            data_in_page[start : start + len(run)],
+                            self._protocol,
+                            self._bus_width,
+                        )
+                    )
+                    singles_start = start + len(run)
+
+                start += len(run)
+
+            requests.append(
+                encode_write_requests(
+                    addrs[singles_start:],
+                    data_in_page[singles_start:],
+                    self._protocol,
+                    self._bus_width,
+                )
+            )
+
+            return b"".join(requests)
+
+        return self._encode_paged(addrs, encode)
+
+    def _get_async_lock(self):
+        """
+        Return the lock that keeps coroutines running on the current event
+        loop from using the serial port at the same time.
+        """
+        loop = asyncio.get_running_loop()
+        if getattr(self, "_async_loop", None) is not loop:
+            self._async_loop = loop
+            self._async_lock = asyncio.Lock()
+
+        return self._async_lock
+
+    async def aread(self, addrs):
+        """
+        Read the data stored in a set of address on Manta's internal memory,
+        without blocking the event loop. This is the asynchronous counterpart
+        to read(), and takes the same arguments.
+
+        Responses are received by watching the serial port from the running
+        event loop, so any number of interfaces can be read from concurrently
+        on a single thread. On platforms where the event loop can't watch a
+        serial port (such as Windows), read() is run in the event loop's
+        default executor instead.
+        """
+
+        # Handle a single integer address
+        if isinstance(addrs, int):
+            return (await self.aread([addrs]))[0]
+
+        # Make sure all list elements are integers
+        if not all(isinstance(a, int) for a in addrs):
+            raise TypeError("Read address must be an integer or list of integers.")
+
+        loop = asyncio.get_running_loop()
         set = self._get_serial_device()
-        set.write(bytes_out.encode("ascii"))
+        transfers = self._plan_read_transfers(addrs)
+        ends = self._get_transfer_ends(transfers)
+        bytes_expected = ends[-1] if ends else 0
 
-    def _decode_read_response(self, response_bytes):
+        bytes_in = bytearray()
+        received = asyncio.Event()
+
+        def on_readable():
+            bytes_in.extend(set.read(set.in_waiting))
+            received.set()
+
+        async def wait_for(n_bytes):
+            # Return whether n_bytes arrived before the serial port timed out
+            while len(bytes_in) < n_bytes:
+                received.clear()
+                try:
+                    await asyncio.wait_for(received.wait(), set.timeout)
+
+                except asyncio.TimeoutError:
+                    return False
+
+            return True
+
+        async with self._get_async_lock():
+            try:
+                loop.add_reader(set.fileno(), on_readable)
+
+            except (AttributeError, NotImplementedError):
+                return await loop.run_in_executor(None, self.read, addrs)
+
+            try:
+                # Keep up to chunks_in_flight transfers outstanding, and wait
+                # for burst reads to complete before sending the next transfer,
+                # just like read() does
+                for i, (singles, burst) in enumerate(transfers):
+                    n_bytes = 0
+                    if i >= self._chunks_in_flight:
+                        n_bytes = ends[i - self._chunks_in_flight]
+
+                    if i > 0 and transfers[i - 1][1]:
+                        n_bytes = ends[i - 1]
+
+                    if not await wait_for(n_bytes):
+                        break
+
+                    set.write(self._encode_read_transfer(singles, burst))
+
+                await wait_for(bytes_expected)
+
+            finally:
+                loop.remove_reader(set.fileno())
+
+        if len(bytes_in) < bytes_expected:
+            raise ValueError(f"Only got {len(bytes_in)} out of {bytes_expected} bytes.")
+
+        # Decode all the received responses at once
+        return decode_read_responses(
+            bytes(bytes_in[:bytes_expected]), self._protocol, self._bus_width
+        )
+
+    async def awrite(self, addrs, data):
         """
-        Check that read response is formatted properly, and return the encoded
-        data if so.
+        Write the provided data into the provided addresses in Manta's internal
+        memory, without blocking the event loop. This is the asynchronous
+        counterpart to write(), and takes the same arguments. Since the FPGA
+        doesn't respond to write requests, this only waits for the serial port
+        to be free of other reads and writes.
         """
 
-        # Make sure response is not empty
-        if response_bytes is None:
-            raise ValueError("Unable to decode read response - no bytes received.")
+        # Handle a single integer address and data
+        if isinstance(addrs, int) and isinstance(data, int):
+            return await self.awrite([addrs], [data])
+
+        bytes_out = self._encode_writes(addrs, data)
+
+        async with self._get_async_lock():
+            self._get_serial_device().write(bytes_out)
+
+    def set_baudrate(self, baudrate):
+        """
+        Switch the FPGA and the host to a new baudrate. The FPGA reverts to
+        its previous baudrate unless the host confirms the switch at the new
+        baudrate, so communication is never lost if the new baudrate doesn't
+        work.
 
-        # Make sure response is properly encoded
-        response_ascii = response_bytes.decode("ascii")
+        Args:
+            baudrate (float | int): The baudrate to switch to.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: The baudrate is not programmable, is not achievable
+                with the FPGA's clock frequency, or the FPGA could not be
+                communicated with at the new baudrate. In the last case, both
+                the FPGA and the host are returned to the previous baudrate.
 
-        if len(response_ascii) != 7:
+        """
+
+        if not self._programmable_baudrate:
+            raise ValueError("UART interface baudrate is not programmable.")
+
+        if not 4 <= self._clock_freq / baudrate < 2**16:
             raise ValueError(
-                "Unable to decode read response - wrong number of bytes received."
+                f"Baudrate {baudrate} is not achievable with specified clock frequency."
             )
 
-        if response_ascii[0] != "D":
-            raise ValueError("Unable to decode read response - incorrect preamble.")
+        divider = self._get_divider(baudrate)
+        control_addr = self._base_addr + 2
+        set = self._get_serial_device()
+        previous_baudrate = set.baudrate
+
+        # The FPGA switches once the line has been idle for 20 bauds, so wait
+        # for the request to be sent, and then for the line to idle
+        self.write(
+            [self._base_addr, self._base_addr + 1, control_addr],
+            [divider & 0xFFFF, divider >> 16, BaudControl.SWITCH],
+        )
+        set.flush()
+        time.sleep(max(0.01, 40 / previous_baudrate))
+
+        try:
+            set.baudrate = baudrate
+            set.reset_input_buffer()
+
+            self.write(control_addr, BaudControl.CONFIRM)
+            if self._registers.get_probe(self._divider) != divider:
+                raise ValueError("Baud divider was not updated.")
+
+        except (ValueError, SerialException):
+            # Wait for the FPGA to revert the unconfirmed switch
+            set.baudrate = previous_baudrate
+            time.sleep(2 * self._BAUD_SWITCH_TIMEOUT)
+            set.reset_input_buffer()
+
+            raise ValueError(f"Unable to communicate with FPGA at {baudrate} baud.")
+
+    def negotiate_baudrate(self, baudrates=None, trials=4):
+        """
+        Step up to the fastest baudrate that both the FPGA and the host's
+        USB-Serial adapter can sustain. Each baudrate faster than the current
+        one is tried in order, and is kept only if `trials` chunks of reads
+        all succeed at it. The FPGA returns to its initial baudrate when it's
+        reset, so this must be done again after the FPGA is reprogrammed.
+
+        Args:
+            baudrates (Optional[List[float | int]]): The baudrates to try.
+                Defaults to common baudrates between 115200 and 12M baud.
+
+            trials (Optional[int]): The number of chunks to read at each
+                baudrate. Defaults to 4.
+
+        Returns:
+            The baudrate that the FPGA and host were left at.
+
+        Raises:
+            ValueError: The reads failed at a faster baudrate, and the FPGA
+                could not be switched back to the previous one. The link to
+                the FPGA may be lost, in which case it must be reset.
+
+        """
+
+        if baudrates is None:
+            baudrates = [
+                115200,
+                230400,
+                460800,
+                921600,
+                1000000,
+                2000000,
+                3000000,
+                4000000,
+                6000000,
+                12000000,
+            ]
+
+        set = self._get_serial_device()
+
+        for baudrate in sorted(baudrates):
+            previous_baudrate = set.baudrate
+
+            if baudrate <= previous_baudrate:
+                continue
+
+            # The UART needs at least 4 clock cycles per baud
+            if self._clock_freq / baudrate < 4:
+                break
+
+            try:
+                self.set_baudrate(baudrate)
+
+            except ValueError:
+                break
+
+            if not self._probe_link(self._chunk_size, self._stall_interval, trials):
+                try:
+                    self.set_baudrate(previous_baudrate)
+
+                except ValueError:
+                    raise ValueError(
+                        f"Lost the link to the FPGA, as reads failed at {baudrate} "
+                        f"baud and it could not be returned to {previous_baudrate} "
+                        "baud."
+                    )
+
+                break
 
-        for i in range(1, 5):
-            if response_ascii[i] not in "0123456789ABCDEF":
-                raise ValueError("Unable to decode read response - invalid data byte.")
+        return set.baudrate
 
-        if response_ascii[5] != "\r":
-            raise ValueError("Unable to decode read response - incorrect EOL.")
+    def calibrate(self, max_chunk_size=4096, trials=4):
+        """
+        Find the largest `chunk_size` and `stall_interval` that work reliably
+        on the connected link, and use them for all further reads.
+
+        The link is probed with reads of address 0, which don't change the
+        state of any core. The largest chunk size that works with a stall byte
+        after every read request is found first, followed by the longest stall
+        interval that works with that chunk size. Both are searched in powers
+        of two. Stall bytes aren't sent with `rtscts` enabled, so only the
+        chunk size is searched in that case.
+
+        Args:
+            max_chunk_size (Optional[int]): The largest chunk size to try.
+                Defaults to 4096.
+
+            trials (Optional[int]): The number of chunks to read with each
+                candidate setting. A setting is only accepted if every chunk
+                is read successfully. Defaults to 4.
+
+        Returns:
+            A tuple containing the calibrated `chunk_size` and `stall_interval`.
+                The `stall_interval` is None if `rtscts` is enabled.
+
+        Raises:
+            ValueError: The FPGA could not be read from, even with the most
+                conservative settings.
+
+        """
+
+        if not self._probe_link(1, 1, trials):
+            raise ValueError("Unable to read from FPGA, even with a chunk size of 1.")
+
+        chunk_size = 1
+        while chunk_size < max_chunk_size:
+            if not self._probe_link(2 * chunk_size, 1, trials):
+                break
+
+            chunk_size *= 2
+
+        self._chunk_size = chunk_size
+        if self._rtscts:
+            return chunk_size, None
+
+        stall_interval = 1
+        while stall_interval < chunk_size:
+            if not self._probe_link(chunk_size, 2 * stall_interval, trials):
+                break
+
+            stall_interval *= 2
 
-        if response_ascii[6] != "\n":
-            raise ValueError("Unable to decode read response - incorrect EOL.")
+        self._stall_interval = stall_interval
+        return chunk_size, stall_interval
+
+    def _probe_link(self, chunk_size, stall_interval, trials):
+        """
+        Return whether `trials` chunks of reads all succeed with the provided
+        chunk size and stall interval. If any read fails, the host's input
+        buffer is flushed so that late responses aren't mistaken for the
+        responses to the next probe.
+        """
+        settings = (self._chunk_size, self._stall_interval)
+        self._chunk_size = chunk_size
+        self._stall_interval = stall_interval
+
+        try:
+            # Reading the same address repeatedly keeps the reads from being
+            # combined into a burst, so the stall bytes are exercised
+            for _ in range(trials):
+                self.read([0] * chunk_size)
+
+            return True
+
+        except ValueError:
+            self._get_serial_device().reset_input_buffer()
+            return False
 
-        return int(response_ascii[1:5], 16)
+        finally:
+            self._chunk_size, self._stall_interval = settings
+
+    def _drive_overflow_counter(self, m, counter, overflow):
+        with m.If(overflow & (counter != 0xFFFF)):
+            m.d.sync += counter.eq(counter + 1)
+
+    def _drive_receive_path(self, m, uart_rx, bridge_rx):
+        """
+        Connect the UART receiver to the receive bridge, through a FIFO if one
+        is used. With flow control, CTS is deasserted once the FIFO is half
+        full, as the host may send a few more bytes after it's deasserted.
+        """
+        rx_fifo_depth, _ = self._fifo_depths
+
+        if rx_fifo_depth == 0:
+            m.d.comb += [
+                bridge_rx.data_i.eq(uart_rx.data_o),
+                bridge_rx.valid_i.eq(uart_rx.valid_o),
+            ]
+            return
+
+        m.submodules.rx_fifo = rx_fifo = SyncFIFOBuffered(width=8, depth=rx_fifo_depth)
+
+        m.d.comb += [
+            rx_fifo.w_data.eq(uart_rx.data_o),
+            rx_fifo.w_en.eq(uart_rx.valid_o),
+            bridge_rx.data_i.eq(rx_fifo.r_data),
+            bridge_rx.valid_i.eq(rx_fifo.r_rdy & bridge_rx.ready_o),
+            rx_fifo.r_en.eq(bridge_rx.ready_o),
+        ]
+
+        overflow = uart_rx.valid_o & ~rx_fifo.w_rdy
+        self._drive_overflow_counter(m, self._rx_overflows, overflow)
+
+        if self._rtscts:
+            m.d.comb += self.cts.eq(rx_fifo.level >= rx_fifo_depth // 2)
+
+    def _drive_transmit_path(self, m, bridge_tx, uart_tx):
+        """
+        Connect the transmit bridge to the UART transmitter, through a FIFO if
+        one is used. With flow control, nothing is transmitted while the host
+        deasserts RTS.
+        """
+        _, tx_fifo_depth = self._fifo_depths
+
+        host_ready = C(1)
+        if self._rtscts:
+            # Two Flip-Flop Synchronizer
+            rts_d = Signal(init=1)
+            rts_q = Signal(init=1)
+            m.d.sync += [rts_d.eq(self.rts), rts_q.eq(rts_d)]
+            host_ready = ~rts_q
+
+        if self._registers is not None:
+            self._drive_overflow_counter(m, self._tx_overflows, bridge_tx.overflow_o)
+
+        # The transmitter sends a new byte whenever both start_i and done_o
+        # are asserted, at which point the next byte must be presented
+        if tx_fifo_depth == 0:
+            m.d.comb += [
+                uart_tx.data_i.eq(bridge_tx.data_o),
+                uart_tx.start_i.eq(bridge_tx.start_o & host_ready),
+                bridge_tx.done_i.eq(uart_tx.done_o & host_ready),
+            ]
+            return
+
+        m.submodules.tx_fifo = tx_fifo = SyncFIFOBuffered(width=8, depth=tx_fifo_depth)
+
+        m.d.comb += [
+            tx_fifo.w_data.eq(bridge_tx.data_o),
+            tx_fifo.w_en.eq(bridge_tx.start_o),
+            bridge_tx.done_i.eq(tx_fifo.w_rdy),
+            uart_tx.data_i.eq(tx_fifo.r_data),
+            uart_tx.start_i.eq(tx_fifo.r_rdy & host_ready),
+            tx_fifo.r_en.eq(uart_tx.done_o & host_ready),
+        ]
+
+    def _drive_baud_control(self, m, uart_rx, uart_tx):
+        """
+        Handle writes to the registers that control the baud divider. Once the
+        host requests a switch to a new divider, the switch is made after the
+        line has been idle for 20 bauds, so that the request is received
+        completely at the old baudrate. The FPGA then reverts to the previous
+        divider unless the host confirms the switch before a timeout.
+        """
+        new_divider = Signal(32)
+        previous_divider = Signal(32)
+        switch_requested = Signal()
+        awaiting_confirm = Signal()
+
+        timeout = int(self._clock_freq * self._BAUD_SWITCH_TIMEOUT)
+        timer = Signal(range(timeout + 1))
+
+        # Count the cycles since a byte was last received
+        idle_limit = 20 * (2**16)
+        idle_cycles = Signal(range(idle_limit + 1))
+
+        with m.If(uart_rx.valid_o):
+            m.d.sync += idle_cycles.eq(0)
+
+        with m.Elif(idle_cycles != idle_limit):
+            m.d.sync += idle_cycles.eq(idle_cycles + 1)
+
+        m.d.comb += [
+            uart_rx.divider_i.eq(self._divider),
+            uart_tx.divider_i.eq(self._divider),
+        ]
+
+        with m.If(switch_requested & (idle_cycles >= 20 * self._divider[16:])):
+            m.d.sync += switch_requested.eq(0)
+            m.d.sync += awaiting_confirm.eq(1)
+            m.d.sync += timer.eq(timeout)
+            m.d.sync += previous_divider.eq(self._divider)
+            m.d.sync += self._divider.eq(new_divider)
+
+        with m.Elif(awaiting_confirm):
+            with m.If(timer == 0):
+                m.d.sync += awaiting_confirm.eq(0)
+                m.d.sync += self._divider.eq(previous_divider)
+
+            with m.Else():
+                m.d.sync += timer.eq(timer - 1)
+
+        # Writes pass by the interface on their way back from the cores
+        with m.If(self.bus_i.valid & self.bus_i.rw):
+            with m.If(self.bus_i.addr == self._base_addr):
+                m.d.sync += new_divider[:16].eq(self.bus_i.data)
+
+            with m.If(self.bus_i.addr == self._base_addr + 1):
+                m.d.sync += new_divider[16:].eq(self.bus_i.data)
+
+            with m.If(self.bus_i.addr == self._base_addr + 2):
+                with m.If(self.bus_i.data == BaudControl.SWITCH):
+                    m.d.sync += switch_requested.eq(1)
+
+                with m.If(self.bus_i.data == BaudControl.CONFIRM):
+                    m.d.sync += awaiting_confirm.eq(0)
 
     def elaborate(self, platform):
         m = Module()
 
-        m.submodules.uart_rx = uart_rx = UARTReceiver(self._clocks_per_baud)
-        m.submodules.bridge_rx = bridge_rx = ReceiveBridge()
-        m.submodules.bridge_tx = bridge_tx = TransmitBridge()
-        m.submodules.uart_tx = uart_tx = UARTTransmitter(self._clocks_per_baud)
+        m.submodules.uart_rx = uart_rx = UARTReceiver(
+            self._clocks_per_baud, self._programmable_baudrate
+        )
+        m.submodules.bridge_rx = bridge_rx = ReceiveBridge(
+            self._protocol, self._bus_width, self._bus_addr_width
+        )
+        m.submodules.bridge_tx = bridge_tx = TransmitBridge(
+            self._protocol, self._bus_width
+        )
+        m.submodules.uart_tx = uart_tx = UARTTransmitter(
+            self._clocks_per_baud, self._programmable_baudrate
+        )
 
         m.d.comb += [
             # UART RX -> Internal Bus
             uart_rx.rx.eq(self.rx),
-            bridge_rx.data_i.eq(uart_rx.data_o),
-            bridge_rx.valid_i.eq(uart_rx.valid_o),
             self.bus_o.data.eq(bridge_rx.data_o),
             self.bus_o.addr.eq(bridge_rx.addr_o),
             self.bus_o.rw.eq(bridge_rx.rw_o),
             self.bus_o.valid.eq(bridge_rx.valid_o),
-            # Internal Bus -> UART TX
-            bridge_tx.data_i.eq(self.bus_i.data),
-            bridge_tx.rw_i.eq(self.bus_i.rw),
-            bridge_tx.valid_i.eq(self.bus_i.valid),
-            uart_tx.data_i.eq(bridge_tx.data_o),
-            uart_tx.start_i.eq(bridge_tx.start_o),
-            bridge_tx.done_i.eq(uart_tx.done_o),
+            bridge_rx.tx_busy_i.eq(bridge_tx.busy_o),
+            # UART TX
             self.tx.eq(uart_tx.tx),
         ]
+
+        # Internal Bus -> UART TX, through the interface's registers if any
+        bus_i = self.bus_i
+        if self._registers is not None:
+            m.submodules.registers = self._registers
+            m.d.comb += self._registers.bus_i.eq(self.bus_i)
+            bus_i = self._registers.bus_o
+
+        m.d.comb += [
+            bridge_tx.data_i.eq(bus_i.data),
+            bridge_tx.rw_i.eq(bus_i.rw),
+            bridge_tx.valid_i.eq(bus_i.valid),
+        ]
+
+        self._drive_receive_path(m, uart_rx, bridge_rx)
+        self._drive_transmit_path(m, bridge_tx, uart_tx)
+
+        if self._programmable_baudrate:
+            self._drive_baud_control(m, uart_rx, uart_tx)
+
         return m
@@ -0,0 +1,238 @@
+import struct
+
+from manta.utils import *
+
+_HEX_DIGITS = b"0123456789ABCDEF"
+
+
+def message_length(protocol):
+    """
+    Return the length of a single read request or read response in bytes,
+    which depends on the protocol in use.
+    """
+    return 7 if protocol == "ascii" else 3
+
+
+def response_length(protocol, data_width=16):
+    """
+    Return the length of a single read response in bytes, which depends on the
+    protocol in use and the width of the data on Manta's internal bus.
+    """
+    if protocol == "ascii":
+        return data_width // 4 + 3
+
+    return data_width // 8 + 1
+
+
+_WORD_FORMATS = {16: "H", 32: "I", 64: "Q"}
+
+
+def _pack_words(words, width=16):
+    """
+    Return a list of integers packed into big-endian words of the given width.
+    """
+    try:
+        return struct.pack(f">{len(words)}{_WORD_FORMATS[width]}", *words)
+
+    except struct.error:
+        raise ValueError(
+            f"Addresses must fit in 16 bits, and data must fit in {width} bits."
+        )
+
+
+def _hex_digit_columns(words, width=16):
+    """
+    Return a byte string for each ASCII hex digit of a word of the given width,
+    the i-th of which contains the i-th digit of every word in a list of
+    integers.
+    """
+    n_digits = width // 4
+    digits = _pack_words(words, width).hex().upper().encode("ascii")
+    return [digits[i::n_digits] for i in range(n_digits)]
+
+
+def _byte_columns(words, width=16):
+    """
+    Return a byte string for each byte of a word of the given width, the i-th
+    of which contains the i-th most significant byte of every word in a list
+    of integers.
+    """
+    n_bytes = width // 8
+    packed = _pack_words(words, width)
+    return [packed[i::n_bytes] for i in range(n_bytes)]
+
+
+def _interleave(columns):
+    """
+    Assemble a series of equal-length messages from their columns, where the
+    i-th column contains the i-th byte of every message. Each column is written
+    with a single slice assignment, so this runs in a handful of operations
+    regardless of the number of messages.
+    """
+    stride = len(columns)
+    messages = bytearray(stride * len(columns[0]))
+
+    for offset, column in enumerate(columns):
+        messages[offset::stride] = column
+
+    return bytes(messages)
+
+
+def encode_read_requests(addrs, protocol, stall_interval, data_width=16):
+    """
+    Return the bytes of the read requests for a list of addresses, with a stall
+    byte placed after every `stall_interval` requests. See:
+    https://github.com/fischermoseley/manta/issues/18
+
+    No stall bytes are added if `stall_interval` is None.
+
+    On busses wider than 16 bits, each read response is longer than the read
+    request it answers, so each request is padded with stall bytes to the
+    length of its response. This keeps requests from arriving faster than
+    the FPGA can send the responses to them.
+    """
+    n = len(addrs)
+    if n == 0:
+        return b""
+
+    if protocol == "ascii":
+        columns = [b"R" * n, *_hex_digit_columns(addrs), b"\r" * n, b"\n" * n]
+
+    else:
+        columns = [b"R" * n, *_byte_columns(addrs)]
+
+    n_padding = response_length(protocol, data_width) - message_length(protocol)
+    columns += [b"\n" * n] * n_padding
+
+    requests = _interleave(columns)
+    if stall_interval is None:
+        return requests
+
+    chunks = split_into_chunks(requests, len(columns) * stall_interval)
+    return b"\n".join(chunks)
+
+
+def encode_write_requests(addrs, datas, protocol, data_width=16):
+    """
+    Return the bytes of the write requests for a list of addresses and data.
+    """
+    n = len(addrs)
+    if n == 0:
+        return b""
+
+    if protocol == "ascii":
+        addr_columns = _hex_digit_columns(addrs)
+        data_columns = _hex_digit_columns(datas, data_width)
+        eol_columns = [b"\r" * n, b"\n" * n]
+        return _interleave([b"W" * n, *addr_columns, *data_columns, *eol_columns])
+
+    data_columns = _byte_columns(datas, data_width)
+    return _interleave([b"W" * n, *_byte_columns(addrs), *data_columns])
+
+
+def encode_burst_read_request(addr, count, protocol):
+    """
+    Return the bytes of a burst read request, which reads `count` consecutive
+    addresses starting at `addr`.
+    """
+    if protocol == "ascii":
+        return b"r" + _pack_words([addr, count]).hex().upper().encode("ascii") + b"\r\n"
+
+    return b"r" + _pack_words([addr, count])
+
+
+def encode_burst_write_request(addr, datas, protocol, data_width=16):
+    """
+    Return the bytes of a burst write request, which writes `datas` to
+    consecutive addresses starting at `addr`.
+    """
+    words = _pack_words([addr, len(datas)]) + _pack_words(datas, data_width)
+
+    if protocol == "ascii":
+        return b"w" + words.hex().upper().encode("ascii") + b"\r\n"
+
+    return b"w" + words
+
+
+def encode_page_request(page, protocol):
+    """
+    Return the bytes of a page request, which sets the upper bits of the
+    addresses in the requests that follow it.
+    """
+    if protocol == "ascii":
+        return b"P" + _pack_words([page]).hex().upper().encode("ascii") + b"\r\n"
+
+    return b"P" + _pack_words([page])
+
+
+def decode_read_response(response_bytes, protocol, data_width=16):
+    """
+    Check that a single read response is formatted properly, and return the
+    encoded data if so.
+    """
+
+    # Make sure response is not empty
+    if response_bytes is None:
+        raise ValueError("Unable to decode read response - no bytes received.")
+
+    length = response_length(protocol, data_width)
+    if len(response_bytes) != length:
+        raise ValueError(
+            "Unable to decode read response - wrong number of bytes received."
+        )
+
+    if response_bytes[0] != ord("D"):
+        raise ValueError("Unable to decode read response - incorrect preamble.")
+
+    if protocol == "binary":
+        return int.from_bytes(response_bytes[1:], "big")
+
+    for i in range(1, length - 2):
+        if response_bytes[i] not in _HEX_DIGITS:
+            raise ValueError("Unable to decode read response - invalid data byte.")
+
+    if response_bytes[-2] != ord("\r"):
+        raise ValueError("Unable to decode read response - incorrect EOL.")
+
+    if response_bytes[-1] != ord("\n"):
+        raise ValueError("Unable to decode read response - incorrect EOL.")
+
+    return int(response_bytes[1:-2], 16)
+
+
+def decode_read_responses(responses_bytes, protocol, data_width=16):
+    """
+    Check that a buffer of back-to-back read responses is formatted properly,
+    and return the encoded data if so.
+
+    Rather than checking each response individually, every byte of the framing
+    is checked at once by slicing the buffer into columns. If anything is
+    malformed, the responses are checked one at a time so that the error
+    raised is the one reported for the first malformed response.
+    """
+    length = response_length(protocol, data_width)
+    n = len(responses_bytes) // length
+    columns = [responses_bytes[i::length] for i in range(length)]
+
+    if protocol == "ascii":
+        data_columns = columns[1:-2]
+        valid = (
+            columns[0] == b"D" * n
+            and all(not c.translate(None, _HEX_DIGITS) for c in data_columns)
+            and columns[-2] == b"\r" * n
+            and columns[-1] == b"\n" * n
+        )
+
+    else:
+        data_columns = columns[1:]
+        valid = columns[0] == b"D" * n
+
+    if not valid or len(responses_bytes) != n * length:
+        for response_bytes in split_into_chunks(responses_bytes, length):
+            decode_read_response(response_bytes, protocol, data_width)
+
+    data = _interleave(data_columns)
+    if protocol == "ascii":
+        data = bytes.fromhex(data.decode("ascii"))
+
+    return list(struct.unpack(f">{n}{_WORD_FORMATS[data_width]}", data))
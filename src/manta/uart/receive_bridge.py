@@ -1,5 +1,4 @@
 from amaranth import *
-from amaranth.lib.data import ArrayLayout
 from amaranth.lib.enum import IntEnum
 
 
@@ -7,32 +6,54 @@ class States(IntEnum):
     IDLE = 0
     READ = 1
     WRITE = 2
+    BURST_READ = 3
+    BURST_WRITE = 4
+    BURST_READING = 5
+    BURST_WRITING = 6
+    PAGE = 7
 
 
 class ReceiveBridge(Elaboratable):
     """
     A module for bridging the stream of bytes from the UARTReceiver module to
     Manta's internal bus.
+
+    If the bus has addresses wider than 16 bits, the upper bits are taken from
+    a page register, which is set by page requests.
     """
 
-    def __init__(self):
+    def __init__(self, protocol="ascii", data_width=16, addr_width=16):
+        self._protocol = protocol
+        self._data_width = data_width
+        self._addr_width = addr_width
+
         # Top-Level Ports
         self.data_i = Signal(8)
         self.valid_i = Signal()
+        self.ready_o = Signal()
+        self.tx_busy_i = Signal()
 
-        self.addr_o = Signal(16)
-        self.data_o = Signal(16)
+        self.addr_o = Signal(addr_width)
+        self.data_o = Signal(data_width)
         self.rw_o = Signal(1)
         self.valid_o = Signal(1)
 
         # Internal Signals
-        self._buffer = Signal(ArrayLayout(4, 8))
+        # The longest message body is a write request, which contains a 16-bit
+        # address followed by the data, each byte of which is two hex digits
+        # in the ASCII protocol
+        self._buffer = Signal(16 + data_width)
         self._state = Signal(States)
-        self._byte_num = Signal(4)
+        self._byte_num = Signal(range(2 * (2 + data_width // 8) + 1))
         self._is_eol = Signal()
         self._is_ascii_hex = Signal()
         self._from_ascii_hex = Signal(8)
 
+        self._burst_addr = Signal(16)
+        self._burst_count = Signal(16)
+        self._read_pending = Signal()
+        self._page = Signal(addr_width - 16)
+
     def _drive_ascii_signals(self, m):
         # Decode 0-9
         with m.If((self.data_i >= 0x30) & (self.data_i <= 0x39)):
@@ -54,36 +75,144 @@ class ReceiveBridge(Elaboratable):
         with m.Else():
             m.d.comb += self._is_eol.eq(0)
 
-    def _drive_output_bus(self, m):
-        with m.If(
-            (self._state == States.READ) & (self._byte_num == 4) & (self._is_eol)
-        ):
-            m.d.comb += self.addr_o.eq(
-                Cat(self._buffer[3], self._buffer[2], self._buffer[1], self._buffer[0])
-            )
-            m.d.comb += self.data_o.eq(0)
-            m.d.comb += self.valid_o.eq(1)
-            m.d.comb += self.rw_o.eq(0)
-
-        with m.Elif(
-            (self._state == States.WRITE) & (self._byte_num == 8) & (self._is_eol)
-        ):
-            m.d.comb += self.addr_o.eq(
-                Cat(self._buffer[3], self._buffer[2], self._buffer[1], self._buffer[0])
-            )
-            m.d.comb += self.data_o.eq(
-                Cat(self._buffer[7], self._buffer[6], self._buffer[5], self._buffer[4])
-            )
-            m.d.comb += self.valid_o.eq(1)
-            m.d.comb += self.rw_o.eq(1)
+    def _place_read(self, m, addr):
+        m.d.sync += self.addr_o.eq(Cat(addr, self._page))
+        m.d.sync += self.data_o.eq(0)
+        m.d.sync += self.rw_o.eq(0)
+        m.d.sync += self.valid_o.eq(1)
+        m.d.sync += self._read_pending.eq(1)
 
-        with m.Else():
-            m.d.comb += self.addr_o.eq(0)
-            m.d.comb += self.data_o.eq(0)
-            m.d.comb += self.rw_o.eq(0)
-            m.d.comb += self.valid_o.eq(0)
+    def _place_write(self, m, addr, data):
+        m.d.sync += self.addr_o.eq(Cat(addr, self._page))
+        m.d.sync += self.data_o.eq(data)
+        m.d.sync += self.rw_o.eq(1)
+        m.d.sync += self.valid_o.eq(1)
+
+    def _drive_message(self, m, n_bytes, on_complete, eol=True):
+        """
+        Buffer the `n_bytes` bytes of address/data/count fields that make up
+        the body of a message, and call `on_complete` with the buffered fields
+        once the message has been fully received.
+
+        In the ASCII protocol each byte of the body is sent as two hex digits,
+        and the message is complete once it's terminated by an EOL, unless
+        `eol` is False. In the binary protocol each byte is sent as-is, and
+        the message is complete as soon as its final byte arrives.
+        """
+        if self._protocol == "ascii":
+            n_symbols = 2 * n_bytes
+            is_symbol = self._is_ascii_hex
+            buffer = Cat(self._from_ascii_hex[:4], self._buffer[:-4])
+
+        else:
+            n_symbols = n_bytes
+            is_symbol = C(1)
+            buffer = Cat(self.data_i, self._buffer[:-8])
+
+        if (self._protocol == "ascii") and eol:
+            # buffer bytes if we don't have enough
+            with m.If(self._byte_num < n_symbols):
+                # if bytes aren't valid ASCII then return to IDLE state
+                with m.If(is_symbol == 0):
+                    m.d.sync += self._state.eq(States.IDLE)
+
+                # otherwise buffer them
+                with m.Else():
+                    m.d.sync += self._buffer.eq(buffer)
+                    m.d.sync += self._byte_num.eq(self._byte_num + 1)
+
+            with m.Else():
+                m.d.sync += self._state.eq(States.IDLE)
+
+                with m.If(self._is_eol):
+                    on_complete(m, self._buffer)
+
+        else:
+            with m.If(is_symbol == 0):
+                m.d.sync += self._state.eq(States.IDLE)
+
+            with m.Elif(self._byte_num < n_symbols - 1):
+                m.d.sync += self._buffer.eq(buffer)
+                m.d.sync += self._byte_num.eq(self._byte_num + 1)
+
+            with m.Else():
+                m.d.sync += self._state.eq(States.IDLE)
+                on_complete(m, buffer)
+
+    def _complete_read(self, m, buffer):
+        self._place_read(m, buffer[:16])
+
+    def _complete_write(self, m, buffer):
+        dw = self._data_width
+        self._place_write(m, buffer[dw : dw + 16], buffer[:dw])
+
+    def _complete_burst_read(self, m, buffer):
+        m.d.sync += self._burst_addr.eq(buffer[16:32])
+        m.d.sync += self._burst_count.eq(buffer[:16])
+        m.d.sync += self._state.eq(States.BURST_READING)
+
+    def _complete_burst_write(self, m, buffer):
+        m.d.sync += self._burst_addr.eq(buffer[16:32])
+        m.d.sync += self._burst_count.eq(buffer[:16])
+        m.d.sync += self._byte_num.eq(0)
+
+        with m.If(buffer[:16] != 0):
+            m.d.sync += self._state.eq(States.BURST_WRITING)
+
+    def _complete_burst_data(self, m, buffer):
+        self._place_write(m, self._burst_addr, buffer[: self._data_width])
+        m.d.sync += self._burst_addr.eq(self._burst_addr + 1)
+        m.d.sync += self._burst_count.eq(self._burst_count - 1)
+        m.d.sync += self._byte_num.eq(0)
+
+        with m.If(self._burst_count != 1):
+            m.d.sync += self._state.eq(States.BURST_WRITING)
+
+    def _complete_page(self, m, buffer):
+        m.d.sync += self._page.eq(buffer[:16])
+
+    def _drive_burst_reads(self, m):
+        """
+        Place the read requests of a burst read on the bus, one at a time.
+        The transmit bridge can only hold a single read response, so the next
+        read is only placed on the bus once the previous response has been
+        picked up by the transmit bridge and completely sent.
+        """
+        with m.If((self._state == States.BURST_READING) & ~self._read_pending):
+            with m.If(self._burst_count == 0):
+                m.d.sync += self._state.eq(States.IDLE)
+
+            with m.Elif(~self.tx_busy_i):
+                self._place_read(m, self._burst_addr)
+                m.d.sync += self._burst_addr.eq(self._burst_addr + 1)
+                m.d.sync += self._burst_count.eq(self._burst_count - 1)
+
+    def _drive_ready(self, m):
+        """
+        Indicate whether the next byte can be accepted without being dropped.
+        Bytes are ignored while responding to a burst read, and a read can
+        only be completed once the response to the previous read has been sent
+        by the transmit bridge. A read is pending from when it's placed on the
+        bus until the transmit bridge starts sending its response.
+        """
+        with m.If(self._read_pending & self.tx_busy_i):
+            m.d.sync += self._read_pending.eq(0)
+
+        # The last byte of a read request is the EOL in the ASCII protocol,
+        # and the last byte of the address in the binary protocol
+        last_byte_num = 4 if self._protocol == "ascii" else 1
+        completes_read = (self._state == States.READ) & (
+            self._byte_num == last_byte_num
+        )
+        tx_ready = ~self._read_pending & ~self.tx_busy_i
+
+        m.d.comb += self.ready_o.eq(
+            (self._state != States.BURST_READING) & ~(completes_read & ~tx_ready)
+        )
 
     def _drive_fsm(self, m):
+        m.d.sync += self.valid_o.eq(0)
+
         with m.If(self.valid_i):
             with m.If(self._state == States.IDLE):
                 m.d.sync += self._byte_num.eq(0)
@@ -94,46 +223,43 @@ class ReceiveBridge(Elaboratable):
                 with m.Elif(self.data_i == ord("W")):
                     m.d.sync += self._state.eq(States.WRITE)
 
-            with m.If(self._state == States.READ):
-                # buffer bytes if we don't have enough
-                with m.If(self._byte_num < 4):
-                    # if bytes aren't valid ASCII then return to IDLE state
-                    with m.If(self._is_ascii_hex == 0):
-                        m.d.sync += self._state.eq(States.IDLE)
-
-                    # otherwise buffer them
-                    with m.Else():
-                        m.d.sync += self._buffer[self._byte_num].eq(
-                            self._from_ascii_hex
-                        )
-                        m.d.sync += self._byte_num.eq(self._byte_num + 1)
+                with m.Elif(self.data_i == ord("r")):
+                    m.d.sync += self._state.eq(States.BURST_READ)
 
-                with m.Else():
-                    m.d.sync += self._state.eq(States.IDLE)
+                with m.Elif(self.data_i == ord("w")):
+                    m.d.sync += self._state.eq(States.BURST_WRITE)
+
+                if self._addr_width > 16:
+                    with m.Elif(self.data_i == ord("P")):
+                        m.d.sync += self._state.eq(States.PAGE)
+
+            with m.If(self._state == States.READ):
+                self._drive_message(m, 2, self._complete_read)
 
             with m.If(self._state == States.WRITE):
-                # buffer bytes if we don't have enough
-                with m.If(self._byte_num < 8):
-                    # if bytes aren't valid ASCII then return to IDLE state
-                    with m.If(self._is_ascii_hex == 0):
-                        m.d.sync += self._state.eq(States.IDLE)
-
-                    # otherwise buffer them
-                    with m.Else():
-                        m.d.sync += self._buffer[self._byte_num].eq(
-                            self._from_ascii_hex
-                        )
-                        m.d.sync += self._byte_num.eq(self._byte_num + 1)
+                n_bytes = 2 + self._data_width // 8
+                self._drive_message(m, n_bytes, self._complete_write)
 
-                with m.Else():
-                    m.d.sync += self._state.eq(States.IDLE)
-        pass
+            with m.If(self._state == States.BURST_READ):
+                self._drive_message(m, 4, self._complete_burst_read)
+
+            with m.If(self._state == States.BURST_WRITE):
+                self._drive_message(m, 4, self._complete_burst_write, eol=False)
+
+            with m.If(self._state == States.BURST_WRITING):
+                n_bytes = self._data_width // 8
+                self._drive_message(m, n_bytes, self._complete_burst_data, eol=False)
+
+            with m.If(self._state == States.PAGE):
+                self._drive_message(m, 2, self._complete_page)
+
+        self._drive_burst_reads(m)
 
     def elaborate(self, platform):
         m = Module()
 
         self._drive_ascii_signals(m)
-        self._drive_output_bus(m)
+        self._drive_ready(m)
         self._drive_fsm(m)
 
         return m
@@ -5,25 +5,66 @@ class UARTReceiver(Elaboratable):
     """
     A module for receiving bytes on a 8N1 UART at a configurable baudrate.
     Outputs bytes as a stream.
+
+    If `programmable` is set, the number of clocks per baud is instead taken
+    from `divider_i` at runtime, as an unsigned fixed-point number with 16
+    fractional bits. Baud periods are then a mix of whole numbers of clock
+    cycles that average out to the fractional divider.
     """
 
-    def __init__(self, clocks_per_baud):
+    def __init__(self, clocks_per_baud, programmable=False):
         self._clocks_per_baud = clocks_per_baud
+        self._programmable = programmable
 
         # Top-Level Ports
         self.rx = Signal()
         self.data_o = Signal(8)
         self.valid_o = Signal(1)
 
+        if self._programmable:
+            self.divider_i = Signal(32)
+
         # Internal Signals
         self._busy = Signal()
         self._bit_index = Signal(range(10))
-        self._baud_counter = Signal(range(2 * clocks_per_baud))
+
+        if self._programmable:
+            self._baud_counter = Signal(17)
+            self._baud_fraction = Signal(16)
+
+        else:
+            self._baud_counter = Signal(range(2 * clocks_per_baud))
 
         self._rx_d = Signal()
         self._rx_q = Signal()
         self._rx_q_prev = Signal()
 
+    def _start_baud_counter(self, m):
+        """
+        Time the first sample of a byte to land in the middle of its first
+        data bit, one and a half baud periods after the start bit's edge.
+        """
+        if not self._programmable:
+            m.d.sync += self._baud_counter.eq(
+                self._clocks_per_baud + (self._clocks_per_baud // 2) - 2
+            )
+            return
+
+        whole = self.divider_i[16:]
+        m.d.sync += self._baud_counter.eq(whole + (whole >> 1) - 2)
+        m.d.sync += self._baud_fraction.eq(0)
+
+    def _reload_baud_counter(self, m):
+        if not self._programmable:
+            m.d.sync += self._baud_counter.eq(self._clocks_per_baud - 1)
+            return
+
+        # Add an extra cycle to this baud period whenever the fractional part
+        # of the divider accumulates past one
+        fraction = self._baud_fraction + self.divider_i[:16]
+        m.d.sync += self._baud_fraction.eq(fraction[:16])
+        m.d.sync += self._baud_counter.eq(self.divider_i[16:] - 1 + fraction[16])
+
     def elaborate(self, platform):
         m = Module()
 
@@ -40,9 +81,7 @@ class UARTReceiver(Elaboratable):
             with m.If((~self._rx_q) & (self._rx_q_prev)):
                 m.d.sync += self._busy.eq(1)
                 m.d.sync += self._bit_index.eq(8)
-                m.d.sync += self._baud_counter.eq(
-                    self._clocks_per_baud + (self._clocks_per_baud // 2) - 2
-                )
+                self._start_baud_counter(m)
 
         with m.Else():
             with m.If(self._baud_counter == 0):
@@ -56,7 +95,7 @@ class UARTReceiver(Elaboratable):
                     # m.d.sync += self.data_o.eq(Cat(self._rx_q, self.data_o[0:7]))
                     m.d.sync += self.data_o.eq(Cat(self.data_o[1:8], self._rx_q))
                     m.d.sync += self._bit_index.eq(self._bit_index - 1)
-                    m.d.sync += self._baud_counter.eq(self._clocks_per_baud - 1)
+                    self._reload_baud_counter(m)
 
             with m.Else():
                 m.d.sync += self._baud_counter.eq(self._baud_counter - 1)
@@ -7,48 +7,54 @@ class TransmitBridge(Elaboratable):
     by the UARTTransmitter module.
     """
 
-    def __init__(self):
+    def __init__(self, protocol="ascii", data_width=16):
+        self._protocol = protocol
+        self._data_width = data_width
+
+        # Read responses contain a preamble followed by the data, which is sent
+        # as hex digits and an EOL in the ASCII protocol, and as raw bytes in
+        # the binary protocol.
+        if self._protocol == "ascii":
+            self._n_bytes = data_width // 4 + 3
+
+        else:
+            self._n_bytes = data_width // 8 + 1
+
         # Top-Level Ports
-        self.data_i = Signal(16)
+        self.data_i = Signal(data_width)
         self.rw_i = Signal()
         self.valid_i = Signal()
 
         self.data_o = Signal(8)
         self.start_o = Signal(1)
         self.done_i = Signal()
+        self.busy_o = Signal(1)
+        self.overflow_o = Signal(1)
 
         # Internal Signals
-        self._buffer = Signal(16)
-        self._count = Signal(4)
+        self._buffer = Signal(data_width)
+        self._count = Signal(range(self._n_bytes))
         self._busy = Signal(1)
         self._to_ascii_hex = Signal(8)
         self._n = Signal(4)
 
-    def elaborate(self, platform):
-        m = Module()
+    def _drive_binary_sequence(self, m):
+        n_data_bytes = self._data_width // 8
 
-        m.d.comb += self.start_o.eq(self._busy)
+        with m.If(self._count == 0):
+            m.d.comb += self.data_o.eq(ord("D"))
 
-        with m.If(~self._busy):
-            with m.If((self.valid_i) & (~self.rw_i)):
-                m.d.sync += self._busy.eq(1)
-                m.d.sync += self._buffer.eq(self.data_i)
+        # Send the most significant byte first
+        for i in range(n_data_bytes):
+            with m.Elif(self._count == i + 1):
+                byte = self._buffer.word_select(n_data_bytes - 1 - i, 8)
+                m.d.comb += self.data_o.eq(byte)
 
         with m.Else():
-            # uart_tx is transmitting a byte:
-            with m.If(self.done_i):
-                m.d.sync += self._count.eq(self._count + 1)
-
-                # Message has been transmitted
-                with m.If(self._count > 5):
-                    m.d.sync += self._count.eq(0)
-
-                    # Go back to idle, or transmit next message
-                    with m.If((self.valid_i) & (~self.rw_i)):
-                        m.d.sync += self._buffer.eq(self.data_i)
+            m.d.comb += self.data_o.eq(0)
 
-                    with m.Else():
-                        m.d.sync += self._busy.eq(0)
+    def _drive_ascii_sequence(self, m):
+        n_digits = self._data_width // 4
 
         # define to_ascii_hex
         with m.If(self._n < 10):
@@ -56,32 +62,21 @@ class TransmitBridge(Elaboratable):
         with m.Else():
             m.d.comb += self._to_ascii_hex.eq(self._n + 0x41 - 10)
 
-        # run the sequence
+        # run the sequence, sending the most significant digit first
         with m.If(self._count == 0):
             m.d.comb += self._n.eq(0)
             m.d.comb += self.data_o.eq(ord("D"))
 
-        with m.Elif(self._count == 1):
-            m.d.comb += self._n.eq(self._buffer[12:16])
-            m.d.comb += self.data_o.eq(self._to_ascii_hex)
-
-        with m.Elif(self._count == 2):
-            m.d.comb += self._n.eq(self._buffer[8:12])
-            m.d.comb += self.data_o.eq(self._to_ascii_hex)
+        for i in range(n_digits):
+            with m.Elif(self._count == i + 1):
+                m.d.comb += self._n.eq(self._buffer.word_select(n_digits - 1 - i, 4))
+                m.d.comb += self.data_o.eq(self._to_ascii_hex)
 
-        with m.Elif(self._count == 3):
-            m.d.comb += self._n.eq(self._buffer[4:8])
-            m.d.comb += self.data_o.eq(self._to_ascii_hex)
-
-        with m.Elif(self._count == 4):
-            m.d.comb += self._n.eq(self._buffer[0:4])
-            m.d.comb += self.data_o.eq(self._to_ascii_hex)
-
-        with m.Elif(self._count == 5):
+        with m.Elif(self._count == n_digits + 1):
             m.d.comb += self._n.eq(0)
             m.d.comb += self.data_o.eq(ord("\r"))
 
-        with m.Elif(self._count == 6):
+        with m.Elif(self._count == n_digits + 2):
             m.d.comb += self._n.eq(0)
             m.d.comb += self.data_o.eq(ord("\n"))
 
@@ -89,4 +84,45 @@ class TransmitBridge(Elaboratable):
             m.d.comb += self._n.eq(0)
             m.d.comb += self.data_o.eq(0)
 
+    def elaborate(self, platform):
+        m = Module()
+
+        m.d.comb += self.start_o.eq(self._busy)
+        m.d.comb += self.busy_o.eq(self._busy)
+
+        n_bytes = self._n_bytes
+
+        # A read response can only be accepted while idle, or as the final
+        # byte of the previous response is sent
+        is_read = self.valid_i & ~self.rw_i
+        last_byte_done = self.done_i & (self._count >= n_bytes - 1)
+        m.d.comb += self.overflow_o.eq(is_read & self._busy & ~last_byte_done)
+
+        with m.If(~self._busy):
+            with m.If((self.valid_i) & (~self.rw_i)):
+                m.d.sync += self._busy.eq(1)
+                m.d.sync += self._buffer.eq(self.data_i)
+
+        with m.Else():
+            # uart_tx is transmitting a byte:
+            with m.If(self.done_i):
+                m.d.sync += self._count.eq(self._count + 1)
+
+                # Message has been transmitted
+                with m.If(self._count >= n_bytes - 1):
+                    m.d.sync += self._count.eq(0)
+
+                    # Go back to idle, or transmit next message
+                    with m.If((self.valid_i) & (~self.rw_i)):
+                        m.d.sync += self._buffer.eq(self.data_i)
+
+                    with m.Else():
+                        m.d.sync += self._busy.eq(0)
+
+        if self._protocol == "binary":
+            self._drive_binary_sequence(m)
+
+        else:
+            self._drive_ascii_sequence(m)
+
         return m
@@ -5,10 +5,14 @@ class UARTTransmitter(Elaboratable):
     """
     A module for transmitting bytes on a 8N1 UART at a configurable baudrate.
     Accepts bytes as a stream.
+
+    If `programmable` is set, the baudrate is instead set at runtime by
+    `divider_i`, in the same format used by UARTReceiver.
     """
 
-    def __init__(self, clocks_per_baud):
+    def __init__(self, clocks_per_baud, programmable=False):
         self._clocks_per_baud = clocks_per_baud
+        self._programmable = programmable
 
         # Top-Level Ports
         self.data_i = Signal(8)
@@ -17,16 +21,35 @@ class UARTTransmitter(Elaboratable):
 
         self.tx = Signal(init=1)
 
+        if self._programmable:
+            self.divider_i = Signal(32)
+
         # Internal Signals
-        self._baud_counter = Signal(range(self._clocks_per_baud))
+        if self._programmable:
+            self._baud_counter = Signal(16)
+            self._baud_fraction = Signal(16)
+
+        else:
+            self._baud_counter = Signal(range(self._clocks_per_baud))
+
         self._buffer = Signal(9)
         self._bit_index = Signal(4)
 
+    def _reload_baud_counter(self, m):
+        if not self._programmable:
+            m.d.sync += self._baud_counter.eq(self._clocks_per_baud - 1)
+            return
+
+        # Stretch this baud period by a cycle if the fractional part carries
+        fraction = self._baud_fraction + self.divider_i[:16]
+        m.d.sync += self._baud_fraction.eq(fraction[:16])
+        m.d.sync += self._baud_counter.eq(self.divider_i[16:] - 1 + fraction[16])
+
     def elaborate(self, platform):
         m = Module()
 
         with m.If((self.start_i) & (self.done_o)):
-            m.d.sync += self._baud_counter.eq(self._clocks_per_baud - 1)
+            self._reload_baud_counter(m)
             m.d.sync += self._buffer.eq(Cat(self.data_i, 1))
             m.d.sync += self._bit_index.eq(0)
             m.d.sync += self.done_o.eq(0)
@@ -40,7 +63,7 @@ class UARTTransmitter(Elaboratable):
 
             # A baud period has elapsed
             with m.If(self._baud_counter == 0):
-                m.d.sync += self._baud_counter.eq(self._clocks_per_baud - 1)
+                self._reload_baud_counter(m)
 
                 # Clock out another bit if there are any left
                 with m.If(self._bit_index < 9):
@@ -3,18 +3,88 @@ from abc import ABC, abstractmethod
 from pathlib import Path
 from random import sample
 
-from amaranth import Elaboratable
+from amaranth import Elaboratable, Signal
 from amaranth.lib import data
 from amaranth.sim import Simulator
 
 
 class MantaCore(ABC, Elaboratable):
-    # These attributes are meant to be settable and gettable, but max_addr and
-    # top_level_ports are intended to be only gettable. Do not implement
-    # setters for them in subclasses.
+    # These attributes are meant to be settable and gettable, but max_addr,
+    # bus_latency, and top_level_ports are intended to be only gettable. Do
+    # not implement setters for them in subclasses.
 
     base_addr = None
     interface = None
+    bus_pipeline_stages = 0
+
+    _bus_width = 16
+    _bus_addr_width = 16
+
+    @property
+    def bus_width(self):
+        """
+        Return the number of bits of data carried by each bus transaction.
+        """
+        return self._bus_width
+
+    @bus_width.setter
+    def bus_width(self, value):
+        self._bus_width = value
+        self._define_bus()
+
+    @property
+    def bus_addr_width(self):
+        """
+        Return the number of bits in each bus address.
+        """
+        return self._bus_addr_width
+
+    @bus_addr_width.setter
+    def bus_addr_width(self, value):
+        self._bus_addr_width = value
+        self._define_bus()
+
+    def _define_bus(self):
+        # The bus connections are remade whenever the bus changes shape
+        self.bus_i = Signal(InternalBus(self._bus_width, self._bus_addr_width))
+        self.bus_o = Signal(InternalBus(self._bus_width, self._bus_addr_width))
+
+    def _pipeline_bus(self, m, ranges):
+        """
+        Register the incoming bus `bus_pipeline_stages` times, and return it
+        along with whether the address of each transaction falls into each
+        of the given (start, stop) address ranges, including the endpoints.
+        When the bus is pipelined, the addresses are compared on the way into
+        the last stage, so that the comparisons don't share a clock cycle
+        with the logic that acts on them.
+        """
+        layout = InternalBus(self._bus_width, self._bus_addr_width)
+        n_stages = self.bus_pipeline_stages
+
+        bus = self.bus_i
+        for i in range(n_stages - 1):
+            stage = Signal(layout, name=f"bus_stage_{i}")
+            m.d.sync += stage.eq(bus)
+            bus = stage
+
+        hits = []
+        for start, stop in ranges:
+            if start == stop:
+                hits.append(bus.addr == start)
+
+            else:
+                hits.append((bus.addr >= start) & (bus.addr <= stop))
+
+        if n_stages > 0:
+            stage = Signal(layout, name=f"bus_stage_{n_stages - 1}")
+            m.d.sync += stage.eq(bus)
+            bus = stage
+
+            registered_hits = [Signal(name=f"hit_{i}") for i in range(len(hits))]
+            m.d.sync += [r.eq(h) for r, h in zip(registered_hits, hits)]
+            hits = registered_hits
+
+        return bus, hits
 
     @property
     @abstractmethod
@@ -26,6 +96,15 @@ class MantaCore(ABC, Elaboratable):
         """
         pass
 
+    @property
+    @abstractmethod
+    def bus_latency(self):
+        """
+        Return the number of clock cycles a bus transaction takes to pass
+        through the core.
+        """
+        pass
+
     @property
     @abstractmethod
     def top_level_ports(self):
@@ -65,6 +144,14 @@ class CoreContainer:
         self._base_addr = 0
         self._last_used_addr = 0
 
+    def _end_addr(self):
+        """
+        Return the address just past the space available to cores. Interfaces
+        may keep registers of their own at the top of the address space.
+        """
+        end_addr = 2**self._manta.bus_addr_width
+        return getattr(self._manta.interface, "base_addr", end_addr)
+
     def __getattr__(self, name):
         if name in self._cores:
             return self._cores[name]
@@ -75,11 +162,13 @@ class CoreContainer:
             super().__setattr__(name, value)
         else:
             self._cores[name] = value
+            value.bus_width = self._manta.bus_width
+            value.bus_addr_width = self._manta.bus_addr_width
+            value.bus_pipeline_stages = self._manta.bus_pipeline_stages
             value.interface = self._manta.interface
             value.base_addr = self._last_used_addr
 
-            if value.max_addr > (2**16) - 1:
-                raise ValueError(f"Ran out of address space while allocating core.")
+            self._manta._check_addr_space(value.max_addr + 1, "core")
 
             self._last_used_addr = value.max_addr + 1
 
@@ -88,13 +177,15 @@ class InternalBus(data.StructLayout):
     """
     Describes the layout of Manta's internal bus, such that signals of
     the appropriate dimension can be instantiated with Signal(InternalBus()).
+    The data carried by each transaction and its address are 16 bits wide
+    unless otherwise specified.
     """
 
-    def __init__(self):
+    def __init__(self, data_width=16, addr_width=16):
         super().__init__(
             {
-                "addr": 16,
-                "data": 16,
+                "addr": addr_width,
+                "data": data_width,
                 "rw": 1,
                 "valid": 1,
                 "last": 1,
@@ -112,29 +203,31 @@ def warn(message):
     print("Warning: " + message)
 
 
-def words_to_value(data):
+def words_to_value(data, width=16):
     """
-    Takes a list of integers, interprets them as 16-bit integers, and
+    Takes a list of integers, interprets them as `width`-bit integers, and
     concatenates them together in little-endian order.
     """
 
-    [check_value_fits_in_bits(d, 16) for d in data]
+    [check_value_fits_in_bits(d, width) for d in data]
 
-    return int("".join([f"{i:016b}" for i in data[::-1]]), 2)
+    return int("".join([f"{i:0{width}b}" for i in data[::-1]]), 2)
 
 
-def value_to_words(data, n_words):
+def value_to_words(data, n_words, width=16):
     """
-    Takes a integer, interprets it as a set of 16-bit integers
-    concatenated together, and splits it into a list of 16-bit numbers.
+    Takes a integer, interprets it as a set of `width`-bit integers
+    concatenated together, and splits it into a list of `width`-bit numbers.
     """
 
     if not isinstance(data, int) or data < 0:
         raise ValueError("Behavior is only defined for nonnegative integers.")
 
-    # Convert to binary, split into 16-bit chunks, and then convert back to list of int
-    binary = f"{data:0b}".zfill(n_words * 16)
-    return [int(binary[i : i + 16], 2) for i in range(0, 16 * n_words, 16)][::-1]
+    # Convert to binary, split into chunks, and then convert back to list of int
+    binary = f"{data:0b}".zfill(n_words * width)
+    return [int(binary[i : i + width], 2) for i in range(0, width * n_words, width)][
+        ::-1
+    ]
 
 
 def check_value_fits_in_bits(value, n_bits):
@@ -153,6 +246,15 @@ def check_value_fits_in_bits(value, n_bits):
         raise ValueError("Signed integer too large.")
 
 
+def check_clock_domain(domain):
+    """
+    Check that a clock domain is given by name, and that it isn't the
+    combinational domain, which can't be used to clock a core.
+    """
+    if not isinstance(domain, str) or domain == "comb":
+        raise ValueError(f"Invalid clock domain '{domain}', must be a domain name.")
+
+
 def split_into_chunks(data, chunk_size):
     """
     Split a list into a list of lists, where each sublist has length `chunk_size`.
@@ -163,6 +265,50 @@ def split_into_chunks(data, chunk_size):
     return [data[i : i + chunk_size] for i in range(0, len(data), chunk_size)]
 
 
+def split_into_runs(data, max_length):
+    """
+    Split a list of integers into a list of lists, where each sublist contains
+    a run of consecutive, increasing integers (ie, [4, 5, 6]). No sublist will
+    be longer than `max_length`, or cross a multiple of 2**16, and the original
+    order is preserved. This keeps every address in a run on the same page.
+    """
+
+    runs = []
+    for d in data:
+        if (
+            runs
+            and (d == runs[-1][-1] + 1)
+            and (len(runs[-1]) < max_length)
+            and (d % 2**16 != 0)
+        ):
+            runs[-1].append(d)
+
+        else:
+            runs.append([d])
+
+    return runs
+
+
+def split_into_pages(addrs):
+    """
+    Split a list of addresses into a list of (page, offsets) tuples, where
+    each page is the upper bits of a run of addresses that share them, and
+    the offsets are the lower 16 bits of those addresses. The original order
+    is preserved.
+    """
+
+    pages = []
+    for addr in addrs:
+        page, offset = divmod(addr, 2**16)
+        if pages and pages[-1][0] == page:
+            pages[-1][1].append(offset)
+
+        else:
+            pages.append((page, [offset]))
+
+    return pages
+
+
 def make_build_dir_if_it_does_not_exist_already():
     """
     Make build/ if it doesn't exist already.
@@ -171,12 +317,13 @@ def make_build_dir_if_it_does_not_exist_already():
     Path("build").mkdir(parents=True, exist_ok=True)
 
 
-def simulate(top):
+def simulate(top, clocks={}):
     """
     A decorator for running behavioral simulation using Amaranth's built-in
     simulator. Requires the top-level module in the simulation as an argument,
     and automatically names VCD file containing the waveform dump in build/
-    with the name of the function being decorated.
+    with the name of the function being decorated. Any clock domains besides
+    `sync` can be given in `clocks`, which maps their names to their periods.
     """
 
     def decorator(testbench):
@@ -185,6 +332,9 @@ def simulate(top):
         def wrapper(*args, **kwargs):
             sim = Simulator(top)
             sim.add_clock(1e-6)  # 1 MHz
+            for domain, period in clocks.items():
+                sim.add_clock(period, domain=domain)
+
             sim.add_testbench(testbench)
 
             vcd_path = "build/" + testbench.__name__ + ".vcd"
@@ -0,0 +1,388 @@
+"""
+Fake FPGAs that answer the host side of the UART and Ethernet interfaces over a
+pseudoterminal or a UDP socket, and functions that build a Manta instance
+talking to one. These let the host's code be tested without any hardware.
+"""
+
+import os
+import socket
+import threading
+import time
+import tty
+from random import getrandbits, sample
+
+from amaranth import *
+
+from manta import *
+from manta.uart import BaudControl
+from manta.utils import *
+
+
+class FakeBaudControl:
+    """
+    Switch baudrates as the FPGA does when the host writes to the baud control
+    registers of a UARTInterface. Switches to any of the `rejected` baudrates
+    garble everything the host sends until the FPGA reverts the unconfirmed
+    switch, as if the host's USB-Serial adapter couldn't run that fast. At any
+    of the `unreliable` baudrates, short reads work, but only the first few
+    read requests received at once are answered.
+    """
+
+    def __init__(self, uart, rejected=(), unreliable=()):
+        self._uart = uart
+        self._rejected = rejected
+        self._unreliable = unreliable
+        self._divider = uart._get_divider(uart._baudrate)
+        self._new_divider = 0
+        self._previous_divider = None
+        self._switch_requested = False
+        self._deadline = 0
+
+    @property
+    def baudrate(self):
+        # Revert an unconfirmed switch once it has timed out
+        timed_out = time.monotonic() > self._deadline
+        if self._previous_divider is not None and timed_out:
+            self._divider = self._previous_divider
+            self._previous_divider = None
+
+        return round(self._uart._clock_freq * 2**16 / self._divider)
+
+    def write(self, addr, data):
+        base_addr = self._uart._base_addr
+        if addr == base_addr:
+            self._new_divider = (self._new_divider & 0xFFFF0000) | data
+
+        elif addr == base_addr + 1:
+            self._new_divider = (self._new_divider & 0xFFFF) | (data << 16)
+
+        elif addr == base_addr + 2 and data == BaudControl.SWITCH:
+            self._switch_requested = True
+
+        elif addr == base_addr + 2 and data == BaudControl.CONFIRM:
+            self._previous_divider = None
+
+    def is_garbled(self):
+        """
+        Return whether bytes received now are garbled, which they are until
+        a switch to a rejected baudrate is reverted.
+        """
+        baudrate = self.baudrate
+        return self._previous_divider is not None and baudrate in self._rejected
+
+    def is_unreliable(self):
+        return self.baudrate in self._unreliable
+
+    def idle(self, memory):
+        """
+        Make any requested switch once the line idles, and update the divider
+        that the host reads back.
+        """
+        if self._switch_requested:
+            self._switch_requested = False
+            self._previous_divider = self._divider
+            self._divider = self._new_divider
+            self._deadline = time.monotonic() + self._uart._BAUD_SWITCH_TIMEOUT
+
+        addrs = self._uart._registers._memory_map["clocks_per_baud"]["addrs"]
+        for addr, word in zip(addrs, value_to_words(self._divider, len(addrs))):
+            memory[addr] = word
+
+
+def fake_uart_fpga(
+    fd,
+    memory,
+    bus_width=16,
+    max_chunk=None,
+    max_stall_interval=None,
+    baud_control=None,
+):
+    """
+    Respond to ASCII read and write requests received on a pseudoterminal, as
+    the UART interface on the FPGA would. If `max_chunk` is provided, the
+    responses to any read requests past the first `max_chunk` received at
+    once are dropped, as if the host's input buffer had overflowed. If
+    `max_stall_interval` is provided, the responses to read requests sent
+    more than `max_stall_interval` requests after the last stall byte are
+    dropped, as if the FPGA's baudrate were slightly too slow. If
+    `baud_control` is provided, the baudrate can be switched through a
+    FakeBaudControl.
+    """
+    buffer = b""
+    n = bus_width // 4
+    page = 0
+
+    def write(addr, data):
+        memory[addr] = data
+        if baud_control:
+            baud_control.write(addr, data)
+
+    while True:
+        try:
+            buffer += os.read(fd, 4096)
+
+        except OSError:
+            return
+
+        chunk_limit = max_chunk
+        if baud_control and baud_control.is_garbled():
+            buffer = b""
+
+        elif baud_control and baud_control.is_unreliable():
+            chunk_limit = 4
+
+        # The line idles between chunks of requests, which lets a slow FPGA
+        # catch up just as a stall byte would
+        responses = b""
+        n_reads = 0
+        since_stall = 0
+        while buffer:
+            # Read requests end with their own EOL, so a lone EOL is a stall
+            if buffer[:1] == b"\n":
+                since_stall = 0
+                buffer = buffer[1:]
+
+            elif buffer[:1] == b"\r":
+                buffer = buffer[1:]
+
+            elif buffer[:1] == b"P" and len(buffer) >= 7:
+                page = int(buffer[1:5], 16) << 16
+                buffer = buffer[7:]
+
+            elif buffer[:1] == b"R" and len(buffer) >= 7:
+                addr = page + int(buffer[1:5], 16)
+                n_reads += 1
+                since_stall += 1
+
+                overflowed = chunk_limit and n_reads > chunk_limit
+                stalled = max_stall_interval and since_stall > max_stall_interval
+                if not (overflowed or stalled):
+                    responses += f"D{memory[addr]:0{n}X}\r\n".encode("ascii")
+
+                buffer = buffer[7:]
+
+            elif buffer[:1] == b"r" and len(buffer) >= 11:
+                addr, count = page + int(buffer[1:5], 16), int(buffer[5:9], 16)
+                for i in range(count):
+                    responses += f"D{memory[addr + i]:0{n}X}\r\n".encode("ascii")
+                buffer = buffer[11:]
+
+            elif buffer[:1] == b"W" and len(buffer) >= 7 + n:
+                write(page + int(buffer[1:5], 16), int(buffer[5 : 5 + n], 16))
+                buffer = buffer[7 + n :]
+
+            elif buffer[:1] == b"w" and len(buffer) >= 9:
+                addr, count = page + int(buffer[1:5], 16), int(buffer[5:9], 16)
+                if len(buffer) < 11 + n * count:
+                    break
+
+                for i in range(count):
+                    write(addr + i, int(buffer[9 + n * i : 9 + n * (i + 1)], 16))
+                buffer = buffer[11 + n * count :]
+
+            elif buffer[:1] in b"PRrWw":
+                break
+
+            else:
+                buffer = buffer[1:]
+
+        if responses:
+            os.write(fd, responses)
+
+        if baud_control:
+            baud_control.idle(memory)
+
+
+def fake_ethernet_fpga(
+    sock,
+    memory,
+    drop_every=None,
+    compact=False,
+    bus_width=16,
+    bus_addr_width=16,
+    short_every=None,
+):
+    """
+    Respond to packets of read and write requests received on a UDP socket, as
+    the Ethernet interface on the FPGA would. If `drop_every` is provided, the
+    response to every `drop_every`-th packet is dropped. If `short_every` is
+    provided, the response to every `short_every`-th packet loses its first
+    word, as happens when the FPGA can't send a response quickly enough.
+    """
+    n_packets = 0
+    n_bytes = bus_width // 8
+
+    while True:
+        try:
+            packet, addr = sock.recvfrom(65536)
+
+        except OSError:
+            return
+
+        # Each request is an opcode followed by an address and data, unless
+        # the requests are compact, in which case the opcode is in the header
+        words = [int.from_bytes(w, "little") for w in split_into_chunks(packet, 4)]
+        opcode = words[0] >> 16
+        words = words[1:]
+
+        # Wider addresses take their upper bits from the word after the header
+        page = 0
+        if bus_addr_width > 16:
+            page, words = words[0] << 16, words[1:]
+
+        responses = []
+        while words:
+            if not compact:
+                opcode, words = words[0], words[1:]
+
+            addr_bus, data = page + (words[0] & 0xFFFF), words[0] >> 16
+            words = words[1:]
+
+            if opcode == 0:
+                responses.append(memory[addr_bus])
+
+            elif opcode == 1:
+                memory[addr_bus] = data
+
+            # Burst requests carry a count in place of the data
+            elif opcode == 2:
+                responses += [memory[addr_bus + i] for i in range(data)]
+
+            elif opcode == 3:
+                n_words = -(-data * bus_width // 32)
+                packed = b"".join(w.to_bytes(4, "little") for w in words[:n_words])
+                for i, d in enumerate(split_into_chunks(packed, n_bytes)[:data]):
+                    memory[addr_bus + i] = int.from_bytes(d, "little")
+
+                words = words[n_words:]
+
+        # Responses take a word each, or two on a 64-bit bus
+        size = max(n_bytes, 4)
+        responses = b"".join(r.to_bytes(size, "little") for r in responses)
+
+        # Echo the sequence number in the header back as the trailer
+        responses += packet[:2] + bytes(2)
+
+        n_packets += 1
+        if drop_every and n_packets % drop_every == 0:
+            continue
+
+        if short_every and n_packets % short_every == 0:
+            responses = responses[4:]
+
+        sock.sendto(responses, addr)
+
+
+def uart_port(bus_width=16, bus_addr_width=16, **kwargs):
+    """
+    Start a fake UART FPGA on a new pseudoterminal, and return the name of the
+    port the host should open. Any keyword arguments are passed to
+    fake_uart_fpga().
+    """
+    controller, peripheral = os.openpty()
+    tty.setraw(peripheral)
+
+    memory = [0] * 2**bus_addr_width
+    thread = threading.Thread(
+        target=fake_uart_fpga,
+        args=(controller, memory, bus_width),
+        kwargs=kwargs,
+        daemon=True,
+    )
+    thread.start()
+    return os.ttyname(peripheral)
+
+
+def uart_manta(bus_width=16, bus_addr_width=16, fpga_kwargs=None, **kwargs):
+    port = uart_port(bus_width, bus_addr_width, **(fpga_kwargs or {}))
+
+    manta = Manta(bus_width=bus_width, bus_addr_width=bus_addr_width)
+    manta.interface = UARTInterface(
+        port=port, baudrate=115200, clock_freq=12e6, **kwargs
+    )
+    manta.cores.io = IOCore(inputs=[Signal(4, name="in")], outputs=[Signal(20)])
+    manta.cores.mem = MemoryCore("bidirectional", width=20, depth=512)
+    return manta
+
+
+def ethernet_manta(
+    udp_port,
+    drop_every=None,
+    bus_width=16,
+    bus_addr_width=16,
+    short_every=None,
+    **kwargs,
+):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.2", udp_port))
+
+    memory = [0] * 2**bus_addr_width
+    compact = kwargs.get("compact_requests", False)
+    thread = threading.Thread(
+        target=fake_ethernet_fpga,
+        args=(
+            sock,
+            memory,
+            drop_every,
+            compact,
+            bus_width,
+            bus_addr_width,
+            short_every,
+        ),
+        daemon=True,
+    )
+    thread.start()
+
+    manta = Manta(bus_width=bus_width, bus_addr_width=bus_addr_width)
+    manta.interface = EthernetInterface(
+        phy="LiteEthPHYRMII",
+        clk_freq=50e6,
+        fpga_ip_addr="127.0.0.2",
+        host_ip_addr="127.0.0.1",
+        udp_port=udp_port,
+        **kwargs,
+    )
+    manta.cores.io = IOCore(inputs=[Signal(4, name="in")], outputs=[Signal(20)])
+    manta.cores.mem = MemoryCore("bidirectional", width=20, depth=512)
+    return manta
+
+
+def push_stream_packets(interface, addr, datas, packet_size, skip=()):
+    """
+    Send data to the host in packets, as the FPGA does when a core pushes its
+    data to the host. The packets starting at the addresses in `skip` are lost.
+    """
+    host = interface._get_socket().getsockname()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    for i in range(0, len(datas), packet_size):
+        if addr + i in skip:
+            continue
+
+        words = datas[i : i + packet_size] + [2**31 | (addr + i)]
+        packet = b"".join(w.to_bytes(4, "little") for w in words)
+        sock.sendto(packet, host)
+
+    sock.close()
+
+
+def check_wide_bus(manta):
+    # Every address holds as many bits as the bus carries
+    addrs = list(range(0x1000, 0x1040)) + sample(range(0x1040, 0x2000), 20)
+    datas = [getrandbits(manta.bus_width) for _ in addrs]
+    manta.interface.write(addrs, datas)
+    assert manta.interface.read(addrs) == datas
+
+    value = getrandbits(20)
+    manta.cores.io.set_probe(manta.cores.io._outputs[0], value)
+    assert manta.cores.io.get_probe(manta.cores.io._outputs[0]) == value
+
+
+def check_paged_bus(manta):
+    # Addresses above 16 bits are reached by paging, including runs that
+    # cross from one page into the next
+    addrs = list(range(0xFFE0, 0x10020)) + sample(range(0x10020, 0xF0000), 50)
+    datas = [getrandbits(16) for _ in addrs]
+    manta.interface.write(addrs, datas)
+    assert manta.interface.read(addrs) == datas
+    assert manta.interface.read(addrs[::-1]) == datas[::-1]
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import tty
+from random import getrandbits, sample
+
+import pytest
+from fake_fpga import ethernet_manta, push_stream_packets, uart_manta
+
+from manta import *
+from manta.utils import *
+
+
+async def exercise_cores(manta):
+    value = getrandbits(20)
+    await manta.cores.io.aset_probe(manta.cores.io._outputs[0], value)
+    assert await manta.cores.io.aget_probe(manta.cores.io._outputs[0]) == value
+    assert await manta.cores.io.aget_probe("in") == 0
+
+    # Mix of runs and individual addresses
+    addrs = list(range(100, 300)) + sample(range(300, 512), 100)
+    datas = [getrandbits(20) for _ in addrs]
+    await manta.cores.mem.awrite(addrs, datas)
+    assert await manta.cores.mem.aread(addrs) == datas
+    assert await manta.cores.mem.aread(addrs[0]) == datas[0]
+
+    # The blocking methods should see the same memory
+    assert manta.cores.mem.read(addrs) == datas
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudoterminal")
+@pytest.mark.parametrize("chunks_in_flight", [1, 4])
+def test_uart_concurrent(chunks_in_flight):
+    mantas = [
+        uart_manta(chunk_size=64, chunks_in_flight=chunks_in_flight) for _ in range(4)
+    ]
+
+    async def main():
+        await asyncio.gather(*[exercise_cores(m) for m in mantas])
+
+    asyncio.run(main())
+
+    # Locks shouldn't carry over between event loops
+    asyncio.run(main())
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires loopback aliases")
+def test_ethernet_concurrent():
+    mantas = [ethernet_manta(udp_port) for udp_port in range(2001, 2005)]
+
+    async def main():
+        await asyncio.gather(*[exercise_cores(m) for m in mantas])
+
+    asyncio.run(main())
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudoterminal")
+def test_uart_read_timeout():
+    # Nothing ever responds on this pseudoterminal
+    controller, peripheral = os.openpty()
+    tty.setraw(peripheral)
+    uart = UARTInterface(port=os.ttyname(peripheral), baudrate=115200, clock_freq=12e6)
+
+    with pytest.raises(ValueError, match="Only got 0 out of 70 bytes."):
+        asyncio.run(uart.aread(list(range(0, 20, 2))))
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires loopback aliases")
+@pytest.mark.parametrize("chunks_in_flight, udp_port", [(1, 2080), (8, 2081)])
+def test_ethernet_lost_packets(chunks_in_flight, udp_port):
+    manta = ethernet_manta(
+        udp_port,
+        drop_every=7,
+        short_every=5,
+        chunks_in_flight=chunks_in_flight,
+        response_buffer_packets=chunks_in_flight,
+        mtu=576,
+        timeout=0.01,
+    )
+    datas = [getrandbits(16) for _ in range(2000)]
+    addrs = sample(range(2000), 2000)
+
+    async def main():
+        # Lost and partial responses should be resent, regardless of the
+        # order they arrive in
+        await manta.interface.awrite(list(range(2000)), datas)
+        assert await manta.interface.aread(addrs) == [datas[a] for a in addrs]
+
+        # Writes to the same address should land in order, even when resent
+        await manta.interface.awrite([6] * len(datas), datas)
+        assert await manta.interface.aread(6) == datas[-1]
+
+    with manta.interface:
+        asyncio.run(main())
+        n_reads, n_writes = manta.interface.get_retransmit_counts()
+        assert n_reads > 0 and n_writes > 0
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires loopback aliases")
+def test_ethernet_aread_stream():
+    manta = ethernet_manta(2051)
+    interface = manta.interface
+    datas = [getrandbits(16) for _ in range(1000)]
+
+    async def is_complete():
+        return await interface.aread(1000) == datas[0]
+
+    async def main():
+        await interface.awrite(list(range(1000, 2000)), datas)
+
+        push_stream_packets(interface, 1000, datas, 100, skip=[1000, 1900])
+        return await asyncio.gather(
+            interface.aread_stream(1000, 1000, is_complete),
+            interface.aread(list(range(1000, 2000))),
+        )
+
+    with interface:
+        assert asyncio.run(main()) == [datas, datas]
+
+
+def test_await_for_capture_yields():
+    from manta.logic_analyzer.fsm import LogicAnalyzerFSM, States
+
+    fsm = LogicAnalyzerFSM(8, base_addr=0, interface=None)
+    polls = []
+
+    class Registers:
+        async def aget_probe(self, name):
+            polls.append(name)
+            return States.CAPTURED if len(polls) == 5 else States.CAPTURING
+
+    fsm.registers = Registers()
+
+    async def count_other_work():
+        n_runs = 0
+        while len(polls) < 5:
+            n_runs += 1
+            await asyncio.sleep(0)
+
+        return n_runs
+
+    async def main():
+        return await asyncio.gather(fsm.await_for_capture(), count_other_work())
+
+    # Other coroutines should get to run between each poll
+    _, n_runs = asyncio.run(main())
+    assert polls == ["state"] * 5
+    assert n_runs >= 4
@@ -1,88 +1,106 @@
-from manta.uart import ReceiveBridge
+from manta.uart import ReceiveBridge, UARTInterface
+from manta.uart.codec import *
 from manta.utils import *
 
 bridge_rx = ReceiveBridge()
+bridge_rx_binary = ReceiveBridge(protocol="binary")
+bridge_rx_wide = ReceiveBridge(data_width=64)
+bridge_rx_wide_binary = ReceiveBridge(protocol="binary", data_width=32)
+bridge_rx_paged = ReceiveBridge(addr_width=20)
+bridge_rx_paged_binary = ReceiveBridge(protocol="binary", addr_width=20)
 
 
-async def verify_read_decoding(ctx, bytes, addr):
+def verify_transaction(ctx, bridge, addr, data, rw):
+    """
+    Verify that the transaction currently placed on the bus by the receive bridge
+    matches the provided address, data, and rw.
+    """
+    if ctx.get(bridge.addr_o) != addr:
+        raise ValueError("wrong addr!")
+
+    if ctx.get(bridge.rw_o) != rw:
+        raise ValueError("wrong rw!")
+
+    if ctx.get(bridge.data_o) != data:
+        raise ValueError("wrong data!")
+
+
+async def verify_read_decoding(ctx, bytes, addr, bridge=bridge_rx):
     """
     Send a series of bytes to the receive bridge, and verify that the bridge places
     a read request with the appropriate address on the internal bus.
     """
 
     valid_asserted = False
-    ctx.set(bridge_rx.valid_i, True)
+    ctx.set(bridge.valid_i, True)
 
     for i, byte in enumerate(bytes):
-        ctx.set(bridge_rx.data_i, byte)
+        ctx.set(bridge.data_i, byte)
 
-        if ctx.get(bridge_rx.valid_o) and (i > 0):
+        if ctx.get(bridge.valid_o) and (i > 0):
             valid_asserted = True
-            if ctx.get(bridge_rx.addr_o) != addr:
-                raise ValueError("wrong addr!")
-
-            if ctx.get(bridge_rx.rw_o) != 0:
-                raise ValueError("wrong rw!")
-
-            if ctx.get(bridge_rx.data_o) != 0:
-                raise ValueError("wrong data!")
+            verify_transaction(ctx, bridge, addr, 0, 0)
 
         await ctx.tick()
 
-    ctx.set(bridge_rx.valid_i, False)
-    ctx.set(bridge_rx.data_i, 0)
+    ctx.set(bridge.valid_i, False)
+    ctx.set(bridge.data_i, 0)
+
+    if ctx.get(bridge.valid_o):
+        valid_asserted = True
+        verify_transaction(ctx, bridge, addr, 0, 0)
 
-    if not valid_asserted and not ctx.get(bridge_rx.valid_o):
+    if not valid_asserted:
         raise ValueError("Bridge failed to output valid message.")
 
 
-async def verify_write_decoding(ctx, bytes, addr, data):
+async def verify_write_decoding(ctx, bytes, addr, data, bridge=bridge_rx):
     """
     Send a series of bytes to the receive bridge, and verify that the bridge places
     a write request with the appropriate address and data on the internal bus.
     """
     valid_asserted = False
-    ctx.set(bridge_rx.valid_i, True)
+    ctx.set(bridge.valid_i, True)
 
     for i, byte in enumerate(bytes):
-        ctx.set(bridge_rx.data_i, byte)
+        ctx.set(bridge.data_i, byte)
 
-        if ctx.get(bridge_rx.valid_o) and (i > 0):
+        if ctx.get(bridge.valid_o) and (i > 0):
             valid_asserted = True
-            if ctx.get(bridge_rx.addr_o) != addr:
-                raise ValueError("wrong addr!")
-
-            if ctx.get(bridge_rx.rw_o) != 1:
-                raise ValueError("wrong rw!")
-
-            if ctx.get(bridge_rx.data_o) != data:
-                raise ValueError("wrong data!")
+            verify_transaction(ctx, bridge, addr, data, 1)
 
         await ctx.tick()
 
-    ctx.set(bridge_rx.valid_i, False)
-    ctx.set(bridge_rx.data_i, 0)
+    ctx.set(bridge.valid_i, False)
+    ctx.set(bridge.data_i, 0)
 
-    if not valid_asserted and not ctx.get(bridge_rx.valid_o):
+    if ctx.get(bridge.valid_o):
+        valid_asserted = True
+        verify_transaction(ctx, bridge, addr, data, 1)
+
+    if not valid_asserted:
         raise ValueError("Bridge failed to output valid message.")
 
 
-async def verify_bad_bytes(ctx, bytes):
+async def verify_bad_bytes(ctx, bytes, bridge=bridge_rx):
     """
     Send a series of bytes to the receive bridge, and verify that the bridge does not
     place any transaction on the internal bus.
     """
-    ctx.set(bridge_rx.valid_i, True)
+    ctx.set(bridge.valid_i, True)
 
     for byte in bytes:
-        ctx.set(bridge_rx.data_i, byte)
+        ctx.set(bridge.data_i, byte)
 
-        if ctx.get(bridge_rx.valid_o):
+        if ctx.get(bridge.valid_o):
             raise ValueError("Bridge decoded invalid message.")
 
         await ctx.tick()
 
-    ctx.set(bridge_rx.valid_i, 0)
+    ctx.set(bridge.valid_i, 0)
+
+    if ctx.get(bridge.valid_o):
+        raise ValueError("Bridge decoded invalid message.")
 
 
 @simulate(bridge_rx)
@@ -111,3 +129,205 @@ async def test_no_decode(ctx):
     await verify_bad_bytes(ctx, b"RABCG\r\n")
     await verify_bad_bytes(ctx, b"WABC[]()##*@\r\n")
     await verify_bad_bytes(ctx, b"R\r\n")
+
+
+@simulate(bridge_rx_binary)
+async def test_binary_read_decode(ctx):
+    for addr in [0x0000, 0x1234, 0xBABE, 0x0A0D, 0xFFFF]:
+        request = b"R" + addr.to_bytes(2, "big")
+        await verify_read_decoding(ctx, request, addr, bridge_rx_binary)
+
+
+@simulate(bridge_rx_binary)
+async def test_binary_write_decode(ctx):
+    for addr, data in [(0x1234, 0x5678), (0xDEAD, 0xBEEF), (0x0A0D, 0x5257)]:
+        request = b"W" + addr.to_bytes(2, "big") + data.to_bytes(2, "big")
+        await verify_write_decoding(ctx, request, addr, data, bridge_rx_binary)
+
+
+@simulate(bridge_rx_binary)
+async def test_binary_no_decode(ctx):
+    # Stall bytes and other unrecognized preambles should be ignored
+    await verify_bad_bytes(ctx, b"\n\n\r", bridge_rx_binary)
+    await verify_bad_bytes(ctx, b"D\x12\x34", bridge_rx_binary)
+    await verify_bad_bytes(ctx, b"R\x12", bridge_rx_binary)
+
+
+async def collect_transactions(ctx, bridge, bytes):
+    """
+    Send a series of bytes to the receive bridge, and return every transaction
+    it places on the internal bus as a list of (addr, data, rw) tuples. This also
+    models the transmit bridge, which stays busy for a few clock cycles after
+    each read request is placed on the bus.
+    """
+    transactions = []
+    busy_cycles = 0
+
+    async def tick():
+        nonlocal busy_cycles
+
+        if ctx.get(bridge.valid_o):
+            addr = ctx.get(bridge.addr_o)
+            data = ctx.get(bridge.data_o)
+            rw = ctx.get(bridge.rw_o)
+            transactions.append((addr, data, rw))
+
+            if not rw:
+                if busy_cycles:
+                    raise ValueError("Read placed on bus while transmitter busy!")
+
+                busy_cycles = 5
+
+        ctx.set(bridge.tx_busy_i, busy_cycles > 0)
+        busy_cycles = max(busy_cycles - 1, 0)
+        await ctx.tick()
+
+    # Like the UARTReceiver, only present a new byte every few clock cycles
+    for byte in bytes:
+        ctx.set(bridge.data_i, byte)
+        ctx.set(bridge.valid_i, True)
+        await tick()
+
+        ctx.set(bridge.data_i, 0)
+        ctx.set(bridge.valid_i, False)
+        for _ in range(3):
+            await tick()
+
+    for _ in range(300):
+        await tick()
+
+    return transactions
+
+
+@simulate(bridge_rx)
+async def test_burst_read_decode(ctx):
+    transactions = await collect_transactions(ctx, bridge_rx, b"r12340005\r\n")
+    expected = [(0x1234 + i, 0, 0) for i in range(5)]
+    if transactions != expected:
+        raise ValueError(f"Got {transactions} instead of {expected}.")
+
+    transactions = await collect_transactions(ctx, bridge_rx, b"rFFFF0000\r\n")
+    if transactions != []:
+        raise ValueError("Burst read with zero count placed transactions on bus.")
+
+
+@simulate(bridge_rx)
+async def test_burst_write_decode(ctx):
+    request = b"wBEEF0003" + b"DEADB0BACAFE" + b"\r\n" + b"W12345678\r\n"
+    transactions = await collect_transactions(ctx, bridge_rx, request)
+    expected = [
+        (0xBEEF, 0xDEAD, 1),
+        (0xBEF0, 0xB0BA, 1),
+        (0xBEF1, 0xCAFE, 1),
+        (0x1234, 0x5678, 1),
+    ]
+    if transactions != expected:
+        raise ValueError(f"Got {transactions} instead of {expected}.")
+
+
+@simulate(bridge_rx_binary)
+async def test_binary_burst_decode(ctx):
+    request = b"r\x12\x34\x00\x04"
+    transactions = await collect_transactions(ctx, bridge_rx_binary, request)
+    expected = [(0x1234 + i, 0, 0) for i in range(4)]
+    if transactions != expected:
+        raise ValueError(f"Got {transactions} instead of {expected}.")
+
+    request = b"w\x00\x10\x00\x02\xab\xcd\x0a\x0d" + b"R\x00\x20"
+    transactions = await collect_transactions(ctx, bridge_rx_binary, request)
+    expected = [(0x0010, 0xABCD, 1), (0x0011, 0x0A0D, 1), (0x0020, 0, 0)]
+    if transactions != expected:
+        raise ValueError(f"Got {transactions} instead of {expected}.")
+
+
+@simulate(bridge_rx_binary)
+async def test_host_encoding_binary(ctx):
+    # Check that the requests encoded by the host are decoded by the bridge
+    uart = UARTInterface(
+        port="/dev/null", baudrate=115200, clock_freq=12e6, protocol="binary"
+    )
+
+    datas = [0x0A0D, 0x1234, 0x5678, 0x9ABC, 0xDEF0, 0x0052, 0x7700, 0x0077]
+    request = encode_burst_write_request(0x7, datas, "binary")
+    transactions = await collect_transactions(ctx, bridge_rx_binary, request)
+    expected = [(0x7 + i, d, 1) for i, d in enumerate(datas)]
+    if transactions != expected:
+        raise ValueError(f"Got {transactions} instead of {expected}.")
+
+    addrs = [3, 5] + list(range(7, 27))
+    singles, burst = uart._plan_read_transfers(addrs)[0]
+    if (singles != [3, 5]) or (burst != list(range(7, 27))):
+        raise ValueError("Contiguous addresses not coalesced into a burst.")
+
+    request = encode_read_requests(singles, "binary", stall_interval=16)
+    request += encode_burst_read_request(burst[0], len(burst), "binary")
+    transactions = await collect_transactions(ctx, bridge_rx_binary, request)
+    expected = [(a, 0, 0) for a in addrs]
+    if transactions != expected:
+        raise ValueError(f"Got {transactions} instead of {expected}.")
+
+
+@simulate(bridge_rx_wide)
+async def test_wide_decode(ctx):
+    # Addresses and counts stay 16 bits wide, while data takes the bus width
+    datas = [0xDEADBEEFB0BACAFE, 0x0000000000000001]
+    request = encode_burst_write_request(0x10, datas, "ascii", 64)
+    request += encode_burst_read_request(0x20, 2, "ascii")
+    transactions = await collect_transactions(ctx, bridge_rx_wide, request)
+    expected = [(0x10, datas[0], 1), (0x11, datas[1], 1), (0x20, 0, 0), (0x21, 0, 0)]
+    if transactions != expected:
+        raise ValueError(f"Got {transactions} instead of {expected}.")
+
+    request = b"W1234" + b"0123456789ABCDEF" + b"\r\n"
+    await verify_write_decoding(
+        ctx, request, 0x1234, 0x0123456789ABCDEF, bridge_rx_wide
+    )
+
+
+@simulate(bridge_rx_wide_binary)
+async def test_wide_binary_decode(ctx):
+    addrs = [0x0A0D, 0x1234]
+    datas = [0x52570A0D, 0xFFFFFFFF]
+    request = encode_write_requests(addrs, datas, "binary", 32)
+    request += encode_burst_write_request(0x40, datas, "binary", 32)
+    request += encode_read_requests(addrs, "binary", None)
+    transactions = await collect_transactions(ctx, bridge_rx_wide_binary, request)
+    expected = [(a, d, 1) for a, d in zip(addrs, datas)]
+    expected += [(0x40 + i, d, 1) for i, d in enumerate(datas)]
+    expected += [(a, 0, 0) for a in addrs]
+    if transactions != expected:
+        raise ValueError(f"Got {transactions} instead of {expected}.")
+
+
+async def verify_paged_decoding(ctx, bridge, protocol):
+    # The host precedes the requests in each page with a page request, and
+    # the page holds until the next one
+    uart = UARTInterface(
+        port="/dev/null", baudrate=115200, clock_freq=12e6, protocol=protocol
+    )
+    uart.bus_addr_width = 20
+
+    addrs = [0x0FFFE, 0x0FFFF, 0x10000, 0x10001, 0x10005, 0xABCDE, 0x00003]
+    datas = [0x1111, 0x2222, 0x3333, 0x4444, 0x5555, 0x6666, 0x7777]
+    request = uart._encode_writes(addrs, datas)
+    request += uart._encode_read_transfer([0x3ABCD, 0x00042], [0xF0010, 0xF0011])
+    transactions = await collect_transactions(ctx, bridge, request)
+    expected = [(a, d, 1) for a, d in zip(addrs, datas)]
+    expected += [(a, 0, 0) for a in [0x3ABCD, 0x00042, 0xF0010, 0xF0011]]
+    if transactions != expected:
+        raise ValueError(f"Got {transactions} instead of {expected}.")
+
+    request = encode_read_requests([0x1234], protocol, None)
+    transactions = await collect_transactions(ctx, bridge, request)
+    if transactions != [(0xF1234, 0, 0)]:
+        raise ValueError(f"Page not held between requests, got {transactions}.")
+
+
+@simulate(bridge_rx_paged)
+async def test_paged_decode(ctx):
+    await verify_paged_decoding(ctx, bridge_rx_paged, "ascii")
+
+
+@simulate(bridge_rx_paged_binary)
+async def test_paged_binary_decode(ctx):
+    await verify_paged_decoding(ctx, bridge_rx_paged_binary, "binary")
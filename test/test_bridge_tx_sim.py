@@ -1,12 +1,15 @@
-from random import sample
+from random import getrandbits, sample
 
 from manta.uart import TransmitBridge
 from manta.utils import *
 
 bridge_tx = TransmitBridge()
+bridge_tx_binary = TransmitBridge(protocol="binary")
+bridge_tx_wide = TransmitBridge(data_width=64)
+bridge_tx_wide_binary = TransmitBridge(protocol="binary", data_width=32)
 
 
-async def verify_encoding(ctx, data, bytes):
+async def verify_encoding(ctx, data, bytes, bridge_tx=bridge_tx):
     """
     Place a read response on the internal bus, and verify that the sequence of bytes
     sent from TransmitBridge matches the provided bytestring `bytes`.
@@ -45,7 +48,7 @@ async def verify_encoding(ctx, data, bytes):
 
         # Time out if not enough bytes after trying to get bytes 15 times
         iters += 1
-        if iters > 15:
+        if iters > len(bytes) + 8:
             raise ValueError("Timed out waiting for bytes.")
 
     # Verify bytes sent from ReceiveBridge match expected_bytes
@@ -58,3 +61,24 @@ async def test_some_random_values(ctx):
     for i in sample(range(0xFFFF), k=5000):
         expected = f"D{i:04X}\r\n".encode("ascii")
         await verify_encoding(ctx, i, expected)
+
+
+@simulate(bridge_tx_binary)
+async def test_some_random_values_binary(ctx):
+    for i in sample(range(0xFFFF), k=5000):
+        expected = b"D" + i.to_bytes(2, "big")
+        await verify_encoding(ctx, i, expected, bridge_tx_binary)
+
+
+@simulate(bridge_tx_wide)
+async def test_some_random_values_wide(ctx):
+    for i in [getrandbits(64) for _ in range(500)]:
+        expected = f"D{i:016X}\r\n".encode("ascii")
+        await verify_encoding(ctx, i, expected, bridge_tx_wide)
+
+
+@simulate(bridge_tx_wide_binary)
+async def test_some_random_values_wide_binary(ctx):
+    for i in [getrandbits(32) for _ in range(500)]:
+        expected = b"D" + i.to_bytes(4, "big")
+        await verify_encoding(ctx, i, expected, bridge_tx_wide_binary)
@@ -0,0 +1,194 @@
+from random import getrandbits
+
+from amaranth import *
+
+from manta import *
+from manta.utils import *
+
+
+class BusPort(Elaboratable):
+    """
+    A stand-in for an interface, whose bus is driven directly by the testbench.
+    """
+
+    def __init__(self):
+        self._bus_addr_width = 16
+        self.bus_width = 16
+
+    @property
+    def bus_width(self):
+        return self._bus_width
+
+    @bus_width.setter
+    def bus_width(self, value):
+        self._bus_width = value
+        self._define_bus()
+
+    @property
+    def bus_addr_width(self):
+        return self._bus_addr_width
+
+    @bus_addr_width.setter
+    def bus_addr_width(self, value):
+        self._bus_addr_width = value
+        self._define_bus()
+
+    def _define_bus(self):
+        self.bus_i = Signal(InternalBus(self._bus_width, self._bus_addr_width))
+        self.bus_o = Signal(InternalBus(self._bus_width, self._bus_addr_width))
+
+    def elaborate(self, platform):
+        return Module()
+
+
+def make_manta(
+    bus_topology, bus_width=16, bus_addr_width=16, bus_pipeline_stages=0, mem_depth=32
+):
+    manta = Manta(
+        bus_topology=bus_topology,
+        bus_width=bus_width,
+        bus_addr_width=bus_addr_width,
+        bus_pipeline_stages=bus_pipeline_stages,
+    )
+    manta.interface = BusPort()
+    manta.cores.io = IOCore(outputs=[Signal(bus_width, name="out")])
+    manta.cores.la = LogicAnalyzerCore(sample_depth=8, probes=[Signal(4)])
+    manta.cores.mem = MemoryCore("bidirectional", width=bus_width, depth=mem_depth)
+    return manta
+
+
+chain = make_manta("chain")
+star = make_manta("star")
+wide = make_manta("star", bus_width=64)
+paged = make_manta("chain", bus_addr_width=20, mem_depth=0x10040)
+pipelined_chain = make_manta("chain", bus_pipeline_stages=2)
+pipelined_star = make_manta("star", bus_pipeline_stages=2)
+
+
+async def run_transactions(ctx, manta, transactions):
+    """
+    Place a transaction on the bus every cycle, and return the responses along
+    with the number of cycles each took to come back.
+    """
+    bus_o = manta.interface.bus_o
+    bus_i = manta.interface.bus_i
+
+    responses = []
+    for cycle in range(len(transactions) + 50):
+        if cycle < len(transactions):
+            addr, data, rw = transactions[cycle]
+            ctx.set(bus_o.addr, addr)
+            ctx.set(bus_o.data, data)
+            ctx.set(bus_o.rw, rw)
+            ctx.set(bus_o.valid, 1)
+            ctx.set(bus_o.last, cycle == len(transactions) - 1)
+
+        else:
+            ctx.set(bus_o.valid, 0)
+            ctx.set(bus_o.last, 0)
+
+        if ctx.get(bus_i.valid):
+            responses.append(
+                (ctx.get(bus_i.addr), ctx.get(bus_i.data), ctx.get(bus_i.last), cycle)
+            )
+
+        await ctx.tick()
+
+    assert len(responses) == len(transactions)
+    return [(a, d, last) for a, d, last, _ in responses], [
+        cycle - i for i, (*_, cycle) in enumerate(responses)
+    ]
+
+
+async def verify_topology(ctx, manta):
+    io_addr = manta.cores.io._memory_map["out"]["addrs"][0]
+    mem = manta.cores.mem
+    unmapped = mem.max_addr + 10
+
+    # Write to the IO core and memory, then read everything back out of order
+    datas = [getrandbits(manta.bus_width) for _ in range(4)]
+    writes = [(io_addr, datas[0], 1)]
+    writes += [(mem.base_addr + i, d, 1) for i, d in enumerate(datas[1:])]
+    await run_transactions(ctx, manta, writes)
+
+    reads = [
+        (mem.base_addr + 2, 0, 0),
+        (io_addr, 0, 0),
+        (unmapped, 0, 0),
+        (mem.base_addr, 0, 0),
+        (io_addr, 0, 0),
+        (mem.base_addr + 1, 0, 0),
+    ]
+    responses, latencies = await run_transactions(ctx, manta, reads)
+
+    # Responses should come back in order, with unmapped reads passed through
+    assert responses == [
+        (mem.base_addr + 2, datas[3], 0),
+        (io_addr, datas[0], 0),
+        (unmapped, 0, 0),
+        (mem.base_addr, datas[1], 0),
+        (io_addr, datas[0], 0),
+        (mem.base_addr + 1, datas[2], 1),
+    ]
+
+    return latencies
+
+
+@simulate(chain)
+async def test_chain_topology(ctx):
+    latencies = await verify_topology(ctx, chain)
+
+    # Every transaction passes through every core
+    assert set(latencies) == {sum(c.bus_latency for c in chain.cores._cores.values())}
+
+
+@simulate(star)
+async def test_star_topology(ctx):
+    latencies = await verify_topology(ctx, star)
+
+    # Every transaction takes as long as the slowest core
+    assert set(latencies) == {max(c.bus_latency for c in star.cores._cores.values())}
+
+
+@simulate(wide)
+async def test_wide_bus(ctx):
+    await verify_topology(ctx, wide)
+
+    # Each address holds as many bits as the bus carries
+    assert wide.cores.io.max_addr == wide.cores.io.base_addr + 1
+    assert wide.cores.mem._n_mems == 1
+
+
+@simulate(paged)
+async def test_paged_bus(ctx):
+    await verify_topology(ctx, paged)
+
+    # Addresses past the first 64K reach the rest of the memory
+    addr = paged.cores.mem.base_addr + 0x10020
+    await run_transactions(ctx, paged, [(addr, 0x1234, 1)])
+    responses, _ = await run_transactions(
+        ctx, paged, [(addr, 0, 0), (addr - 2**16, 0, 0)]
+    )
+    assert responses == [(addr, 0x1234, 0), (addr - 2**16, 0, 1)]
+
+
+@simulate(pipelined_chain)
+async def test_pipelined_chain(ctx):
+    latencies = await verify_topology(ctx, pipelined_chain)
+
+    # Each core takes two extra cycles, except for the logic analyzer which
+    # takes six, since it's made of three smaller cores
+    cores = pipelined_chain.cores
+    assert cores.io.bus_latency == 3
+    assert cores.la.bus_latency == chain.cores.la.bus_latency + 6
+    assert cores.mem.bus_latency == 6
+    assert set(latencies) == {sum(c.bus_latency for c in cores._cores.values())}
+
+
+@simulate(pipelined_star)
+async def test_pipelined_star(ctx):
+    latencies = await verify_topology(ctx, pipelined_star)
+
+    # The bus is also registered on its way out to the cores and back
+    cores = pipelined_star.cores._cores.values()
+    assert set(latencies) == {max(c.bus_latency for c in cores) + 2}
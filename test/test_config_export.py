@@ -198,3 +198,69 @@ def test_ethernet_interface_dump():
 
     if data != expected:
         raise ValueError("Exported YAML does not match configuration!")
+
+
+def test_bus_dump():
+    manta = Manta(
+        bus_topology="star", bus_width=32, bus_addr_width=20, bus_pipeline_stages=2
+    )
+    manta.cores.test_core = IOCore(inputs=[Signal(1, name="probe0")])
+
+    # Create Temporary File
+    tf = tempfile.NamedTemporaryFile(suffix=".yaml", delete=False)
+    tf.close()
+
+    # Export Manta configuration
+    manta.export_config(tf.name)
+
+    # Parse the exported YAML
+    with open(tf.name, "r") as f:
+        data = yaml.safe_load(f)
+
+    # Verify that exported YAML matches configuration
+    expected = {"topology": "star", "width": 32, "addr_width": 20, "pipeline_stages": 2}
+    if data["bus"] != expected:
+        raise ValueError("Exported YAML does not match configuration!")
+
+    # And that it's read back in
+    imported = Manta.from_config(tf.name)
+    if (
+        imported._bus_topology != "star"
+        or imported.bus_width != 32
+        or imported.bus_addr_width != 20
+        or imported.bus_pipeline_stages != 2
+    ):
+        raise ValueError("Imported configuration does not match YAML!")
+
+
+def test_clock_domain_dump():
+    probe0 = Signal(1, name="probe0")
+    probe1 = Signal(2, name="probe1")
+
+    manta = Manta()
+    manta.cores.io_core = IOCore(inputs=[probe0], domain="fast")
+    manta.cores.mem_core = MemoryCore("bidirectional", 16, 64, domain="fast")
+    manta.cores.la_core = LogicAnalyzerCore(64, [probe1], domain="slow")
+
+    # Create Temporary File
+    tf = tempfile.NamedTemporaryFile(suffix=".yaml", delete=False)
+    tf.close()
+
+    # Export Manta configuration
+    manta.export_config(tf.name)
+
+    # Parse the exported YAML
+    with open(tf.name, "r") as f:
+        data = yaml.safe_load(f)
+
+    # Verify that exported YAML matches configuration
+    domains = {name: core.get("domain") for name, core in data["cores"].items()}
+    if domains != {"io_core": "fast", "mem_core": "fast", "la_core": "slow"}:
+        raise ValueError("Exported YAML does not match configuration!")
+
+    # And that it's read back in
+    imported = Manta.from_config(tf.name)
+    cores = imported.cores._cores
+    domains = {name: core._domain for name, core in cores.items()}
+    if domains != {"io_core": "fast", "mem_core": "fast", "la_core": "slow"}:
+        raise ValueError("Imported configuration does not match YAML!")
@@ -1,12 +1,22 @@
+import os
+import socket
+import threading
 import time
-from random import getrandbits
+from random import getrandbits, sample
 
 import pytest
 from amaranth import *
 from amaranth.lib import io
 from amaranth_boards.nexys4ddr import Nexys4DDRPlatform
+from fake_fpga import (
+    check_paged_bus,
+    check_wide_bus,
+    ethernet_manta,
+    push_stream_packets,
+)
 
 from manta import *
+from manta.ethernet.source_bridge import Opcodes
 from manta.utils import *
 
 
@@ -89,8 +99,8 @@ class EthernetMemoryCoreTest(Elaboratable):
     def verify(self):
         self.platform.build(self, do_program=True)
 
-        # Wait for the FPGA to acquire IP address
-        time.sleep(5)
+        # Wait for the Ethernet link to come up
+        self.manta.interface.wait_for_link()
 
         for addr in jumble(range(self.depth)):
             data = getrandbits(self.width)
@@ -107,3 +117,484 @@ class EthernetMemoryCoreTest(Elaboratable):
 @pytest.mark.skipif(not xilinx_tools_installed(), reason="no toolchain installed")
 def test_mem_core_xilinx():
     EthernetMemoryCoreTest(Nexys4DDRPlatform()).verify()
+
+
+def ethernet_interface(**kwargs):
+    config = dict(
+        phy="LiteEthPHYRMII",
+        vendor="xilinx",
+        clk_freq=50e6,
+        fpga_ip_addr="10.0.0.2",
+        host_ip_addr="10.0.0.1",
+    )
+    config.update(kwargs)
+    return EthernetInterface(**config)
+
+
+def test_default_mac_address():
+    # The MAC address should stay the same each time the core is generated
+    mac_address = ethernet_interface()._get_liteeth_config()["mac_address"]
+    assert ethernet_interface()._get_liteeth_config()["mac_address"] == mac_address
+
+    # And be locally administered, but differ between FPGAs
+    assert (mac_address >> 40) & 0x0F == 0x2
+    other = ethernet_interface(fpga_ip_addr="10.0.0.3")._get_liteeth_config()
+    assert other["mac_address"] != mac_address
+
+    # Unless one is provided
+    config = ethernet_interface(mac_address=0x10E2D5000001)._get_liteeth_config()
+    assert config["mac_address"] == 0x10E2D5000001
+
+
+def test_liteeth_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("MANTA_CACHE_DIR", str(tmp_path))
+
+    # Options that only affect the host don't change the generated core
+    interface = ethernet_interface()
+    key = interface._get_liteeth_cache_key()
+    assert ethernet_interface(timeout=1.0)._get_liteeth_cache_key() == key
+    assert ethernet_interface(udp_port=2002)._get_liteeth_cache_key() != key
+
+    # A cached core should be used instead of generating a new one
+    (tmp_path / "liteeth").mkdir()
+    (tmp_path / "liteeth" / f"{key}.v").write_text("module liteeth_core();")
+    assert interface.generate_liteeth_core() == "module liteeth_core();"
+
+
+def test_response_buffer_packets():
+    # The response buffer is sized by its own option, not by the host's
+    # number of chunks in flight, and doesn't change the LiteEth core
+    interface = ethernet_interface(response_buffer_packets=4)
+    assert interface.to_config()["response_buffer_packets"] == 4
+    assert "response_buffer_packets" not in interface._get_liteeth_config()
+    assert ethernet_interface(response_buffer_packets=4, chunks_in_flight=4)
+
+    with pytest.raises(ValueError, match="must not exceed response_buffer_packets"):
+        ethernet_interface(chunks_in_flight=2)
+
+
+def test_static_ip():
+    # DHCP is used by default, without taking up any address space
+    interface = ethernet_interface()
+    assert interface.base_addr == 2**16
+    assert interface._get_liteeth_config()["dhcp"]
+
+    with pytest.raises(ValueError, match="only has a DHCP status with dhcp_status"):
+        interface.get_dhcp_status()
+
+    # Unless its status is read, through registers at the top of the address
+    # space
+    interface = ethernet_interface(dhcp_status=True)
+    assert interface.base_addr < 2**16
+    assert interface.to_config()["dhcp_status"] is True
+    assert "dhcp_status" not in interface._get_liteeth_config()
+
+    # DHCP can also be left out entirely
+    interface = ethernet_interface(dhcp=False)
+    assert not interface._get_liteeth_config()["dhcp"]
+    assert interface.to_config()["dhcp"] is False
+
+    with pytest.raises(ValueError, match="dhcp_status requires dhcp"):
+        ethernet_interface(dhcp=False, dhcp_status=True)
+
+
+def test_dhcp_registers_address_space():
+    # Cores that would fit in the address space can't overlap the DHCP status
+    # registers at the top of it
+    interface = ethernet_interface(dhcp_status=True)
+    depth = interface.base_addr + 1
+
+    manta = Manta()
+    manta.interface = interface
+    with pytest.raises(ValueError, match="status of the DHCP engine"):
+        manta.cores.mem = MemoryCore("fpga_to_host", width=16, depth=depth)
+
+    manta = Manta()
+    manta.cores.mem = MemoryCore("fpga_to_host", width=16, depth=depth)
+    with pytest.raises(ValueError, match="status of the DHCP engine"):
+        manta.interface = ethernet_interface(dhcp_status=True)
+
+    # Without the DHCP status, the whole address space is available to the
+    # cores
+    manta = Manta()
+    manta.interface = ethernet_interface()
+    manta.cores.mem = MemoryCore("fpga_to_host", width=16, depth=depth)
+
+
+def words(*ws):
+    """
+    Return a list of 32-bit words as the bytes sent over Ethernet, least
+    significant byte first.
+    """
+    return b"".join(w.to_bytes(4, "little") for w in ws)
+
+
+def test_request_encoding():
+    interface = ethernet_interface()
+    requests = [
+        (Opcodes.READ, [0x1234], []),
+        (Opcodes.WRITE, [0x0010], [0xABCD]),
+        (Opcodes.BURST_WRITE, [0x0100, 0x0101, 0x0102], [0x1111, 0x2222, 0x3333]),
+    ]
+
+    # Data in a burst write is packed two to a word, and padded to a whole word
+    assert interface._encode_requests(requests, 0x0042) == words(
+        0x0042,
+        Opcodes.READ,
+        0x1234,
+        Opcodes.WRITE,
+        0xABCD0010,
+        Opcodes.BURST_WRITE,
+        0x00030100,
+        0x22221111,
+        0x00003333,
+    )
+
+    # Responses are unpacked from a view of the receive buffer
+    buffer = bytearray(words(0x1111, 0x2222, 0x0042) + bytes(8))
+    assert interface._decode_read_responses(memoryview(buffer)[:12]) == (
+        0x0042,
+        [0x1111, 0x2222],
+    )
+
+
+def test_wide_request_encoding():
+    interface = ethernet_interface()
+    interface.bus_width = 64
+
+    # Single writes only carry 16 bits of data, so wider data is always sent
+    # in burst writes, lower word first
+    packets = interface._plan_write_packets([0x0010], [0x0123456789ABCDEF])
+    assert interface._encode_requests(packets[0], 0x0042) == words(
+        0x0042, Opcodes.BURST_WRITE, 0x00010010, 0x89ABCDEF, 0x01234567
+    )
+
+    # Each read response takes two words, so half as many fit in a packet
+    assert interface._get_max_responses() == ((interface._mtu - 28) // 4 - 1) // 2
+    buffer = words(0x89ABCDEF, 0x01234567, 0x00000001, 0x00000000, 0x0042)
+    assert interface._decode_read_responses(buffer) == (
+        0x0042,
+        [0x0123456789ABCDEF, 0x1],
+    )
+
+    with pytest.raises(ValueError, match="must fit in 64 bits"):
+        interface._encode_requests(interface._plan_write_packets([0], [2**64])[0], 0)
+
+
+def test_paged_request_encoding():
+    interface = ethernet_interface(dhcp_status=True)
+    interface.bus_addr_width = 20
+    assert 2**16 < interface.base_addr < 2**20
+
+    # Every packet carries the page of its addresses after the header, so
+    # runs that cross a page are split between packets
+    packets = interface._plan_read_packets([0x0FFFF, 0x10000, 0x10001])
+    assert packets == [
+        [(Opcodes.BURST_READ, [0x0FFFF], [])],
+        [(Opcodes.BURST_READ, [0x10000, 0x10001], [])],
+    ]
+    assert interface._encode_requests(packets[1], 0x0042) == words(
+        0x0042, 0x0001, Opcodes.BURST_READ, 0x00020000
+    )
+
+    with pytest.raises(ValueError, match="must fit in 20 bits"):
+        interface._encode_requests(interface._plan_read_packets([2**20])[0], 0)
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires loopback aliases")
+def test_ethernet_socket_reuse():
+    manta = ethernet_manta(2005)
+
+    with EthernetInterface(
+        phy="LiteEthPHYRMII",
+        clk_freq=50e6,
+        fpga_ip_addr="127.0.0.2",
+        host_ip_addr="127.0.0.1",
+        udp_port=2005,
+        recv_buffer_size=2**16,
+    ) as interface:
+        interface.write(list(range(64)), list(range(64)))
+        assert interface.read(list(range(64))) == list(range(64))
+
+        # Reads and writes should all share one socket
+        sock = interface._get_socket()
+        assert interface.read(5) == 5
+        assert interface.read([6, 7]) == [6, 7]
+        assert interface._get_socket() is sock
+
+        # Linux reserves double the requested buffer size for bookkeeping
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= 2**16
+
+    # The port should be free again once the interface is closed
+    assert sock.fileno() == -1
+    assert manta.interface.read(7) == 7
+    manta.interface.close()
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires loopback aliases")
+def test_ethernet_shared_fpga():
+    manta = ethernet_manta(2026)
+
+    # Other hosts on the same port should be answered at their own address
+    others = [
+        EthernetInterface(
+            phy="LiteEthPHYRMII",
+            clk_freq=50e6,
+            fpga_ip_addr="127.0.0.2",
+            host_ip_addr=host_ip_addr,
+            udp_port=2026,
+        )
+        for host_ip_addr in ["127.0.0.1", "127.0.0.3", None]
+    ]
+    interfaces = [manta.interface] + others
+
+    results = {}
+
+    def exercise(interface, base):
+        addrs = list(range(base, base + 500))
+        datas = [getrandbits(16) for _ in addrs]
+        interface.write(addrs, datas)
+        results[base] = interface.read(addrs) == datas
+
+    threads = [
+        threading.Thread(target=exercise, args=(i, 500 * n))
+        for n, i in enumerate(interfaces)
+    ]
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert list(results.values()) == [True] * len(interfaces)
+
+    ports = {i._get_socket().getsockname()[1] for i in interfaces}
+    assert len(ports) == len(interfaces)
+
+    for interface in interfaces:
+        interface.close()
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires loopback aliases")
+@pytest.mark.parametrize("chunks_in_flight", [1, 8])
+def test_ethernet_lost_packets(chunks_in_flight):
+    manta = ethernet_manta(
+        2006 + chunks_in_flight,
+        drop_every=7,
+        chunks_in_flight=chunks_in_flight,
+        response_buffer_packets=chunks_in_flight,
+    )
+
+    with manta.interface:
+        datas = [getrandbits(16) for _ in range(2000)]
+        manta.interface.write(list(range(2000)), datas)
+
+        # Lost responses should be resent, regardless of the order they arrive
+        addrs = sample(range(2000), 2000)
+        assert manta.interface.read(addrs) == [datas[a] for a in addrs]
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires loopback aliases")
+def test_ethernet_short_responses():
+    manta = ethernet_manta(2075, short_every=5, timeout=0.01)
+
+    # Responses missing some of their data should be resent like lost ones
+    with manta.interface:
+        datas = [getrandbits(16) for _ in range(2000)]
+        manta.interface.write(list(range(2000)), datas)
+        assert manta.interface.read(list(range(2000))) == datas
+        assert manta.interface.get_retransmit_counts()[0] > 0
+
+    # Until the retries run out
+    manta = ethernet_manta(2076, short_every=1, timeout=0.01)
+
+    with manta.interface:
+        with pytest.raises(ValueError, match="Got less data than expected"):
+            manta.interface.read(list(range(10)))
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires loopback aliases")
+def test_ethernet_read_timeout():
+    manta = ethernet_manta(2020, drop_every=1, ack_writes=False)
+
+    with manta.interface:
+        with pytest.raises(ValueError, match="Timed out waiting for read responses"):
+            manta.interface.read(list(range(10)))
+
+        # Writes aren't waited on, so their lost acknowledgements go unnoticed
+        manta.interface.write(list(range(10)), list(range(10)))
+        assert manta.interface.get_retransmit_counts() == (3, 0)
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires loopback aliases")
+def test_ethernet_wait_for_link():
+    manta = ethernet_manta(2024, dhcp_status=True)
+
+    with manta.interface:
+        manta.interface.wait_for_link()
+        assert manta.interface.get_dhcp_status() == (False, "0.0.0.0")
+
+    # Each request should only be sent once, so that the wait doesn't overrun
+    # the timeout by several retries
+    manta = ethernet_manta(2025, drop_every=1, timeout=0.1, dhcp=False)
+
+    with manta.interface:
+        start = time.monotonic()
+        with pytest.raises(ValueError, match="Timed out waiting for FPGA"):
+            manta.interface.wait_for_link(timeout=0.15)
+
+        assert time.monotonic() - start < 0.35
+        assert manta.interface._retries == 3
+
+    # Errors from the host's network stack should be waited out too, as the
+    # FPGA may not be reachable until the link is up
+    manta = ethernet_manta(2027, timeout=0.01)
+    errors = [OSError("No route to host")] * 3
+    receive = manta.interface._receive
+
+    def unreachable_receive(sock):
+        if errors:
+            raise errors.pop()
+
+        return receive(sock)
+
+    manta.interface._receive = unreachable_receive
+
+    with manta.interface:
+        manta.interface.wait_for_link(timeout=1)
+        assert errors == []
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires loopback aliases")
+def test_ethernet_write_timeout():
+    manta = ethernet_manta(2021, drop_every=1, timeout=0.01, retries=5)
+
+    with manta.interface:
+        with pytest.raises(ValueError, match="Timed out waiting for write responses"):
+            manta.interface.write(list(range(10)), list(range(10)))
+
+        assert manta.interface.get_retransmit_counts() == (0, 5)
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires loopback aliases")
+@pytest.mark.parametrize("chunks_in_flight", [1, 8])
+def test_ethernet_lost_write_acks(chunks_in_flight):
+    manta = ethernet_manta(
+        2060 + chunks_in_flight,
+        drop_every=3,
+        chunks_in_flight=chunks_in_flight,
+        response_buffer_packets=chunks_in_flight,
+        mtu=576,
+    )
+
+    # Packets of writes whose acknowledgements are lost should be resent
+    with manta.interface:
+        datas = [getrandbits(16) for _ in range(0, 4000, 2)]
+        manta.interface.write(list(range(0, 4000, 2)), datas)
+        n_reads, n_writes = manta.interface.get_retransmit_counts()
+        assert n_reads == 0 and n_writes > 0
+        assert manta.interface.read(list(range(0, 4000, 2))) == datas
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires loopback aliases")
+def test_ethernet_resent_writes_in_order():
+    manta = ethernet_manta(
+        2074, drop_every=3, chunks_in_flight=8, response_buffer_packets=8, mtu=576
+    )
+
+    # Writes to the same address in later packets should never be overwritten
+    # when an earlier packet is resent
+    with manta.interface:
+        datas = [getrandbits(16) for _ in range(2000)]
+        manta.interface.write([5] * len(datas), datas)
+        assert manta.interface.get_retransmit_counts()[1] > 0
+        assert manta.interface.read(5) == datas[-1]
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires loopback aliases")
+@pytest.mark.parametrize("mtu, udp_port", [(576, 2030), (1500, 2031), (9000, 2032)])
+@pytest.mark.parametrize("compact_requests", [False, True])
+def test_ethernet_packet_sizes(mtu, udp_port, compact_requests):
+    udp_port += 10 * compact_requests
+    manta = ethernet_manta(udp_port, mtu=mtu, compact_requests=compact_requests)
+    interface = manta.interface
+
+    # Each packet of requests should fill, but not exceed, the MTU. Addresses
+    # that aren't consecutive are sent as individual requests.
+    request_size = 4 if compact_requests else 8
+    addrs = list(range(0, 10000, 2))
+    datas = [getrandbits(16) for _ in addrs]
+
+    packets = interface._get_write_packets(addrs, datas)
+    assert all(len(p) <= mtu - 28 for p in packets)
+    assert all(len(p) > mtu - 28 - request_size for p in packets[:-1])
+
+    with interface:
+        interface.write(addrs, datas)
+        assert interface.read(addrs) == datas
+
+    # Consecutive addresses are sent as bursts, which fill the packets of
+    # writes, and the responses to the packets of reads
+    addrs = list(range(10000))
+    datas = [getrandbits(16) for _ in addrs]
+
+    packets = interface._get_write_packets(addrs, datas)
+    assert all(mtu - 28 - 4 < len(p) <= mtu - 28 for p in packets[:-1])
+
+    chunks = interface._plan_read_packets(addrs)
+    assert len(chunks) == -(-len(addrs) // ((mtu - 28) // 4 - 1))
+
+    with interface:
+        interface.write(addrs, datas)
+        assert interface.read(addrs) == datas
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires loopback aliases")
+@pytest.mark.parametrize("bus_width, udp_port", [(32, 2070), (64, 2071)])
+def test_ethernet_wide_bus(bus_width, udp_port):
+    manta = ethernet_manta(udp_port, bus_width=bus_width)
+
+    with manta.interface:
+        check_wide_bus(manta)
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires loopback aliases")
+@pytest.mark.parametrize("compact_requests", [False, True])
+def test_ethernet_paged_bus(compact_requests):
+    udp_port = 2072 + compact_requests
+    manta = ethernet_manta(
+        udp_port, bus_addr_width=20, compact_requests=compact_requests
+    )
+
+    with manta.interface:
+        check_paged_bus(manta)
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires loopback aliases")
+def test_ethernet_read_stream():
+    manta = ethernet_manta(2050)
+    interface = manta.interface
+    datas = [getrandbits(16) for _ in range(1000)]
+    polls = []
+
+    def is_complete():
+        polls.append(None)
+        return len(polls) > 1
+
+    with interface:
+        interface.write(list(range(1000, 2000)), datas)
+
+        # Lost packets should be read from the FPGA
+        push_stream_packets(interface, 1000, datas, 100, skip=[1300])
+        assert interface.read_stream(1000, 1000, is_complete) == datas
+        assert polls == []
+
+        # Packets received during other reads should be set aside
+        push_stream_packets(interface, 1000, datas, 100)
+        assert interface.read(1500) == datas[500]
+        assert interface.read_stream(1000, 1000, is_complete) == datas
+
+        # If nothing arrives, the data should be read once the core says it's
+        # been pushed
+        assert interface.read_stream(1000, 1000, is_complete) == datas
+        assert len(polls) == 2
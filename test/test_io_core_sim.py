@@ -108,3 +108,60 @@ async def test_input_probes_update(ctx):
 
         for addr, data in zip(addrs, datas):
             await verify_register(io_core, ctx, addr, data)
+
+
+def make_cross_domain_io_core(domain):
+    core = IOCore(
+        inputs=[Signal(3, name="in_a"), Signal(20, name="in_b")],
+        outputs=[Signal(5, name="out_a"), Signal(20, name="out_b", init=7)],
+        domain=domain,
+    )
+    core.base_addr = 0
+    _ = core.max_addr
+    return core
+
+
+fast_io_core = make_cross_domain_io_core("fast")
+slow_io_core = make_cross_domain_io_core("slow")
+
+
+async def verify_cross_domain_probes(ctx, core):
+    strobe_addr = core._memory_map["strobe"]["addrs"][0]
+
+    async def pulse_strobe():
+        # Leave time for the handshake with the probes' domain to complete
+        for data in [0, 1, 0]:
+            await write_register(core, ctx, strobe_addr, data)
+
+        await ctx.tick().repeat(20)
+
+    # Outputs only change once they're strobed across
+    values = {o.name: getrandbits(len(o)) for o in core._outputs}
+    for o in core._outputs:
+        addrs = core._memory_map[o.name]["addrs"]
+        for addr, data in zip(addrs, value_to_words(values[o.name], len(addrs))):
+            await write_register(core, ctx, addr, data)
+
+    assert [ctx.get(o) for o in core._outputs] == [o.init for o in core._outputs]
+    await pulse_strobe()
+    assert [ctx.get(o) for o in core._outputs] == list(values.values())
+
+    # Inputs are sampled in their own domain, and then read from the bus
+    for i in core._inputs:
+        ctx.set(i, getrandbits(len(i)))
+
+    await pulse_strobe()
+    for i in core._inputs:
+        addrs = core._memory_map[i.name]["addrs"]
+        for addr, data in zip(addrs, value_to_words(ctx.get(i), len(addrs))):
+            await verify_register(core, ctx, addr, data)
+
+
+@simulate(fast_io_core, clocks={"fast": 0.3e-6})
+async def test_probes_in_faster_domain(ctx):
+    await verify_cross_domain_probes(ctx, fast_io_core)
+
+
+@simulate(slow_io_core, clocks={"slow": 2.7e-6})
+async def test_probes_in_slower_domain(ctx):
+    await verify_cross_domain_probes(ctx, slow_io_core)
@@ -1,6 +1,7 @@
 from amaranth import *
 
 from manta.logic_analyzer import LogicAnalyzerCore
+from manta.logic_analyzer.fsm import States
 from manta.logic_analyzer.trigger_block import Operations
 from manta.utils import *
 
@@ -96,3 +97,68 @@ async def test_single_shot_capture(ctx):
 
     for addr in range(la.max_addr):
         await print_data_at_addr(ctx, addr)
+
+
+fast_probe = Signal(8, name="fast_probe")
+fast_la = LogicAnalyzerCore(16, [fast_probe], domain="fast")
+fast_la.base_addr = 0
+_ = fast_la.max_addr
+
+
+@simulate(fast_la, clocks={"fast": 0.3e-6})
+async def test_capture_in_other_domain(ctx):
+    registers = fast_la._fsm.registers
+    strobe_addr = registers.base_addr
+
+    async def set_register(name, data):
+        await write_register(fast_la, ctx, strobe_addr, 0)
+        await write_register(
+            fast_la, ctx, registers._memory_map[name]["addrs"][0], data
+        )
+        await write_register(fast_la, ctx, strobe_addr, 1)
+        await ctx.tick().repeat(10)
+
+    async def read_register(addr):
+        ctx.set(fast_la.bus_i.addr, addr)
+        ctx.set(fast_la.bus_i.rw, 0)
+        ctx.set(fast_la.bus_i.valid, 1)
+        await ctx.tick()
+        ctx.set(fast_la.bus_i.valid, 0)
+
+        while not ctx.get(fast_la.bus_o.valid):
+            await ctx.tick()
+
+        return ctx.get(fast_la.bus_o.data)
+
+    await set_register("trigger_mode", 2)
+    await set_register("stream_enable", 1)
+
+    # Capture immediately while the probe changes on every cycle of its clock
+    await write_register(fast_la, ctx, strobe_addr, 0)
+    await write_register(
+        fast_la, ctx, registers._memory_map["request_start"]["addrs"][0], 1
+    )
+    await write_register(fast_la, ctx, strobe_addr, 1)
+
+    stream_requested = False
+    for i in range(100):
+        ctx.set(fast_probe, i)
+        await ctx.tick("fast")
+        stream_requested |= bool(ctx.get(fast_la._stream_request))
+
+    # The capture should complete, and be streamed out from the bus's domain
+    await ctx.tick().repeat(10)
+    await write_register(fast_la, ctx, strobe_addr, 0)
+    await write_register(fast_la, ctx, strobe_addr, 1)
+    await ctx.tick().repeat(10)
+
+    state_addr = registers._memory_map["state"]["addrs"][0]
+    assert await read_register(state_addr) == States.CAPTURED
+    assert stream_requested
+
+    # Each sample should have been taken on consecutive cycles of the probe's
+    # clock
+    start = fast_la._sample_mem.base_addr
+    samples = [await read_register(addr) for addr in range(start, start + 16)]
+    for prev, sample in zip(samples, samples[1:]):
+        assert sample == prev + 1
@@ -297,3 +297,37 @@ def test_mem_core(mode, width, depth, base_addr):
             await tests.bus_to_user_functionality()
 
     testbench()
+
+
+@pytest.mark.parametrize("domain, period", [("fast", 0.3e-6), ("slow", 2.7e-6)])
+def test_mem_core_domain(domain, period):
+    mem_core = MemoryCore("bidirectional", width=16, depth=32, domain=domain)
+    mem_core.base_addr = 0
+
+    @simulate(mem_core, clocks={domain: period})
+    async def testbench(ctx):
+        # Write from the user side in its own clock domain, and read back
+        # from the bus
+        datas = [getrandbits(16) for _ in range(32)]
+        for addr, data in enumerate(datas):
+            ctx.set(mem_core.user_addr, addr)
+            ctx.set(mem_core.user_data_in, data)
+            ctx.set(mem_core.user_write_enable, 1)
+            await ctx.tick(domain)
+
+        ctx.set(mem_core.user_write_enable, 0)
+
+        for addr, data in enumerate(datas):
+            await verify_register(mem_core, ctx, addr, data)
+
+        # Write from the bus, and read back from the user side
+        datas = [getrandbits(16) for _ in range(32)]
+        for addr, data in enumerate(datas):
+            await write_register(mem_core, ctx, addr, data)
+
+        for addr, data in enumerate(datas):
+            ctx.set(mem_core.user_addr, addr)
+            await ctx.tick(domain).repeat(2)
+            assert ctx.get(mem_core.user_data_out) == data
+
+    testbench()
@@ -0,0 +1,96 @@
+from random import getrandbits
+
+from manta.ethernet.raw_port import UDPRawPort
+from manta.utils import *
+
+raw_port = UDPRawPort(udp_port=2001, rx_depth=16, tx_depth=16)
+
+
+@simulate(raw_port)
+async def test_receive(ctx):
+    packets = [
+        (0x0A000001, 50000, [0x1111, 0x2222, 0x3333]),
+        (0x0A000002, 50001, [0x4444]),
+        (0x0A000003, 50002, [0x5555, 0x6666]),
+    ]
+
+    # Write all the packets into the port before reading any of them out
+    for ip, port, words in packets:
+        for i, word in enumerate(words):
+            ctx.set(raw_port.source_ip_address_i, ip)
+            ctx.set(raw_port.source_src_port_i, port)
+            ctx.set(raw_port.source_data_i, word)
+            ctx.set(raw_port.source_last_i, i == len(words) - 1)
+            ctx.set(raw_port.source_valid_i, 1)
+            assert ctx.get(raw_port.source_ready_o)
+            await ctx.tick()
+
+    ctx.set(raw_port.source_valid_i, 0)
+    await ctx.tick().repeat(2)
+
+    # Each packet's sender should be held while it's read out
+    for ip, port, words in packets:
+        for i, word in enumerate(words):
+            assert ctx.get(raw_port.valid_o)
+            assert ctx.get(raw_port.data_o) == word
+            assert ctx.get(raw_port.last_o) == (i == len(words) - 1)
+
+            ctx.set(raw_port.ready_i, 1)
+            await ctx.tick()
+            ctx.set(raw_port.ready_i, 0)
+
+            assert ctx.get(raw_port.reply_ip_o) == ip
+            assert ctx.get(raw_port.reply_port_o) == port
+
+        await ctx.tick().repeat(2)
+
+    assert not ctx.get(raw_port.valid_o)
+
+
+@simulate(raw_port)
+async def test_send(ctx):
+    packets = [
+        (0x0A000001, 50000, [getrandbits(32) for _ in range(5)]),
+        (0x0A000002, 50001, [getrandbits(32)]),
+        (0x0A000003, 50002, [getrandbits(32) for _ in range(3)]),
+    ]
+
+    assert ctx.get(raw_port.idle_o)
+
+    # The reply address only needs to be valid with the last word of a packet
+    for ip, port, words in packets:
+        for i, word in enumerate(words):
+            last = i == len(words) - 1
+            ctx.set(raw_port.reply_ip_i, ip if last else 0)
+            ctx.set(raw_port.reply_port_i, port if last else 0)
+            ctx.set(raw_port.data_i, word)
+            ctx.set(raw_port.last_i, last)
+            ctx.set(raw_port.valid_i, 1)
+            await ctx.tick()
+
+    ctx.set(raw_port.valid_i, 0)
+    assert not ctx.get(raw_port.idle_o)
+
+    # Packets should be sent whole to their reply address, even when LiteEth
+    # isn't always ready to take them
+    sent = []
+    words = []
+    for cycle in range(200):
+        ctx.set(raw_port.sink_ready_i, cycle % 3 != 0)
+
+        if ctx.get(raw_port.sink_valid_o) and ctx.get(raw_port.sink_ready_i):
+            assert ctx.get(raw_port.sink_src_port_o) == 2001
+            assert ctx.get(raw_port.sink_last_be_o) == 0b1000
+            words.append(ctx.get(raw_port.sink_data_o))
+
+            if ctx.get(raw_port.sink_last_o):
+                ip = ctx.get(raw_port.sink_ip_address_o)
+                port = ctx.get(raw_port.sink_dst_port_o)
+                assert ctx.get(raw_port.sink_length_o) == 4 * len(words)
+                sent.append((ip, port, words))
+                words = []
+
+        await ctx.tick()
+
+    assert sent == packets
+    assert ctx.get(raw_port.idle_o)
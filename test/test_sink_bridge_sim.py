@@ -0,0 +1,252 @@
+from random import getrandbits
+
+from amaranth import *
+from amaranth.lib.fifo import SyncFIFOBuffered
+
+from manta.ethernet.sink_bridge import UDPSinkBridge
+from manta.ethernet.source_bridge import UDPSourceBridge
+from manta.utils import *
+
+
+class UDPBridgeLoopback(Elaboratable):
+    """
+    A UDPSourceBridge and UDPSinkBridge connected through a model of a set of
+    cores, which delays each bus transaction by a few clock cycles and responds
+    to reads with the bitwise inverse of the address. Responses are assumed to
+    be sent as soon as they leave the UDPSinkBridge.
+    """
+
+    def __init__(self, latency, compact=False, data_width=16):
+        self.source_bridge = UDPSourceBridge(
+            compact=compact, stream_packet_size=8, data_width=data_width
+        )
+        self.compact = compact
+        self.data_width = data_width
+        self.sink_bridge = UDPSinkBridge(data_width)
+        self._latency = latency
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.source_bridge = source_bridge = self.source_bridge
+        m.submodules.sink_bridge = sink_bridge = self.sink_bridge
+
+        # On wider busses, the address is repeated across the data
+        addr = source_bridge.bus_o.addr
+        bus_pipe = [Signal(InternalBus(self.data_width)) for _ in range(self._latency)]
+        m.d.sync += bus_pipe[0].eq(source_bridge.bus_o)
+        with m.If(source_bridge.bus_o.valid & ~source_bridge.bus_o.rw):
+            m.d.sync += bus_pipe[0].data.eq(~Cat([addr] * (self.data_width // 16)))
+
+        for i in range(1, self._latency):
+            m.d.sync += bus_pipe[i].eq(bus_pipe[i - 1])
+
+        m.d.comb += sink_bridge.bus_i.eq(bus_pipe[-1])
+
+        m.submodules.seq_fifo = seq_fifo = SyncFIFOBuffered(width=32, depth=32)
+        m.d.comb += seq_fifo.w_data.eq(source_bridge.seq_o)
+        m.d.comb += seq_fifo.w_en.eq(source_bridge.seq_valid_o)
+        m.d.comb += sink_bridge.seq_i.eq(seq_fifo.r_data)
+        m.d.comb += sink_bridge.seq_valid_i.eq(seq_fifo.r_rdy)
+        m.d.comb += seq_fifo.r_en.eq(sink_bridge.seq_ready_o)
+
+        m.d.comb += source_bridge.trailer_sent_i.eq(sink_bridge.seq_ready_o)
+        m.d.comb += source_bridge.tx_idle_i.eq(1)
+
+        return m
+
+
+async def send_packets(ctx, loopback, packets, writes=None):
+    """
+    Send a series of back-to-back packets to the UDPSourceBridge, and return
+    the packets that the UDPSinkBridge sends back. The address and data of
+    each write that reaches the UDPSinkBridge are appended to `writes`, if
+    it's provided.
+    """
+    source_bridge = loopback.source_bridge
+    sink_bridge = loopback.sink_bridge
+    words = [(w, i == len(p) - 1) for p in packets for i, w in enumerate(p)]
+
+    responses = []
+    response = []
+    i = 0
+    for _ in range(len(words) + 200):
+        sending = i < len(words)
+        data, last = words[i] if sending else (0, False)
+        ctx.set(source_bridge.data_i, data)
+        ctx.set(source_bridge.last_i, last)
+        ctx.set(source_bridge.valid_i, sending)
+
+        if sending and ctx.get(source_bridge.ready_o):
+            i += 1
+
+        await ctx.tick()
+
+        bus_i = sink_bridge.bus_i
+        if writes is not None and ctx.get(bus_i.valid) and ctx.get(bus_i.rw):
+            writes.append((ctx.get(bus_i.addr), ctx.get(bus_i.data)))
+
+        if ctx.get(sink_bridge.valid_o):
+            response.append(ctx.get(sink_bridge.data_o))
+
+            if ctx.get(sink_bridge.last_o):
+                responses.append(response)
+                response = []
+
+    assert i == len(words)
+    assert response == []
+    return responses
+
+
+def encode_packet(seq, opcode, addrs, datas, compact):
+    if compact:
+        return [seq | (opcode << 16)] + [(d << 16) | a for a, d in zip(addrs, datas)]
+
+    return [seq] + [w for a, d in zip(addrs, datas) for w in (opcode, (d << 16) | a)]
+
+
+loopback_short = UDPBridgeLoopback(latency=1)
+loopback_long = UDPBridgeLoopback(latency=12)
+loopback_compact_short = UDPBridgeLoopback(latency=1, compact=True)
+loopback_compact_long = UDPBridgeLoopback(latency=12, compact=True)
+
+
+async def verify_back_to_back_packets(ctx, loopback):
+    def read_packet(seq, addrs):
+        return encode_packet(seq, 0, addrs, [0] * len(addrs), loopback.compact)
+
+    def write_packet(seq, addrs, datas):
+        return encode_packet(seq, 1, addrs, datas, loopback.compact)
+
+    def burst_read_packet(seq, addr, count):
+        return encode_packet(seq, 2, [addr], [count], loopback.compact)
+
+    packets = [
+        read_packet(0x0001, [0x1234]),
+        read_packet(0x0002, [0x0000, 0x5678, 0xFFFF]),
+        write_packet(0x0003, [0x0010, 0x0011], [0xAAAA, 0xBBBB]),
+        read_packet(0x0004, [0x0003]),
+        read_packet(0xFFFF, [0x0001, 0x0002]),
+        burst_read_packet(0x0005, 0x0100, 20),
+        read_packet(0x0006, [0x0004]),
+    ]
+
+    # Each response should contain the read data followed by the sequence
+    # number, and a packet of writes should be answered by just the sequence
+    # number
+    responses = await send_packets(ctx, loopback, packets)
+    assert responses == [
+        [0xEDCB, 0x0001],
+        [0xFFFF, 0xA987, 0x0000, 0x0002],
+        [0x0003],
+        [0xFFFC, 0x0004],
+        [0xFFFE, 0xFFFD, 0xFFFF],
+        [0xFFFF & ~a for a in range(0x0100, 0x0114)] + [0x0005],
+        [0xFFFB, 0x0006],
+    ]
+
+
+@simulate(loopback_short)
+async def test_back_to_back_packets_short_latency(ctx):
+    await verify_back_to_back_packets(ctx, loopback_short)
+
+
+@simulate(loopback_long)
+async def test_back_to_back_packets_long_latency(ctx):
+    await verify_back_to_back_packets(ctx, loopback_long)
+
+
+@simulate(loopback_compact_short)
+async def test_back_to_back_compact_packets_short_latency(ctx):
+    await verify_back_to_back_packets(ctx, loopback_compact_short)
+
+
+@simulate(loopback_compact_long)
+async def test_back_to_back_compact_packets_long_latency(ctx):
+    await verify_back_to_back_packets(ctx, loopback_compact_long)
+
+
+@simulate(loopback_long)
+async def test_stream_then_packet(ctx):
+    source_bridge = loopback_long.source_bridge
+
+    # Push twenty addresses to the host, while a packet of reads waits
+    ctx.set(source_bridge.stream_addr_i, 0x0200)
+    ctx.set(source_bridge.stream_count_i, 20)
+    ctx.set(source_bridge.stream_valid_i, 1)
+    await ctx.tick()
+    ctx.set(source_bridge.stream_valid_i, 0)
+
+    packets = [encode_packet(0x0007, 0, [0x0001], [0], compact=False)]
+    responses = await send_packets(ctx, loopback_long, packets)
+
+    # The pushed data is split into packets that each end with their first
+    # address and the top bit set, followed by the response to the reads
+    def stream_response(addr, count):
+        return [0xFFFF & ~a for a in range(addr, addr + count)] + [0x8000_0000 | addr]
+
+    assert responses == [
+        stream_response(0x0200, 8),
+        stream_response(0x0208, 8),
+        stream_response(0x0210, 4),
+        [0xFFFE, 0x0007],
+    ]
+
+
+loopback_wide = UDPBridgeLoopback(latency=3, data_width=32)
+loopback_wider = UDPBridgeLoopback(latency=3, data_width=64)
+
+
+async def verify_wide_packets(ctx, loopback):
+    width = loopback.data_width
+
+    def words(value):
+        # Data is sent in 32-bit words, lower word first
+        return [(value >> i) & 0xFFFF_FFFF for i in range(0, width, 32)]
+
+    def response(addrs):
+        inverse = 2**width - 1
+        return [w for a in addrs for w in words(inverse & ~(a * inverse // 0xFFFF))]
+
+    datas = [getrandbits(width) for _ in range(3)]
+    burst_write = [0x0002, 3, (3 << 16) | 0x0040]
+    burst_write += [w for d in datas for w in words(d)]
+
+    packets = [
+        encode_packet(0x0001, 0, [0x1234, 0x0001], [0, 0], compact=False),
+        burst_write,
+        encode_packet(0x0003, 2, [0x0100], [5], compact=False),
+    ]
+
+    writes = []
+    responses = await send_packets(ctx, loopback, packets, writes)
+    assert writes == [(0x0040 + i, d) for i, d in enumerate(datas)]
+    assert responses == [
+        response([0x1234, 0x0001]) + [0x0001],
+        [0x0002],
+        response(range(0x0100, 0x0105)) + [0x0003],
+    ]
+
+    # Pushed data is sent the same way
+    source_bridge = loopback.source_bridge
+    ctx.set(source_bridge.stream_addr_i, 0x0200)
+    ctx.set(source_bridge.stream_count_i, 10)
+    ctx.set(source_bridge.stream_valid_i, 1)
+    await ctx.tick()
+    ctx.set(source_bridge.stream_valid_i, 0)
+
+    responses = await send_packets(ctx, loopback, [])
+    assert responses == [
+        response(range(0x0200, 0x0208)) + [0x8000_0200],
+        response(range(0x0208, 0x020A)) + [0x8000_0208],
+    ]
+
+
+@simulate(loopback_wide)
+async def test_32_bit_bus(ctx):
+    await verify_wide_packets(ctx, loopback_wide)
+
+
+@simulate(loopback_wider)
+async def test_64_bit_bus(ctx):
+    await verify_wide_packets(ctx, loopback_wider)
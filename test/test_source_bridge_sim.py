@@ -2,6 +2,53 @@ from manta.ethernet import UDPSourceBridge
 from manta.utils import *
 
 source_bridge = UDPSourceBridge()
+source_bridge_compact = UDPSourceBridge(compact=True)
+source_bridge_stream = UDPSourceBridge(stream_packet_size=4)
+source_bridge_paged = UDPSourceBridge(compact=True, stream_packet_size=4, addr_width=20)
+
+
+async def send_packet(ctx, words, source_bridge=source_bridge):
+    """
+    Send a packet of 32-bit words to the UDPSourceBridge, and return the bus
+    transactions and sequence numbers that it outputs in response.
+    """
+    transactions = []
+    seqs = []
+
+    # Hold each word on the stream until the bridge is ready to take it, and
+    # wait a few cycles after the last one for the bridge to finish
+    i = 0
+    idle_cycles = 0
+    while idle_cycles < 2:
+        sending = i < len(words)
+        ctx.set(source_bridge.data_i, words[i] if sending else 0)
+        ctx.set(source_bridge.valid_i, sending)
+        ctx.set(source_bridge.last_i, i == len(words) - 1)
+
+        if ctx.get(source_bridge.ready_o):
+            if sending:
+                i += 1
+
+            else:
+                idle_cycles += 1
+
+        await ctx.tick()
+
+        if ctx.get(source_bridge.bus_o.valid):
+            bus = source_bridge.bus_o
+            transactions.append(
+                (
+                    ctx.get(bus.addr),
+                    ctx.get(bus.data),
+                    ctx.get(bus.rw),
+                    ctx.get(bus.last),
+                )
+            )
+
+        if ctx.get(source_bridge.seq_valid_o):
+            seqs.append(ctx.get(source_bridge.seq_o))
+
+    return transactions, seqs
 
 
 @simulate(source_bridge)
@@ -11,28 +58,195 @@ async def test_normie_ops(ctx):
     ctx.set(source_bridge.valid_i, 0)
     await ctx.tick()
 
-    ctx.set(source_bridge.data_i, 0x0000_0001)
-    ctx.set(source_bridge.valid_i, 1)
-    await ctx.tick()
+    # Write followed by a read
+    words = [0x0000_BEEF, 0x0000_0001, 0x1234_5678, 0x0000_0000, 0x90AB_CDEF]
+    transactions, seqs = await send_packet(ctx, words)
+    assert transactions == [(0x5678, 0x1234, 1, 0), (0xCDEF, 0x90AB, 0, 1)]
+    assert seqs == [0xBEEF]
 
-    ctx.set(source_bridge.data_i, 0x1234_5678)
-    await ctx.tick()
+    # Packet with a single read
+    words = [0x0000_0042, 0x0000_0000, 0x0000_0005]
+    transactions, seqs = await send_packet(ctx, words)
+    assert transactions == [(0x0005, 0x0000, 0, 1)]
+    assert seqs == [0x0042]
 
-    ctx.set(source_bridge.valid_i, 0)
-    await ctx.tick().repeat(2)
 
-    ctx.set(source_bridge.valid_i, 1)
-    ctx.set(source_bridge.data_i, 0x0000_0001)
-    await ctx.tick()
+@simulate(source_bridge)
+async def test_malformed_packet(ctx):
+    # A packet ending halfway through a request shouldn't misalign the next
+    transactions, seqs = await send_packet(ctx, [0x0000_0001, 0x0000_0000])
+    assert transactions == []
+    assert seqs == []
 
-    ctx.set(source_bridge.data_i, 0x90AB_CDEF)
-    await ctx.tick()
+    transactions, seqs = await send_packet(ctx, [0x0000_0002, 0x0000_0001, 0x0007_0006])
+    assert transactions == [(0x0006, 0x0007, 1, 1)]
+    assert seqs == [0x0002]
+
+
+@simulate(source_bridge_compact)
+async def test_compact_ops(ctx):
+    bridge = source_bridge_compact
+
+    # Packet of writes, with the opcode in the upper half of the header
+    words = [0x0001_BEEF, 0x1234_5678, 0x90AB_CDEF]
+    transactions, seqs = await send_packet(ctx, words, bridge)
+    assert transactions == [(0x5678, 0x1234, 1, 0), (0xCDEF, 0x90AB, 1, 1)]
+    assert seqs == [0xBEEF]
+
+    # Packet of reads
+    words = [0x0000_0042, 0x0000_0005, 0x0000_0006, 0x0000_0007]
+    transactions, seqs = await send_packet(ctx, words, bridge)
+    assert transactions == [(5, 0, 0, 0), (6, 0, 0, 0), (7, 0, 0, 1)]
+    assert seqs == [0x0042]
+
+
+@simulate(source_bridge)
+async def test_burst_ops(ctx):
+    # Burst read of three addresses, followed by a single read
+    words = [0x0000_0007, 0x0000_0002, 0x0003_FFFE, 0x0000_0000, 0x0000_0010]
+    transactions, seqs = await send_packet(ctx, words)
+    assert transactions == [
+        (0xFFFE, 0, 0, 0),
+        (0xFFFF, 0, 0, 0),
+        (0x0000, 0, 0, 0),
+        (0x0010, 0, 0, 1),
+    ]
+    assert seqs == [0x0007]
 
-    ctx.set(source_bridge.data_i, 0x0000_0000)
+    # Burst write of three values, with the last half of the data word unused,
+    # followed by a burst read that ends the packet
+    words = [
+        0x0000_0008,
+        0x0000_0003,
+        0x0003_0100,
+        0xBBBB_AAAA,
+        0x0000_CCCC,
+        0x0000_0002,
+        0x0002_0200,
+    ]
+    transactions, seqs = await send_packet(ctx, words)
+    assert transactions == [
+        (0x0100, 0xAAAA, 1, 0),
+        (0x0101, 0xBBBB, 1, 0),
+        (0x0102, 0xCCCC, 1, 0),
+        (0x0200, 0, 0, 0),
+        (0x0201, 0, 0, 1),
+    ]
+    assert seqs == [0x0008]
+
+    # Burst write that ends the packet with both halves of the last word used
+    words = [0x0000_0009, 0x0000_0003, 0x0002_0300, 0x2222_1111]
+    transactions, seqs = await send_packet(ctx, words)
+    assert transactions == [(0x0300, 0x1111, 1, 0), (0x0301, 0x2222, 1, 1)]
+    assert seqs == [0x0009]
+
+
+@simulate(source_bridge_compact)
+async def test_compact_burst_ops(ctx):
+    bridge = source_bridge_compact
+
+    # Packet of burst reads, with the opcode in the upper half of the header
+    words = [0x0002_0001, 0x0002_0010, 0x0001_0020]
+    transactions, seqs = await send_packet(ctx, words, bridge)
+    assert transactions == [(0x10, 0, 0, 0), (0x11, 0, 0, 0), (0x20, 0, 0, 1)]
+    assert seqs == [0x0001]
+
+    # Packet of burst writes
+    words = [0x0003_0002, 0x0001_0030, 0x0000_5555, 0x0002_0040, 0x7777_6666]
+    transactions, seqs = await send_packet(ctx, words, bridge)
+    assert transactions == [
+        (0x30, 0x5555, 1, 0),
+        (0x40, 0x6666, 1, 0),
+        (0x41, 0x7777, 1, 1),
+    ]
+    assert seqs == [0x0002]
+
+
+@simulate(source_bridge_stream)
+async def test_stream(ctx):
+    bridge = source_bridge_stream
+    ctx.set(bridge.tx_idle_i, 1)
+
+    # Ask for ten addresses to be pushed to the host
+    ctx.set(bridge.stream_addr_i, 0x0100)
+    ctx.set(bridge.stream_count_i, 10)
+    ctx.set(bridge.stream_valid_i, 1)
+    assert ctx.get(bridge.stream_ready_o)
+    assert not ctx.get(bridge.ready_o)
     await ctx.tick()
+    ctx.set(bridge.stream_valid_i, 0)
+
+    # Each packet's trailer is sent some time after its last read, and the
+    # next packet shouldn't start until then
+    packets = []
+    trailer_sent_at = None
+    for cycle in range(100):
+        ctx.set(bridge.trailer_sent_i, cycle == trailer_sent_at)
+        await ctx.tick()
+
+        if ctx.get(bridge.bus_o.valid):
+            assert trailer_sent_at is None or cycle > trailer_sent_at
+            if not packets or packets[-1][1] is not None:
+                packets.append(([], None))
+
+            packets[-1][0].append(ctx.get(bridge.bus_o.addr))
+            assert not ctx.get(bridge.bus_o.rw)
 
-    ctx.set(source_bridge.data_i, 0x1234_5678)
+        if ctx.get(bridge.seq_valid_o):
+            packets[-1] = (packets[-1][0], ctx.get(bridge.seq_o))
+            trailer_sent_at = cycle + 10
+
+    assert packets == [
+        ([0x100, 0x101, 0x102, 0x103], 0x8000_0100),
+        ([0x104, 0x105, 0x106, 0x107], 0x8000_0104),
+        ([0x108, 0x109], 0x8000_0108),
+    ]
+
+    # Requests are taken again once the stream is finished
+    ctx.set(bridge.trailer_sent_i, 0)
+    words = [0x0000_0042, 0x0000_0000, 0x0000_0005]
+    transactions, seqs = await send_packet(ctx, words, bridge)
+    assert transactions == [(0x0005, 0x0000, 0, 1)]
+    assert seqs == [0x0042]
+
+
+@simulate(source_bridge_paged)
+async def test_paged_ops(ctx):
+    bridge = source_bridge_paged
+    ctx.set(bridge.tx_idle_i, 1)
+
+    # Data pushed to the host carries its whole address in the trailer
+    ctx.set(bridge.stream_addr_i, 0xB0100)
+    ctx.set(bridge.stream_count_i, 2)
+    ctx.set(bridge.stream_valid_i, 1)
     await ctx.tick()
+    ctx.set(bridge.stream_valid_i, 0)
 
-    ctx.set(source_bridge.valid_i, 0)
-    await ctx.tick().repeat(2)
+    addrs = []
+    seqs = []
+    for _ in range(20):
+        await ctx.tick()
+
+        if ctx.get(bridge.bus_o.valid):
+            addrs.append(ctx.get(bridge.bus_o.addr))
+
+        if ctx.get(bridge.seq_valid_o):
+            seqs.append(ctx.get(bridge.seq_o))
+
+    assert addrs == [0xB0100, 0xB0101]
+    assert seqs == [0x800B_0100]
+
+    # The word after the header holds the upper bits of every address
+    words = [0x0002_0001, 0x0000_0003, 0x0002_FFFE, 0x0001_0010]
+    transactions, seqs = await send_packet(ctx, words, bridge)
+    assert transactions == [
+        (0x3FFFE, 0, 0, 0),
+        (0x3FFFF, 0, 0, 0),
+        (0x30010, 0, 0, 1),
+    ]
+    assert seqs == [0x0001]
+
+    words = [0x0001_0002, 0x0000_000A, 0x1234_0010]
+    transactions, seqs = await send_packet(ctx, words, bridge)
+    assert transactions == [(0xA0010, 0x1234, 1, 1)]
+    assert seqs == [0x0002]
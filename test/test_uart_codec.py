@@ -0,0 +1,156 @@
+from random import getrandbits, randint
+
+import pytest
+
+from manta.uart.codec import *
+
+
+@pytest.mark.parametrize("protocol", ["ascii", "binary"])
+def test_read_requests_encoding(protocol):
+    addrs = [getrandbits(16) for _ in range(100)]
+    requests = encode_read_requests(addrs, protocol, stall_interval=16)
+
+    if protocol == "ascii":
+        expected = [f"R{a:04X}\r\n".encode("ascii") for a in addrs]
+
+    else:
+        expected = [b"R" + a.to_bytes(2, "big") for a in addrs]
+
+    expected = [b"".join(c) for c in split_into_chunks(expected, 16)]
+    assert requests == b"\n".join(expected)
+
+
+@pytest.mark.parametrize("protocol", ["ascii", "binary"])
+def test_read_requests_padding(protocol):
+    # Each request is padded to the length of its response on wide busses
+    addrs = [getrandbits(16) for _ in range(10)]
+    requests = encode_read_requests(addrs, protocol, None, data_width=32)
+
+    if protocol == "ascii":
+        expected = [f"R{a:04X}\r\n\n\n\n\n".encode("ascii") for a in addrs]
+
+    else:
+        expected = [b"R" + a.to_bytes(2, "big") + b"\n\n" for a in addrs]
+
+    assert requests == b"".join(expected)
+
+
+@pytest.mark.parametrize("protocol", ["ascii", "binary"])
+def test_write_requests_encoding(protocol):
+    addrs = [getrandbits(16) for _ in range(100)]
+    datas = [getrandbits(16) for _ in range(100)]
+    requests = encode_write_requests(addrs, datas, protocol)
+
+    if protocol == "ascii":
+        expected = [
+            f"W{a:04X}{d:04X}\r\n".encode("ascii") for a, d in zip(addrs, datas)
+        ]
+
+    else:
+        expected = [
+            b"W" + a.to_bytes(2, "big") + d.to_bytes(2, "big")
+            for a, d in zip(addrs, datas)
+        ]
+
+    assert requests == b"".join(expected)
+
+
+def test_encoding_out_of_range():
+    with pytest.raises(ValueError, match="must fit in 16 bits"):
+        encode_read_requests([0x10000], "ascii", stall_interval=16)
+
+    with pytest.raises(ValueError, match="must fit in 16 bits"):
+        encode_write_requests([0], [-1], "binary")
+
+
+def test_page_request_encoding():
+    assert encode_page_request(0x00AB, "ascii") == b"P00AB\r\n"
+    assert encode_page_request(0x00AB, "binary") == b"P\x00\xab"
+
+
+@pytest.mark.parametrize("protocol", ["ascii", "binary"])
+def test_read_responses_decoding(protocol):
+    datas = [getrandbits(16) for _ in range(100)]
+
+    if protocol == "ascii":
+        responses = [f"D{d:04X}\r\n".encode("ascii") for d in datas]
+
+    else:
+        responses = [b"D" + d.to_bytes(2, "big") for d in datas]
+
+    assert decode_read_responses(b"".join(responses), protocol) == datas
+    assert [decode_read_response(r, protocol) for r in responses] == datas
+    assert decode_read_responses(b"", protocol) == []
+
+
+@pytest.mark.parametrize(
+    "response, error",
+    [
+        (b"X1234\r\n", "incorrect preamble"),
+        (b"D12G4\r\n", "invalid data byte"),
+        (b"D12a4\r\n", "invalid data byte"),
+        (b"D1234\n\n", "incorrect EOL"),
+        (b"D1234\r\r", "incorrect EOL"),
+        (b"D1234\r", "wrong number of bytes received"),
+    ],
+)
+def test_malformed_ascii_responses(response, error):
+    # Errors from the bulk decoder should match those for a single response,
+    # and report the first malformed response in the buffer
+    good = b"D0000\r\n" * randint(0, 10)
+    bad = b"DFFFF\n\n"
+
+    buffers = [response, good + response]
+    if len(response) == 7:
+        buffers.append(good + response + bad)
+
+    for responses in buffers:
+        with pytest.raises(ValueError, match=error):
+            decode_read_responses(responses, "ascii")
+
+    with pytest.raises(ValueError, match=error):
+        decode_read_response(response, "ascii")
+
+
+def test_malformed_binary_responses():
+    with pytest.raises(ValueError, match="incorrect preamble"):
+        decode_read_responses(b"D\x00\x00X\x12\x34", "binary")
+
+    with pytest.raises(ValueError, match="wrong number of bytes received"):
+        decode_read_responses(b"D\x00\x00D\x12", "binary")
+
+
+@pytest.mark.parametrize("protocol", ["ascii", "binary"])
+@pytest.mark.parametrize("data_width", [32, 64])
+def test_wide_data(protocol, data_width):
+    addrs = [getrandbits(16) for _ in range(100)]
+    datas = [getrandbits(data_width) for _ in range(100)]
+    requests = encode_write_requests(addrs, datas, protocol, data_width)
+    burst = encode_burst_write_request(addrs[0], datas, protocol, data_width)
+
+    if protocol == "ascii":
+        n_digits = data_width // 4
+        expected = [f"W{a:04X}{d:0{n_digits}X}\r\n" for a, d in zip(addrs, datas)]
+        expected_burst = f"w{addrs[0]:04X}0064"
+        expected_burst += "".join(f"{d:0{n_digits}X}" for d in datas) + "\r\n"
+        responses = [f"D{d:0{n_digits}X}\r\n".encode("ascii") for d in datas]
+        assert requests == "".join(expected).encode("ascii")
+        assert burst == expected_burst.encode("ascii")
+
+    else:
+        n_bytes = data_width // 8
+        expected = [
+            b"W" + a.to_bytes(2, "big") + d.to_bytes(n_bytes, "big")
+            for a, d in zip(addrs, datas)
+        ]
+        expected_burst = b"w" + addrs[0].to_bytes(2, "big") + b"\x00\x64"
+        expected_burst += b"".join(d.to_bytes(n_bytes, "big") for d in datas)
+        responses = [b"D" + d.to_bytes(n_bytes, "big") for d in datas]
+        assert requests == b"".join(expected)
+        assert burst == expected_burst
+
+    assert response_length(protocol, data_width) == len(responses[0])
+    assert decode_read_responses(b"".join(responses), protocol, data_width) == datas
+
+    with pytest.raises(ValueError, match=f"must fit in {data_width} bits"):
+        encode_write_requests([0], [2**data_width], protocol, data_width)
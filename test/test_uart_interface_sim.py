@@ -0,0 +1,453 @@
+import os
+import threading
+from random import getrandbits
+
+import pytest
+import yaml
+from amaranth import *
+from fake_fpga import (
+    FakeBaudControl,
+    check_paged_bus,
+    check_wide_bus,
+    uart_manta,
+    uart_port,
+)
+
+from manta import *
+from manta.cli import calibrate
+from manta.uart import BaudControl
+from manta.uart.codec import *
+from manta.utils import *
+
+
+class UARTLoopback(Elaboratable):
+    """
+    A UART interface whose bus is looped back to itself, with reads returning
+    the bitwise inverse of the address read from.
+    """
+
+    def __init__(self, **kwargs):
+        config = dict(port="/dev/null", baudrate=3e6, clock_freq=12e6)
+        config.update(kwargs)
+        self.uart = UARTInterface(**config)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.uart = uart = self.uart
+
+        m.d.sync += uart.bus_i.eq(uart.bus_o)
+        with m.If(~uart.bus_o.rw):
+            m.d.sync += uart.bus_i.data.eq(~uart.bus_o.addr)
+
+        return m
+
+
+loopback = UARTLoopback(rtscts=True)
+loopback_binary = UARTLoopback(protocol="binary", rtscts=True)
+loopback_fifos = UARTLoopback(rx_fifo_depth=32, tx_fifo_depth=32)
+loopback_overflow = UARTLoopback(rx_fifo_depth=4, tx_fifo_depth=8)
+loopback_wide = UARTLoopback()
+loopback_wide.uart.bus_width = 32
+loopback_wide_binary = UARTLoopback(protocol="binary")
+loopback_wide_binary.uart.bus_width = 64
+loopback_baud = UARTLoopback(
+    baudrate=50e3, clock_freq=400e3, programmable_baudrate=True
+)
+
+
+async def send_bytes(ctx, uart, bytes_out):
+    # 8N1 serial, LSB sent first
+    for byte in bytes_out:
+        bits = [0] + [(byte >> i) & 1 for i in range(8)] + [1]
+
+        for bit in bits:
+            ctx.set(uart.rx, bit)
+            await ctx.tick().repeat(uart._clocks_per_baud)
+
+
+async def receive_bytes(ctx, uart, n_bytes, timeout=10000):
+    bytes_in = []
+
+    for _ in range(timeout):
+        if len(bytes_in) == n_bytes:
+            return bytes(bytes_in)
+
+        # Wait for start bit, and sample in the middle of each bit
+        if ctx.get(uart.tx) == 0:
+            await ctx.tick().repeat(uart._clocks_per_baud // 2)
+
+            byte = 0
+            for i in range(8):
+                await ctx.tick().repeat(uart._clocks_per_baud)
+                byte |= ctx.get(uart.tx) << i
+
+            await ctx.tick().repeat(uart._clocks_per_baud)
+            bytes_in.append(byte)
+
+        await ctx.tick()
+
+    raise ValueError(f"Only received {len(bytes_in)} out of {n_bytes} bytes.")
+
+
+async def transfer(
+    ctx, uart, bytes_out, n_bytes_in, clocks_per_baud=None, timeout=100000
+):
+    """
+    Send bytes to the UART interface while receiving bytes from it, and return
+    the received bytes once everything's been sent and `n_bytes_in` bytes have
+    been received. The number of clocks per baud may be fractional, in which
+    case each bit starts on the clock cycle nearest to when it should.
+    """
+    cpb = clocks_per_baud or uart._clocks_per_baud
+
+    # 8N1 serial, LSB sent first, after the line has idled high
+    bits_out = [1, 1]
+    for byte in bytes_out:
+        bits_out += [0] + [(byte >> i) & 1 for i in range(8)] + [1]
+
+    bytes_in = []
+    start_cycle = None
+    n_bits = 0
+    byte_in = 0
+
+    for cycle in range(timeout):
+        bit_index = int(cycle / cpb)
+        if bit_index >= len(bits_out) and len(bytes_in) == n_bytes_in:
+            return bytes(bytes_in)
+
+        ctx.set(uart.rx, bits_out[bit_index] if bit_index < len(bits_out) else 1)
+
+        # Wait for start bit, and sample in the middle of each bit
+        if start_cycle is None:
+            if ctx.get(uart.tx) == 0:
+                start_cycle = cycle
+                n_bits = 0
+                byte_in = 0
+
+        elif cycle == start_cycle + round((n_bits + 1.5) * cpb):
+            if n_bits < 8:
+                byte_in |= ctx.get(uart.tx) << n_bits
+                n_bits += 1
+
+            else:
+                bytes_in.append(byte_in)
+                start_cycle = None
+
+        await ctx.tick()
+
+    raise ValueError(f"Only received {len(bytes_in)} out of {n_bytes_in} bytes.")
+
+
+async def verify_flow_control(ctx, uart, protocol):
+    ctx.set(uart.rx, 1)
+    await ctx.tick().repeat(10)
+
+    # Hold off transmission, and send more read requests than can be
+    # responded to while the host isn't ready. Only the first is completed, so
+    # the rest fill the receive buffer past its threshold.
+    ctx.set(uart.rts, 1)
+    if protocol == "ascii":
+        addrs = [0x1234, 0x0000, 0xBEEF]
+
+    else:
+        addrs = [0x1234, 0x0000, 0xBEEF, 0x00FF, 0x5A5A]
+
+    await send_bytes(ctx, uart, encode_read_requests(addrs, protocol, None))
+
+    for _ in range(100):
+        if ctx.get(uart.tx) != 1:
+            raise ValueError("Transmitted while RTS was deasserted!")
+
+        await ctx.tick()
+
+    if not ctx.get(uart.cts):
+        raise ValueError("CTS not deasserted while receive buffer is filling up!")
+
+    # Let the responses through, and check none were dropped
+    ctx.set(uart.rts, 0)
+    length = message_length(protocol) * len(addrs)
+    bytes_in = await receive_bytes(ctx, uart, length)
+
+    expected = [a ^ 0xFFFF for a in addrs]
+    if decode_read_responses(bytes_in, protocol) != expected:
+        raise ValueError(f"Got {bytes_in} in response to reads of {addrs}.")
+
+    if ctx.get(uart.cts):
+        raise ValueError("CTS not reasserted after receive buffer emptied!")
+
+
+@simulate(loopback)
+async def test_flow_control(ctx):
+    await verify_flow_control(ctx, loopback.uart, "ascii")
+
+
+@simulate(loopback_binary)
+async def test_flow_control_binary(ctx):
+    await verify_flow_control(ctx, loopback_binary.uart, "binary")
+
+
+@simulate(loopback_fifos)
+async def test_fifos(ctx):
+    # Send read requests back-to-back, with no stall bytes
+    uart = loopback_fifos.uart
+    addrs = list(range(0, 0xFFFF, 0x0F0F))
+    bytes_out = encode_read_requests(addrs, "ascii", None)
+    bytes_in = await transfer(ctx, uart, bytes_out, 7 * len(addrs))
+
+    expected = [a ^ 0xFFFF for a in addrs]
+    if decode_read_responses(bytes_in, "ascii") != expected:
+        raise ValueError(f"Got {bytes_in} in response to reads of {addrs}.")
+
+
+async def verify_wide_reads(ctx, uart):
+    # Read responses on a wide bus are longer than read requests, so the
+    # requests must be spaced out for every response to be sent
+    addrs = list(range(0x10, 0x200, 0x20))
+    bytes_out = uart._encode_read_transfer(addrs, [])
+    length = response_length(uart._protocol, uart.bus_width)
+    bytes_in = await transfer(ctx, uart, bytes_out, length * len(addrs))
+
+    expected = [a ^ 0xFFFF for a in addrs]
+    datas = decode_read_responses(bytes_in, uart._protocol, uart.bus_width)
+    if datas != expected:
+        raise ValueError(f"Got {datas} in response to reads of {addrs}.")
+
+
+@simulate(loopback_wide)
+async def test_wide_reads(ctx):
+    await verify_wide_reads(ctx, loopback_wide.uart)
+
+
+@simulate(loopback_wide_binary)
+async def test_wide_reads_binary(ctx):
+    await verify_wide_reads(ctx, loopback_wide_binary.uart)
+
+
+@simulate(loopback_overflow)
+async def test_overflow_counters(ctx):
+    # Bytes received while the FPGA responds to a burst read wait in the
+    # receive FIFO, and any that don't fit are dropped
+    uart = loopback_overflow.uart
+    bytes_out = encode_burst_read_request(0x10, 8, "ascii") + b"\n" * 20
+    await transfer(ctx, uart, bytes_out, 7 * 8)
+
+    # Pulse the strobe register and read back the counters
+    base_addr = uart.base_addr
+    bytes_out = encode_write_requests([base_addr] * 3, [0, 1, 0], "ascii")
+    bytes_out += encode_read_requests([base_addr + 1, base_addr + 2], "ascii", None)
+    bytes_in = await transfer(ctx, uart, bytes_out, 7 * 2)
+
+    rx_overflows, tx_overflows = decode_read_responses(bytes_in, "ascii")
+    if (rx_overflows, tx_overflows) != (17, 0):
+        raise ValueError(f"Got {rx_overflows} RX and {tx_overflows} TX overflows.")
+
+
+async def switch_divider(ctx, uart, clocks_per_baud, new_clocks_per_baud):
+    base_addr = uart.base_addr
+    divider = int(new_clocks_per_baud * 2**16)
+    datas = [divider & 0xFFFF, divider >> 16, BaudControl.SWITCH]
+    bytes_out = encode_burst_write_request(base_addr, datas, "ascii")
+    await transfer(ctx, uart, bytes_out, 0, clocks_per_baud)
+
+    # Wait for the line to idle long enough for the switch to be made
+    await ctx.tick().repeat(round(30 * clocks_per_baud))
+
+
+async def verify_divider(ctx, uart, clocks_per_baud, confirm=False):
+    # Optionally confirm the switch, then pulse the strobe register and read
+    # back the current divider
+    registers = uart._registers
+    bytes_out = b""
+    if confirm:
+        bytes_out += encode_write_requests(
+            [uart.base_addr + 2], [BaudControl.CONFIRM], "ascii"
+        )
+
+    strobe_addr = registers.base_addr
+    bytes_out += encode_write_requests([strobe_addr] * 3, [0, 1, 0], "ascii")
+
+    addrs = registers._memory_map["clocks_per_baud"]["addrs"]
+    bytes_out += encode_read_requests(addrs, "ascii", None)
+    bytes_in = await transfer(ctx, uart, bytes_out, 7 * len(addrs), clocks_per_baud)
+
+    divider = words_to_value(decode_read_responses(bytes_in, "ascii"))
+    if divider != int(clocks_per_baud * 2**16):
+        raise ValueError(f"Divider is {divider / 2**16} instead of {clocks_per_baud}.")
+
+
+@simulate(loopback_baud)
+async def test_baudrate_switch(ctx):
+    uart = loopback_baud.uart
+    await verify_divider(ctx, uart, 8)
+
+    # Switch to a fractional divider, and confirm the switch
+    await switch_divider(ctx, uart, 8, 5.5)
+    await verify_divider(ctx, uart, 5.5, confirm=True)
+
+    # The FPGA should stay at the new divider after the timeout
+    await ctx.tick().repeat(int(400e3 * uart._BAUD_SWITCH_TIMEOUT) + 100)
+    await verify_divider(ctx, uart, 5.5)
+
+    # Switch without confirming, and check the FPGA reverts after the timeout
+    await switch_divider(ctx, uart, 5.5, 6.25)
+    await ctx.tick().repeat(int(400e3 * uart._BAUD_SWITCH_TIMEOUT) + 100)
+    await verify_divider(ctx, uart, 5.5)
+
+
+def test_registers_address_space():
+    uart = UARTInterface(
+        port="/dev/null", baudrate=3e6, clock_freq=12e6, rx_fifo_depth=16
+    )
+
+    if uart.base_addr != 0xFFFD:
+        raise ValueError(f"Registers placed at {uart.base_addr} instead of 0xFFFD.")
+
+    manta = Manta()
+    manta.interface = uart
+    with pytest.raises(ValueError, match="Ran out of address space"):
+        manta.cores.mem = MemoryCore("fpga_to_host", width=16, depth=0xFFFE)
+
+    manta = Manta()
+    manta.cores.mem = MemoryCore("fpga_to_host", width=16, depth=0xFFFE)
+    with pytest.raises(ValueError, match="Ran out of address space"):
+        manta.interface = uart
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudoterminal")
+@pytest.mark.parametrize("bus_width", [32, 64])
+def test_wide_bus(bus_width):
+    check_wide_bus(uart_manta(bus_width))
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudoterminal")
+def test_paged_bus():
+    check_paged_bus(uart_manta(bus_addr_width=20))
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudoterminal")
+def test_calibrate():
+    fpga_kwargs = dict(max_chunk=16, max_stall_interval=4)
+    uart = uart_manta(fpga_kwargs=fpga_kwargs).interface
+
+    # The largest chunk size and stall interval that work should be found, and
+    # used for later reads
+    assert uart.calibrate(max_chunk_size=64) == (16, 4)
+    assert (uart._chunk_size, uart._stall_interval) == (16, 4)
+    assert uart.read(list(range(0, 200, 2))) == [0] * 100
+
+    # Stall bytes aren't sent with flow control, so only the chunk size is
+    # calibrated
+    uart = uart_manta(fpga_kwargs=dict(max_chunk=8), rtscts=True).interface
+    assert uart.calibrate(max_chunk_size=64) == (8, None)
+    assert uart._stall_interval == 16
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudoterminal")
+def test_calibrate_cli(tmp_path):
+    config_path = tmp_path / "manta.yaml"
+    config = {
+        "cores": {"io": {"type": "io", "inputs": {"probe": 4}}},
+        "uart": {
+            "port": uart_port(max_chunk=32, max_stall_interval=8),
+            "stall_interval": 16,
+            "baudrate": 115200,
+            "clock_freq": 12000000,
+        },
+    }
+
+    with open(config_path, "w") as f:
+        yaml.dump(config, f, sort_keys=False)
+
+    calibrate(str(config_path))
+
+    # Only the calibrated options should change, and the rest should stay in
+    # the order they were written in
+    with open(config_path, "r") as f:
+        calibrated = yaml.safe_load(f)
+
+    config["uart"].update(chunk_size=32, stall_interval=8)
+    assert calibrated == config
+    assert list(calibrated) == ["cores", "uart"]
+    assert list(calibrated["uart"]) == list(config["uart"])
+    assert Manta.from_config(str(config_path)).interface._chunk_size == 32
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudoterminal")
+def test_pipelined_reads():
+    uart = uart_manta(chunk_size=16, chunks_in_flight=4).interface
+    n_threads = threading.active_count()
+
+    # Reads spanning many more chunks than can be in flight at once
+    addrs = list(range(0, 1000, 2))
+    datas = [getrandbits(16) for _ in addrs]
+    uart.write(addrs, datas)
+    assert uart.read(addrs) == datas
+    assert uart.read(addrs[::-1]) == datas[::-1]
+    assert threading.active_count() == n_threads
+
+    # The thread draining the serial port should stop once responses stop
+    # arriving partway through a read
+    fpga_kwargs = dict(max_chunk=8)
+    uart = uart_manta(fpga_kwargs=fpga_kwargs, chunk_size=16, chunks_in_flight=4)
+    uart = uart.interface
+    uart._get_serial_device().timeout = 0.1
+    n_threads = threading.active_count()
+
+    with pytest.raises(ValueError, match="Only got"):
+        uart.read(addrs)
+
+    assert threading.active_count() == n_threads
+
+
+def programmable_uart(**kwargs):
+    uart = UARTInterface(
+        port="auto",
+        baudrate=115200,
+        clock_freq=12e6,
+        chunk_size=16,
+        programmable_baudrate=True,
+    )
+    baud_control = FakeBaudControl(uart, **kwargs)
+    uart._port = uart_port(baud_control=baud_control)
+    uart._get_serial_device().timeout = 0.1
+    return uart, baud_control
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudoterminal")
+def test_set_baudrate():
+    uart, baud_control = programmable_uart(rejected=[921600])
+    addrs = list(range(0, 64, 2))
+
+    uart.set_baudrate(460800)
+    assert uart._get_serial_device().baudrate == 460800
+    assert baud_control.baudrate == 460800
+    assert uart.read(addrs) == [0] * len(addrs)
+
+    # Both the host and the FPGA should return to the previous baudrate if
+    # the switch can't be confirmed
+    with pytest.raises(ValueError, match="Unable to communicate with FPGA at 921600"):
+        uart.set_baudrate(921600)
+
+    assert uart._get_serial_device().baudrate == 460800
+    assert baud_control.baudrate == 460800
+    assert uart.read(addrs) == [0] * len(addrs)
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudoterminal")
+def test_negotiate_baudrate():
+    baudrates = [230400, 460800, 921600, 2000000]
+
+    # Baudrates that can't be switched to, or that can't be read from
+    # reliably, should leave the link at the previous baudrate
+    uart, baud_control = programmable_uart(rejected=[921600])
+    assert uart.negotiate_baudrate(baudrates) == 460800
+    assert baud_control.baudrate == 460800
+
+    uart, baud_control = programmable_uart(unreliable=[460800])
+    assert uart.negotiate_baudrate(baudrates) == 230400
+    assert baud_control.baudrate == 230400
+
+    # Unless the previous baudrate can't be returned to
+    uart, baud_control = programmable_uart(unreliable=[230400], rejected=[115200])
+    with pytest.raises(ValueError, match="Lost the link to the FPGA"):
+        uart.negotiate_baudrate(baudrates)
@@ -56,3 +56,33 @@ async def test_bytes_random_sample(ctx):
 
     for i in jumble(range(0xFF)):
         await verify_receive(ctx, i)
+
+
+uart_rx_programmable = UARTReceiver(clocks_per_baud=10, programmable=True)
+
+
+@simulate(uart_rx_programmable)
+async def test_fractional_divider(ctx):
+    # Receive bytes sent at 10.25 clocks per baud, with each bit starting on
+    # the clock cycle nearest to when it should
+    clocks_per_baud = 10.25
+    ctx.set(uart_rx_programmable.divider_i, int(clocks_per_baud * 2**16))
+    ctx.set(uart_rx_programmable.rx, 1)
+    await ctx.tick()
+
+    for byte in jumble(range(0xFF)):
+        # 8N1 serial, LSB sent first
+        data_bits = [0] + [(byte >> i) & 1 for i in range(8)] + [1]
+        received = []
+
+        for cycle in range(round(10 * clocks_per_baud)):
+            bit_index = min(int(cycle / clocks_per_baud), 9)
+            ctx.set(uart_rx_programmable.rx, data_bits[bit_index])
+
+            if ctx.get(uart_rx_programmable.valid_o):
+                received.append(ctx.get(uart_rx_programmable.data_o))
+
+            await ctx.tick()
+
+        if received != [byte]:
+            raise ValueError(f"Received {received} instead of {byte}!")
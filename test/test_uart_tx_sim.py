@@ -48,3 +48,42 @@ async def test_all_possible_bytes(ctx):
 async def test_bytes_random_sample(ctx):
     for i in jumble(range(0xFF)):
         await verify_bit_sequence(ctx, i)
+
+
+uart_tx_programmable = UARTTransmitter(clocks_per_baud=10, programmable=True)
+
+
+@simulate(uart_tx_programmable)
+async def test_fractional_divider(ctx):
+    # With 10.25 clocks per baud, every bit should last 10 or 11 clock cycles,
+    # with the edges between them staying within a cycle of where they should be
+    clocks_per_baud = 10.25
+    ctx.set(uart_tx_programmable.divider_i, int(clocks_per_baud * 2**16))
+
+    for byte in [0x55, 0xAA, 0x00, 0xFF]:
+        ctx.set(uart_tx_programmable.data_i, byte)
+        ctx.set(uart_tx_programmable.start_i, 1)
+        await ctx.tick()
+        ctx.set(uart_tx_programmable.start_i, 0)
+
+        # 8N1 serial, LSB sent first
+        data_bits = [0] + [(byte >> i) & 1 for i in range(8)] + [1]
+
+        cycle = 0
+        while not ctx.get(uart_tx_programmable.done_o):
+            bit_index = int(cycle / clocks_per_baud)
+            expected = data_bits[min(bit_index, 9)]
+
+            # Allow a cycle of slack on either side of each edge
+            near_edge = abs(cycle - round(bit_index * clocks_per_baud)) <= 1
+            near_edge |= abs(cycle - round((bit_index + 1) * clocks_per_baud)) <= 1
+
+            if ctx.get(uart_tx_programmable.tx) != expected and not near_edge:
+                raise ValueError(f"Wrong bit at cycle {cycle} of byte {byte:02X}!")
+
+            cycle += 1
+            await ctx.tick()
+
+        # Done is asserted on the last cycle of the stop bit
+        if abs(cycle - 10 * clocks_per_baud) > 2:
+            raise ValueError(f"Byte took {cycle} cycles to transmit!")